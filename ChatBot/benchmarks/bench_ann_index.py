@@ -0,0 +1,132 @@
+"""Compara los tipos de índice FAISS (flat, ivf, hnsw, ivfpq) sobre corpus sintéticos.
+
+Para cada tamaño de corpus se generan embeddings agrupados en temas (centros
+aleatorios más ruido, normalizados) y preguntas cercanas a fragmentos del
+corpus. Para cada índice se mide, pregunta a pregunta como en el servidor:
+
+- la latencia de la búsqueda de `fetch_k` candidatos y la de la recuperación
+  MMR completa (búsqueda + reconstrucción de candidatos + MMR), en p50/p95/p99;
+- el recall@fetch_k de los candidatos frente al índice plano (búsqueda exacta)
+  y el solapamiento de los `k` documentos elegidos por MMR con los del plano.
+
+Uso (desde ChatBot/scripts):
+
+    python ../benchmarks/bench_ann_index.py --sizes 10000 100000 1000000 --dim 1536
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from ann_index import INDEX_TYPES, build_ann_index, positional_index, set_search_params
+
+
+def synthetic_corpus(size: int, dim: int, topics: int, seed: int):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, topics, size)] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_queries(corpus, count: int, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    queries = corpus[rng.integers(0, len(corpus), count)] + 0.02 * rng.standard_normal((count, corpus.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+def run_queries(index, queries, k: int, fetch_k: int, lambda_mult: float):
+    search_latencies = []
+    mmr_latencies = []
+    candidates = []
+    selected = []
+    for query in queries:
+        query = query[None, :]
+        start = time.perf_counter()
+        _, indices = index.search(query, fetch_k)
+        search_latencies.append(time.perf_counter() - start)
+        found = [int(i) for i in indices[0] if i != -1]
+        vectors = [index.reconstruct(i) for i in found]
+        chosen = maximal_marginal_relevance(query, vectors, k=k, lambda_mult=lambda_mult)
+        mmr_latencies.append(time.perf_counter() - start)
+        candidates.append(set(found))
+        selected.append({found[i] for i in chosen})
+    return search_latencies, mmr_latencies, candidates, selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384, help="dimensión de los embeddings (1536 para ada-002)")
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 128])
+    parser.add_argument("--pq-m", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        corpus = synthetic_corpus(size, args.dim, topics=max(10, size // 500), seed=args.seed)
+        queries = make_queries(corpus, args.queries, args.seed)
+        reference = None
+        for index_type in ["flat"] + [t for t in args.index_types if t != "flat"]:
+            params = {"pq_m": args.pq_m} if args.pq_m and index_type == "ivfpq" else {}
+            start = time.perf_counter()
+            # El servidor carga la copia posicional que publica la ingesta (ver native_index.py)
+            index, _ = positional_index(build_ann_index(corpus, index_type, **params))
+            build_seconds = time.perf_counter() - start
+            index_bytes = len(faiss.serialize_index(index))
+
+            if index_type in ("ivf", "ivfpq"):
+                settings = [{"nprobe": value} for value in args.nprobe]
+            elif index_type == "hnsw":
+                settings = [{"ef_search": value} for value in args.ef_search]
+            else:
+                settings = [{}]
+
+            for setting in settings:
+                set_search_params(index, **setting)
+                search, mmr, candidates, selected = run_queries(index, queries, args.k, args.fetch_k, args.lambda_mult)
+                if reference is None:
+                    reference = (candidates, selected)
+                result = {
+                    "corpus_chunks": size,
+                    "dim": args.dim,
+                    "index_type": index_type,
+                    **setting,
+                    "build_seconds": round(build_seconds, 2),
+                    "index_mb": round(index_bytes / 2 ** 20, 1),
+                    "search": percentiles(search),
+                    "mmr_retrieval": percentiles(mmr),
+                    f"recall@{args.fetch_k}": round(float(np.mean(
+                        [len(c & r) / len(r) for c, r in zip(candidates, reference[0])])), 3),
+                    f"mmr_overlap@{args.k}": round(float(np.mean(
+                        [len(s & r) / len(r) for s, r in zip(selected, reference[1])])), 3),
+                }
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+            del index
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
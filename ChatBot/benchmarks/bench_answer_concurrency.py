@@ -0,0 +1,120 @@
+"""Benchmark de carga para /answer con los modelos simulados.
+
+Sustituye la obtención de la respuesta (cached_answer) y el cliente TTS de
+OpenAI por stubs con latencia configurable, de modo que solo se mide el
+servidor: el bucle de eventos, las llamadas a ffmpeg y el manejo de ficheros.
+Para medir el servidor completo contra un OpenAI simulado, usa
+run_benchmarks.py.
+
+Uso (desde ChatBot/scripts, para que se resuelvan faiss_index y .env):
+
+    python ../benchmarks/bench_answer_concurrency.py --requests 128
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import httpx
+
+import server_Chatbot
+from answer_cache import CacheEntry
+
+
+def _silent_mp3(seconds: float) -> bytes:
+    """Genera un MP3 de silencio para simular la respuesta del TTS."""
+    return subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono",
+         "-t", str(seconds), "-f", "mp3", "pipe:1"],
+        check=True, capture_output=True,
+    ).stdout
+
+
+class _FakeSpeechResponse:
+    def __init__(self, content: bytes):
+        self.content = content
+
+
+class _FakeSpeech:
+    def __init__(self, audio: bytes, latency: float):
+        self.audio = audio
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _FakeSpeechResponse(self.audio)
+
+
+class _FakeAudio:
+    def __init__(self, speech):
+        self.speech = speech
+
+
+class _FakeAsyncOpenAI:
+    def __init__(self, audio: bytes, latency: float):
+        self.audio = _FakeAudio(_FakeSpeech(audio, latency))
+
+
+def install_stubs(llm_latency: float, tts_latency: float, audio_seconds: float):
+    async def fake_cached_answer(inputs):
+        # Condensación + recuperación + respuesta; cada pregunta tiene su respuesta
+        # para que la síntesis no se comparta entre peticiones simultáneas
+        await asyncio.sleep(llm_latency)
+        return CacheEntry(inputs["question"], None, f"{inputs['question']} Alvearium es una empresa que combina tecnología y experiencias inmersivas.")
+
+    server_Chatbot.cached_answer = fake_cached_answer
+    server_Chatbot.async_client = _FakeAsyncOpenAI(_silent_mp3(audio_seconds), tts_latency)
+
+
+async def run_level(concurrency: int, total: int) -> dict:
+    transport = httpx.ASGITransport(app=server_Chatbot.app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                response = await http.post("/answer", json={"text": f"¿Qué es Alvearium? {i}"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="segundos por respuesta de la cadena")
+    parser.add_argument("--tts-latency", type=float, default=0.4, help="segundos por llamada TTS")
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    install_stubs(args.llm_latency, args.tts_latency, args.audio_seconds)
+    results = [asyncio.run(run_level(c, max(args.requests, c))) for c in args.concurrency]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
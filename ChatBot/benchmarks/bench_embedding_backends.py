@@ -0,0 +1,100 @@
+"""Compara los backends de embeddings: latencia por pregunta y recall@k sobre TXT_UTF8.
+
+Las preguntas se generan a partir del propio corpus: para cada fragmento de la
+muestra se toma una ventana de palabras de su interior como consulta, y se
+considera acierto que ese fragmento aparezca entre los k más parecidos
+(búsqueda exacta por producto escalar, igual para todos los backends).
+Los embeddings se piden sin la caché en disco para medir el backend real.
+
+Uso (desde ChatBot/scripts; "openai" necesita OPENAI_API_KEY en .env):
+
+    python ../benchmarks/bench_embedding_backends.py --backends openai local --queries 100
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from data_preprocessor import CHUNK_SIZE, CHUNK_OVERLAP
+from embedding_backends import create_embeddings, embedding_model_name
+from extract_apis_keys import load
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "TXT_UTF8")
+
+
+def load_chunks(directory: str):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(directory, filename), "r", encoding="utf-8", errors="ignore") as f:
+                chunks.extend(splitter.split_text(f.read()))
+    return [chunk for chunk in chunks if len(chunk.split()) >= 12]
+
+
+def make_queries(chunks, count: int, words: int, seed: int):
+    rng = random.Random(seed)
+    sample = rng.sample(range(len(chunks)), min(count, len(chunks)))
+    queries = []
+    for index in sample:
+        tokens = chunks[index].split()
+        start = rng.randrange(0, max(len(tokens) - words, 1))
+        queries.append((index, " ".join(tokens[start:start + words])))
+    return queries
+
+
+def evaluate(backend: str, api_key: str, chunks, queries, ks):
+    embeddings = create_embeddings(api_key=api_key, backend=backend, cached=False, batch_window_ms=0)
+    start = time.perf_counter()
+    matrix = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    index_seconds = time.perf_counter() - start
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    latencies = []
+    hits = {k: 0 for k in ks}
+    for relevant, query in queries:
+        start = time.perf_counter()
+        vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        latencies.append(time.perf_counter() - start)
+        ranking = np.argsort(-(matrix @ (vector / np.linalg.norm(vector))))
+        for k in ks:
+            hits[k] += int(relevant in ranking[:k])
+
+    latencies.sort()
+    return {
+        "backend": backend,
+        "model": embedding_model_name(embeddings),
+        "corpus_chunks": len(chunks),
+        "corpus_embed_seconds": round(index_seconds, 2),
+        "query_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "query_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        **{f"recall@{k}": round(hits[k] / len(queries), 3) for k in ks},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"])
+    parser.add_argument("--corpus", default=CORPUS_DIRECTORY)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 4, 10])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.corpus)
+    queries = make_queries(chunks, args.queries, args.query_words, args.seed)
+    api_key = load()[1]
+    results = [evaluate(backend, api_key, chunks, queries, args.k) for backend in args.backends]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Mide el micro-batching de embeddings con visitantes simultáneos contra el servidor simulado.
+
+Varios clientes concurrentes piden el embedding de una pregunta cada uno, como
+la etapa `embed` de /answer (sin caché en disco). Una parte de las preguntas
+son repetidas (las más populares durante un evento) y el resto distintas.
+Se compara el cliente directo de OpenAI con BatchedEmbeddings para cada
+ventana de batching y se mide:
+
+- latencia por pregunta (p50/p95/p99) y preguntas por segundo;
+- llamadas a la API y textos enviados (según el servidor simulado), y
+  preguntas resueltas por coalescencia.
+
+Uso (desde ChatBot/scripts; necesita uvicorn):
+
+    python ../benchmarks/bench_embedding_batching.py --concurrency 8 32 64 --windows 2 5 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+from embedding_backends import BatchedEmbeddings, OPENAI_EMBEDDING_MODEL
+from metrics import stage_metrics
+from mock_openai import add_mock_arguments, configure, run_mock_server
+
+POPULAR_QUESTIONS = [
+    "¿Qué es Alvearium?",
+    "¿Dónde está la oficina de Alvearium?",
+    "¿Qué servicios ofrece Alvearium?",
+    "¿Cómo puedo contactar con Alvearium?",
+    "¿Qué es alvea?",
+]
+
+
+class ListEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings que envía cada lote en una sola llamada con los textos tal cual.
+
+    La clase original tokeniza antes con tiktoken, que descarga su vocabulario la
+    primera vez; con --tiktoken se usa la clase original.
+    """
+
+    async def aembed_documents(self, texts, chunk_size=0):
+        response = await self.async_client.create(input=texts, **self._invocation_params)
+        return [item.embedding for item in response.data]
+
+
+def make_questions(count: int, duplicate_ratio: float, seed: int):
+    rng = random.Random(seed)
+    return [
+        rng.choice(POPULAR_QUESTIONS) if rng.random() < duplicate_ratio else f"Pregunta número {i} sobre el proyecto {rng.randrange(10**6)}"
+        for i in range(count)
+    ]
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)}
+
+
+async def run_scenario(embeddings, questions, concurrency: int):
+    queue = asyncio.Queue()
+    for question in questions:
+        queue.put_nowait(question)
+    latencies = []
+
+    async def visitor():
+        while not queue.empty():
+            question = queue.get_nowait()
+            start = time.perf_counter()
+            await embeddings.aembed_query(question)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(visitor() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def main_async(args, base_url: str):
+    results = []
+    async with httpx.AsyncClient() as admin:
+        for concurrency in args.concurrency:
+            questions = make_questions(args.requests, args.duplicate_ratio, args.seed)
+            for window in [0.0] + args.windows:
+                client_class = OpenAIEmbeddings if args.tiktoken else ListEmbeddings
+                client = client_class(api_key="mock", base_url=base_url, model=OPENAI_EMBEDDING_MODEL)
+                embeddings = BatchedEmbeddings(client, window_ms=window, max_size=args.max_batch) if window > 0 else client
+                await embeddings.aembed_query("calentamiento")
+                await admin.delete(f"{base_url.rsplit('/v1', 1)[0]}/mock/stats")
+                stage_metrics.counters.clear()
+
+                latencies, seconds = await run_scenario(embeddings, questions, concurrency)
+                upstream = (await admin.get(f"{base_url.rsplit('/v1', 1)[0]}/mock/stats")).json()
+                result = {
+                    "concurrency": concurrency,
+                    "batching": window > 0,
+                    "window_ms": window,
+                    "requests": len(latencies),
+                    "questions_per_s": round(len(latencies) / seconds, 1),
+                    "latency": percentiles(latencies),
+                    "api_calls": upstream.get("embedding_calls", 0),
+                    "api_inputs": upstream.get("embedding_inputs", 0),
+                    "coalesced": stage_metrics.counters.get("embed_coalesced", 0),
+                }
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--windows", type=float, nargs="+", default=[2.0, 5.0, 10.0], help="ventanas de batching en ms")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3, help="fracción de preguntas populares repetidas")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tiktoken", action="store_true", help="usar OpenAIEmbeddings sin modificar (tokeniza con tiktoken)")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    with run_mock_server(args.port) as base_url:
+        results = asyncio.run(main_async(args, base_url))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Mide el arranque en frío del servidor: importación, liveness, readiness y primeras peticiones.
+
+Cada repetición se ejecuta en un intérprete nuevo (como un contenedor recién
+creado) que importa server_Chatbot, arranca la aplicación con su lifespan y,
+mediante httpx sobre ASGI (sin red), mide:
+
+- `import_s`: tiempo de `import server_Chatbot`;
+- `live_s` / `ready_s`: desde el inicio del lifespan hasta que /health/live
+  y /health/ready responden 200 (ready = embeddings e índice cargados);
+- `first_request_s` / `second_request_s`: latencia de dos peticiones /invoke
+  seguidas (la primera paga lo que quede por inicializar).
+
+Las peticiones /invoke llaman al modelo configurado; para medir solo el
+servidor, apunta OPENAI_BASE_URL a un servidor simulado o usa --no-request.
+
+Uso (desde ChatBot/scripts, para que se resuelvan el índice y .env):
+
+    python ../benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+SCRIPTS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+
+async def _measure_app(server, question: str, send_request: bool, timeout: float) -> dict:
+    import httpx
+
+    result = {}
+    transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+    start = time.perf_counter()
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            for probe in ("live", "ready"):
+                while (await http.get(f"/health/{probe}")).status_code != 200:
+                    if time.perf_counter() - start > timeout:
+                        result["error"] = f"/health/{probe} no respondió en {timeout} s"
+                        return result
+                    await asyncio.sleep(0.01)
+                result[f"{probe}_s"] = time.perf_counter() - start
+
+            if send_request:
+                payload = {"input": {"question": question, "chat_history": []}}
+                for name in ("first_request_s", "second_request_s"):
+                    request_start = time.perf_counter()
+                    response = await http.post("/invoke", json=payload)
+                    result[name] = time.perf_counter() - request_start
+                    if response.status_code != 200:
+                        result["error"] = f"/invoke devolvió {response.status_code}"
+                        break
+    return result
+
+
+def child(args) -> None:
+    """Una repetición: se ejecuta en un proceso nuevo y escribe su resultado en JSON."""
+    sys.path.insert(0, SCRIPTS_DIRECTORY)
+    start = time.perf_counter()
+    import server_Chatbot
+    result = {"import_s": time.perf_counter() - start}
+    result.update(asyncio.run(_measure_app(server_Chatbot, args.question, not args.no_request, args.timeout)))
+    print(json.dumps(result))
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "p50": round(values[len(values) // 2], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--question", default="¿Qué es Alvearium?")
+    parser.add_argument("--no-request", action="store_true", help="medir solo importación y readiness")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    runs = []
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--question", args.question, "--timeout", str(args.timeout)]
+    if args.no_request:
+        command.append("--no-request")
+    for _ in range(args.runs):
+        # El índice y .env se resuelven respecto al directorio actual, como en el servidor
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            runs.append({"error": completed.stderr.strip().splitlines()[-1]})
+            continue
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    metrics = sorted({key for run in runs for key in run if key.endswith("_s")})
+    report = {
+        "runs": len(runs),
+        "errors": [run["error"] for run in runs if "error" in run],
+        **{metric: summarize([run[metric] for run in runs if metric in run]) for metric in metrics},
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Micro-benchmark del post-procesado del audio TTS por respuesta.
+
+Compara el camino anterior (re-codificar el MP3 con libmp3lame a disco, segundo
+ffmpeg de MP3 a WAV, releer el WAV y pasarlo a base64) con el actual (guardar el
+MP3 tal cual llega del TTS y generar el WAV con un único ffmpeg en tubería solo
+cuando se pide). Mide tiempo de pared y CPU (proceso + hijos) por respuesta.
+
+Uso (desde ChatBot/scripts):
+
+    python ../benchmarks/bench_tts_transcode.py --runs 20 --audio-seconds 12
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import transcoder
+from audio_store import AudioStore
+
+
+def _tts_like_mp3(seconds: float) -> bytes:
+    """MP3 mono a 24 kHz, como el que devuelve tts-1."""
+    return subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=220:sample_rate=24000",
+         "-t", str(seconds), "-ac", "1", "-f", "mp3", "pipe:1"],
+        check=True, capture_output=True,
+    ).stdout
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def legacy(audio: bytes, directory: str) -> None:
+    mp3_file_path = os.path.join(directory, "respuesta.mp3")
+    mp3_subprocess = subprocess.Popen(["ffmpeg", "-loglevel", "error", "-y", "-i", "pipe:0", "-codec:a", "libmp3lame", mp3_file_path], stdin=subprocess.PIPE)
+    mp3_subprocess.communicate(input=audio)
+    mp3_subprocess.wait()
+    wav_file_path = mp3_file_path.replace(".mp3", ".wav")
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-i", mp3_file_path, "-acodec", "pcm_s16le", "-ar", "44100", "-ac", "2", wav_file_path], check=True)
+    with open(wav_file_path, "rb") as audio_file:
+        audio_content = audio_file.read()
+    base64.b64encode(audio_content).decode("utf-8")
+
+
+def current(audio: bytes, store: AudioStore, with_wav: bool) -> None:
+    audio_id = store.put(audio, transcoder.SOURCE_FORMAT)
+    if with_wav:
+        asyncio.run(transcoder.materialize(store, f"{audio_id}.wav"))
+
+
+def measure(func, runs: int) -> dict:
+    wall = []
+    cpu = []
+    for _ in range(runs):
+        cpu_start = _cpu_seconds()
+        start = time.perf_counter()
+        func()
+        wall.append(time.perf_counter() - start)
+        cpu.append(_cpu_seconds() - cpu_start)
+    return {
+        "wall_ms_mean": round(sum(wall) / runs * 1000, 2),
+        "cpu_ms_mean": round(sum(cpu) / runs * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--audio-seconds", type=float, default=12.0)
+    args = parser.parse_args()
+
+    audio = _tts_like_mp3(args.audio_seconds)
+    with tempfile.TemporaryDirectory() as directory:
+        store = AudioStore(directory)
+        results = {
+            "audio_bytes": len(audio),
+            "legacy_double_transcode": measure(lambda: legacy(audio, directory), args.runs),
+            "current_mp3_only": measure(lambda: current(audio, store, with_wav=False), args.runs),
+            "current_with_lazy_wav": measure(lambda: current(audio, store, with_wav=True), args.runs),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Servidor simulado compatible con la API de OpenAI para los benchmarks.
+
+Endpoints, todos con latencia configurable:
+
+- /v1/embeddings: vectores deterministas (derivados del texto), con un coste
+  fijo por llamada más un coste por texto, como la API real, donde un lote de N
+  textos tarda mucho menos que N llamadas;
+- /v1/chat/completions: una respuesta fija de `--chat-tokens` tokens, en
+  streaming (SSE) o completa, con latencia hasta el primer token y entre tokens;
+- /v1/audio/speech: el MP3 de fixtures/answer.mp3 enviado por fragmentos;
+- /v1/audio/transcriptions: la misma pregunta numerada en cada llamada (para
+  que la caché semántica no la conteste), con latencia proporcional al tamaño
+  del audio.
+
+Cuenta las llamadas y los textos recibidos; /mock/stats los devuelve y
+DELETE /mock/stats los pone a cero.
+
+Uso independiente (OPENAI_BASE_URL=http://127.0.0.1:8099/v1 en el servidor):
+
+    python ../benchmarks/mock_openai.py --port 8099 --embedding-latency-ms 40
+
+Desde un benchmark: `with run_mock_server(port) as base_url: ...`.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+EMBEDDING_DIM = 1536
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ANSWER_WORDS = (
+    "Alvearium es una empresa que combina tecnología, sostenibilidad y experiencias inmersivas "
+    "para acercar el mundo de las abejas a las personas. "
+).split()
+TRANSCRIPTION = "¿Qué es Alvearium y qué actividades organiza?"
+
+
+class MockSettings:
+    embedding_latency = 0.040
+    embedding_latency_per_input = 0.0005
+    chat_first_token_latency = 0.300
+    chat_token_interval = 0.020
+    chat_tokens = 60
+    tts_first_byte_latency = 0.250
+    tts_chunk_interval = 0.010
+    tts_chunk_bytes = 4096
+    stt_latency = 0.300
+    stt_latency_per_mb = 0.500
+
+
+settings = MockSettings()
+stats = Counter()
+_transcriptions = itertools.count(1)
+app = FastAPI()
+
+
+def _vector(text: str, dim: int = EMBEDDING_DIM):
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _answer_tokens():
+    return [
+        ANSWER_WORDS[i % len(ANSWER_WORDS)] + ("" if i == settings.chat_tokens - 1 else " ")
+        for i in range(settings.chat_tokens)
+    ]
+
+
+def _answer_audio() -> bytes:
+    with open(os.path.join(FIXTURES_DIRECTORY, "answer.mp3"), "rb") as f:
+        return f.read()
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    stats["embedding_calls"] += 1
+    stats["embedding_inputs"] += len(inputs)
+    await asyncio.sleep(settings.embedding_latency + settings.embedding_latency_per_input * len(inputs))
+    return {
+        "object": "list",
+        "model": body.get("model", "text-embedding-ada-002"),
+        "data": [{"object": "embedding", "index": i, "embedding": _vector(str(text))} for i, text in enumerate(inputs)],
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o")
+    prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+    tokens = _answer_tokens()
+    stats["chat_calls"] += 1
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(settings.chat_first_token_latency + settings.chat_token_interval * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)},
+        }
+
+    def event(delta: dict, finish_reason=None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    async def stream():
+        await asyncio.sleep(settings.chat_first_token_latency)
+        yield event({"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(settings.chat_token_interval)
+            yield event({"content": token})
+        yield event({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    stats["tts_calls"] += 1
+    stats["tts_characters"] += len(body.get("input", ""))
+    audio = _answer_audio()
+
+    async def stream():
+        await asyncio.sleep(settings.tts_first_byte_latency)
+        for start in range(0, len(audio), settings.tts_chunk_bytes):
+            if start:
+                await asyncio.sleep(settings.tts_chunk_interval)
+            yield audio[start:start + settings.tts_chunk_bytes]
+
+    return StreamingResponse(stream(), media_type="audio/mpeg")
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(file: UploadFile = File(...), response_format: str = Form("json")):
+    audio = await file.read()
+    stats["stt_calls"] += 1
+    stats["stt_bytes"] += len(audio)
+    await asyncio.sleep(settings.stt_latency + settings.stt_latency_per_mb * len(audio) / 2 ** 20)
+    text = f"{TRANSCRIPTION} ({next(_transcriptions)})"
+    if response_format == "text":
+        return PlainTextResponse(text)
+    return {"text": text}
+
+
+@app.get("/mock/stats")
+async def get_stats():
+    return dict(stats)
+
+
+@app.delete("/mock/stats")
+async def reset_stats():
+    stats.clear()
+    return {}
+
+
+@contextmanager
+def run_mock_server(port: int = 8099, host: str = "127.0.0.1"):
+    """Arranca el servidor simulado en un hilo y devuelve su URL base (…/v1)."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://{host}:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--embedding-latency-ms", type=float, default=40.0, help="latencia fija por llamada de embeddings")
+    parser.add_argument("--embedding-latency-per-input-ms", type=float, default=0.5, help="latencia por texto del lote")
+    parser.add_argument("--chat-first-token-ms", type=float, default=300.0, help="latencia hasta el primer token")
+    parser.add_argument("--chat-token-interval-ms", type=float, default=20.0, help="intervalo entre tokens")
+    parser.add_argument("--chat-tokens", type=int, default=60, help="tokens de cada respuesta")
+    parser.add_argument("--tts-first-byte-ms", type=float, default=250.0, help="latencia hasta el primer fragmento de audio")
+    parser.add_argument("--tts-chunk-interval-ms", type=float, default=10.0, help="intervalo entre fragmentos de audio")
+    parser.add_argument("--stt-latency-ms", type=float, default=300.0, help="latencia fija de cada transcripción")
+    parser.add_argument("--stt-latency-per-mb-ms", type=float, default=500.0, help="latencia por MB de audio")
+
+
+def configure(args) -> None:
+    settings.embedding_latency = args.embedding_latency_ms / 1000
+    settings.embedding_latency_per_input = args.embedding_latency_per_input_ms / 1000
+    settings.chat_first_token_latency = args.chat_first_token_ms / 1000
+    settings.chat_token_interval = args.chat_token_interval_ms / 1000
+    settings.chat_tokens = args.chat_tokens
+    settings.tts_first_byte_latency = args.tts_first_byte_ms / 1000
+    settings.tts_chunk_interval = args.tts_chunk_interval_ms / 1000
+    settings.stt_latency = args.stt_latency_ms / 1000
+    settings.stt_latency_per_mb = args.stt_latency_per_mb_ms / 1000
+
+
+def mock_arguments(args) -> list:
+    """Los argumentos de latencia de `args` como línea de órdenes, para arrancar el servidor en otro proceso."""
+    command = []
+    for action in _mock_parser()._actions:
+        if action.dest != "help":
+            command += [action.option_strings[0], str(getattr(args, action.dest))]
+    return command
+
+
+def _mock_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+    add_mock_arguments(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
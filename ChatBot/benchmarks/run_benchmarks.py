@@ -0,0 +1,430 @@
+"""Benchmark de extremo a extremo del servidor contra un OpenAI simulado, sin red ni claves.
+
+Arranca mock_openai.py y el servidor (uvicorn) en procesos aparte, con
+OPENAI_BASE_URL apuntando al simulado y una caché de embeddings temporal, y
+lanza carga concurrente sobre cada escenario:
+
+- `ingest`: data_preprocessor.py sobre un corpus sintético (`--documents`
+  textos); el índice que construye es el que carga el servidor después;
+- `answer`: POST /answer (respuesta completa más TTS);
+- `speech_to_text`: POST /speech_to_text con fixtures/question.mp3;
+- `invoke`, `batch`, `stream`: las rutas de langserve (`stream` mide también
+  el tiempo hasta el primer token);
+- `converse`: POST /converse de voz a voz (mide también el primer audio);
+- `smalltalk`: POST /answer con una fracción (`--smalltalk-ratio`) de saludos
+  y charla trivial; separa las latencias de cada tipo y guarda la parte del
+  tráfico que el router de intenciones contestó sin la cadena RAG.
+
+Cada pregunta es distinta para que la caché semántica no conteste por el
+modelo. Por escenario se guardan latencias p50/p95/p99, peticiones por
+segundo, errores, llamadas recibidas por el simulado y memoria del servidor
+(RSS medio y máximo); de la ingesta, su duración y su memoria máxima. El
+resultado, en JSON, incluye el commit para comparar ejecuciones con --compare.
+
+Uso (desde ChatBot/scripts; necesita uvicorn y el fichero .env, cuya clave no
+llega a salir de la máquina):
+
+    python ../benchmarks/run_benchmarks.py --output results.json
+    python ../benchmarks/run_benchmarks.py --scenarios answer stream --compare results.json
+
+Sin el escenario `ingest` se usa el índice nativo de --index-directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIRECTORY = os.path.join(os.path.dirname(BENCHMARKS_DIRECTORY), "scripts")
+FIXTURES_DIRECTORY = os.path.join(BENCHMARKS_DIRECTORY, "fixtures")
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+
+import httpx
+import numpy as np
+
+from mock_openai import add_mock_arguments, mock_arguments
+
+SCENARIOS = ["ingest", "answer", "speech_to_text", "invoke", "batch", "stream", "converse", "smalltalk"]
+# Métricas que compara --compare (las de latencia, menor es mejor)
+COMPARED_METRICS = ["p50_ms", "p95_ms", "p99_ms", "first_event_p50_ms", "first_event_p95_ms", "requests_per_s", "rss_max_mb", "seconds", "max_rss_mb"]
+
+SMALL_TALK = ["Hola", "¡Hola! ¿Quién eres?", "Hola, ¿cómo estás?", "Muchas gracias", "Adiós", "Hello, who are you?", "Thank you!"]
+TOPICS = ["las abejas", "la miel", "la polinización", "las colmenas", "la apicultura urbana", "la realidad virtual"]
+
+
+def percentiles(samples, prefix: str = "") -> dict:
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    return {f"{prefix}p{p}_ms": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)}
+
+
+def git_commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BENCHMARKS_DIRECTORY, capture_output=True, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def wait_until(url: str, timeout: float, process: subprocess.Popen) -> float:
+    """Espera a que `url` responda 200; devuelve los segundos transcurridos."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"El proceso terminó antes de estar listo (código {process.returncode})")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"{url} no respondió en {timeout} s")
+
+
+def stop(process: subprocess.Popen) -> None:
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def question(scenario: str, i: int) -> str:
+    return f"¿Qué relación hay entre Alvearium y {TOPICS[i % len(TOPICS)]}? ({scenario} {i} {uuid.uuid4().hex[:8]})"
+
+
+def write_corpus(directory: str, documents: int) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for d in range(documents):
+        paragraphs = [
+            f"Documento {d}, sección {s}. Alvearium organiza talleres sobre {TOPICS[(d + s) % len(TOPICS)]} "
+            f"en colegios y empresas. Cada taller dura {s + 1} horas e incluye una visita virtual a la colmena {d}-{s}. "
+            "Las abejas son esenciales para la biodiversidad y la producción de alimentos."
+            for s in range(8)
+        ]
+        with open(os.path.join(directory, f"documento_{d:04d}.txt"), "w", encoding="latin-1") as f:
+            f.write("\n\n".join(paragraphs))
+
+
+def run_ingest(args, workdir: str, env: dict, mock_url: str) -> dict:
+    """Ejecuta data_preprocessor.py en un directorio temporal y mide duración y memoria máxima."""
+    ingest_directory = os.path.join(workdir, "ingest")
+    write_corpus(os.path.join(ingest_directory, "TXT_no_UTF8"), args.documents)
+    os.makedirs(os.path.join(ingest_directory, "TXT_UTF8"), exist_ok=True)
+    httpx.delete(f"{mock_url}/mock/stats")
+
+    log_path = os.path.join(workdir, "ingest.log")
+    start = time.perf_counter()
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(SCRIPTS_DIRECTORY, "data_preprocessor.py"), "--full"],
+            cwd=ingest_directory, env=env, stdout=subprocess.DEVNULL, stderr=log,
+        )
+        # wait4 devuelve el uso de recursos del hijo: ru_maxrss en KB en Linux
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        stderr = f.read()
+
+    upstream = httpx.get(f"{mock_url}/mock/stats").json()
+    result = {
+        "documents": args.documents,
+        "seconds": round(seconds, 3),
+        "max_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "api_calls": upstream.get("embedding_calls", 0),
+        "api_inputs": upstream.get("embedding_inputs", 0),
+    }
+    if process.returncode != 0:
+        # Desde la línea de la excepción hasta el final (nltk, por ejemplo, explica el error en varias líneas)
+        lines = [line.strip() for line in stderr.splitlines() if line.strip(" *")]
+        start = max((i for i, line in enumerate(lines) if re.match(r"[\w.]+(Error|Exception)\b", line)), default=len(lines) - 1)
+        result["error"] = " ".join(lines[start:])[:500] or f"código {process.returncode}"
+    else:
+        result["index_directory"] = os.path.join(ingest_directory, "faiss_native")
+        result["chunks_per_s"] = round(upstream.get("embedding_inputs", 0) / seconds, 1)
+    return result
+
+
+class MemorySampler:
+    """Muestrea el RSS del servidor mientras dura un escenario."""
+
+    def __init__(self, pid: int, interval: float = 0.05) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+
+    async def run(self) -> None:
+        while True:
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.samples.append(value)
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {}
+        return {"rss_mean_mb": round(sum(self.samples) / len(self.samples), 1), "rss_max_mb": round(max(self.samples), 1)}
+
+
+async def _answer(http, scenario, i, args):
+    response = await http.post("/answer", json={"text": question(scenario, i)})
+    response.raise_for_status()
+    # El audio se descarga como lo haría el cliente de VR
+    (await http.get(f"/audio_files/{response.json()['audio_id']}.mp3")).raise_for_status()
+
+
+async def _speech_to_text(http, scenario, i, args):
+    with open(os.path.join(FIXTURES_DIRECTORY, "question.mp3"), "rb") as f:
+        audio = f.read()
+    response = await http.post("/speech_to_text", files={"file": ("question.mp3", audio, "audio/mpeg")})
+    response.raise_for_status()
+
+
+async def _invoke(http, scenario, i, args):
+    response = await http.post("/invoke", json={"input": {"question": question(scenario, i), "chat_history": []}})
+    response.raise_for_status()
+
+
+async def _batch(http, scenario, i, args):
+    inputs = [{"question": question(scenario, i * args.batch_size + j), "chat_history": []} for j in range(args.batch_size)]
+    response = await http.post("/batch", json={"inputs": inputs})
+    response.raise_for_status()
+
+
+async def _stream(http, scenario, i, args):
+    """Devuelve los segundos hasta el primer evento con datos de la respuesta."""
+    start = time.perf_counter()
+    first_event = None
+    payload = {"input": {"question": question(scenario, i), "chat_history": []}}
+    async with http.stream("POST", "/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_event is None and line.startswith("event: data"):
+                first_event = time.perf_counter() - start
+    return first_event
+
+
+async def _converse(http, scenario, i, args):
+    """Devuelve los segundos hasta el primer fragmento de audio de la respuesta."""
+    with open(os.path.join(FIXTURES_DIRECTORY, "question.mp3"), "rb") as f:
+        audio = f.read()
+    start = time.perf_counter()
+    first_event = None
+    async with http.stream("POST", "/converse", files={"file": ("question.mp3", audio, "audio/mpeg")}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "error":
+                raise RuntimeError(event.get("detail"))
+            if first_event is None and event["type"] == "audio":
+                first_event = time.perf_counter() - start
+    return first_event
+
+
+async def _smalltalk(http, scenario, i, args):
+    """Devuelve el tipo de pregunta, para separar las latencias."""
+    small_talk = (i * 7919 % 1000) / 1000 < args.smalltalk_ratio
+    text = SMALL_TALK[i % len(SMALL_TALK)] if small_talk else question(scenario, i)
+    response = await http.post("/answer", json={"text": text})
+    response.raise_for_status()
+    (await http.get(f"/audio_files/{response.json()['audio_id']}.mp3")).raise_for_status()
+    return "smalltalk" if small_talk else "knowledge"
+
+
+REQUESTS = {
+    "answer": _answer,
+    "speech_to_text": _speech_to_text,
+    "invoke": _invoke,
+    "batch": _batch,
+    "stream": _stream,
+    "converse": _converse,
+    "smalltalk": _smalltalk,
+}
+
+
+async def run_scenario(scenario: str, args, server_url: str, mock_url: str, server_pid: int) -> dict:
+    request = REQUESTS[scenario]
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+    latencies, first_events, errors = [], [], []
+    by_kind = {}
+
+    async with httpx.AsyncClient(base_url=server_url, timeout=args.request_timeout) as http:
+        await http.delete(f"{mock_url}/mock/stats")
+        router_before = (await http.get("/intent_router/stats")).json() if scenario == "smalltalk" else None
+
+        async def visitor():
+            while not queue.empty():
+                i = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    first_event = await request(http, scenario, i, args)
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if isinstance(first_event, str):
+                    by_kind.setdefault(first_event, []).append(latencies[-1])
+                elif first_event is not None:
+                    first_events.append(first_event)
+
+        sampler = MemorySampler(server_pid)
+        sampling = asyncio.create_task(sampler.run())
+        start = time.perf_counter()
+        await asyncio.gather(*(visitor() for _ in range(args.concurrency)))
+        seconds = time.perf_counter() - start
+        sampling.cancel()
+        upstream = (await http.get(f"{mock_url}/mock/stats")).json()
+        router_after = (await http.get("/intent_router/stats")).json() if scenario == "smalltalk" else None
+
+    result = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "completed": len(latencies),
+        "errors": len(errors),
+        "seconds": round(seconds, 3),
+        "requests_per_s": round(len(latencies) / seconds, 2),
+        **percentiles(latencies),
+        **percentiles(first_events, prefix="first_event_"),
+        **sampler.summary(),
+        "upstream": upstream,
+    }
+    if scenario == "batch":
+        result["batch_size"] = args.batch_size
+    if by_kind:
+        result["latency_by_kind"] = {kind: {"requests": len(samples), **percentiles(samples)} for kind, samples in by_kind.items()}
+    if router_after is not None:
+        questions = router_after["questions"] - router_before["questions"]
+        routed = router_after["short_circuited"] - router_before["short_circuited"]
+        result["short_circuit_share"] = round(routed / questions, 3) if questions else 0.0
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def compare(previous: dict, current: dict) -> list:
+    """Diferencias por escenario entre dos resultados (en % respecto al anterior)."""
+    rows = []
+    for scenario, result in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(scenario)
+        if not before:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric in result and before.get(metric):
+                change = (result[metric] - before[metric]) / before[metric] * 100
+                rows.append({"scenario": scenario, "metric": metric, "before": before[metric],
+                             "after": result[metric], "change_pct": round(change, 1)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=64, help="peticiones por escenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="clientes simultáneos")
+    parser.add_argument("--batch-size", type=int, default=4, help="preguntas por petición en el escenario batch")
+    parser.add_argument("--smalltalk-ratio", type=float, default=0.4, help="fracción de charla trivial en el escenario smalltalk")
+    parser.add_argument("--documents", type=int, default=200, help="textos del corpus sintético de la ingesta")
+    parser.add_argument("--index-directory", default=os.path.join(SCRIPTS_DIRECTORY, "faiss_native"),
+                        help="índice nativo del servidor si no se ejecuta la ingesta")
+    parser.add_argument("--server-port", type=int, default=8765)
+    parser.add_argument("--port", type=int, default=8099, help="puerto del servidor simulado")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="fichero JSON donde guardar el resultado")
+    parser.add_argument("--compare", help="resultado anterior (JSON) con el que comparar")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.port}"
+    server_url = f"http://127.0.0.1:{args.server_port}"
+    results = {
+        **git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="chatbot-bench-") as workdir:
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{mock_url}/v1",
+            "EMBEDDING_CACHE_DIRECTORY": os.path.join(workdir, "embedding_cache"),
+            "INDEX_WATCH_SECONDS": "0",
+        }
+        mock = subprocess.Popen(
+            [sys.executable, os.path.join(BENCHMARKS_DIRECTORY, "mock_openai.py"), "--port", str(args.port), *mock_arguments(args)],
+        )
+        server = None
+        try:
+            wait_until(f"{mock_url}/mock/stats", 30, mock)
+            index_directory = os.path.abspath(args.index_directory)
+
+            if "ingest" in args.scenarios:
+                print("Escenario ingest...", file=sys.stderr)
+                ingest = run_ingest(args, workdir, env, mock_url)
+                index_directory = ingest.pop("index_directory", index_directory)
+                results["scenarios"]["ingest"] = ingest
+                print(json.dumps(ingest), file=sys.stderr)
+
+            served = [scenario for scenario in args.scenarios if scenario != "ingest"]
+            if served:
+                server_directory = os.path.join(workdir, "server")
+                os.makedirs(server_directory)
+                server = subprocess.Popen(
+                    [sys.executable, "-m", "uvicorn", "--app-dir", SCRIPTS_DIRECTORY, "server_Chatbot:app",
+                     "--host", "127.0.0.1", "--port", str(args.server_port), "--log-level", "warning"],
+                    cwd=server_directory, env={**env, "NATIVE_INDEX_DIRECTORY": index_directory},
+                )
+                results["startup_s"] = round(wait_until(f"{server_url}/health/ready", args.startup_timeout, server), 3)
+                results["idle_rss_mb"] = rss_mb(server.pid)
+
+            for scenario in served:
+                print(f"Escenario {scenario}...", file=sys.stderr)
+                result = asyncio.run(run_scenario(scenario, args, server_url, mock_url, server.pid))
+                results["scenarios"][scenario] = result
+                print(json.dumps(result), file=sys.stderr)
+        finally:
+            if server is not None:
+                stop(server)
+            stop(mock)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        results["comparison"] = {"commit": previous.get("commit"), "changes": compare(previous, results)}
+        for row in results["comparison"]["changes"]:
+            print(f"{row['scenario']:>15} {row['metric']:>20} {row['before']:>10} -> {row['after']:>10} ({row['change_pct']:+.1f} %)",
+                  file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import math
+import numpy as np
+import faiss
+
+# Tipos de índice que puede construir la ingesta:
+#   flat  - búsqueda exacta (IndexFlatL2, lo que produce FAISS.from_documents)
+#   ivf   - particiones IVF con vectores completos; en búsqueda se recorren `nprobe` listas
+#   hnsw  - grafo HNSW con vectores completos; en búsqueda se exploran `efSearch` candidatos
+#   ivfpq - particiones IVF con vectores comprimidos por Product Quantization (menos memoria)
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+DEFAULT_HNSW_M = 32
+DEFAULT_HNSW_EF_CONSTRUCTION = 200
+DEFAULT_PQ_M = 64
+PQ_BITS = 8
+
+# Puntos de entrenamiento mínimos por centroide que recomienda FAISS
+_MIN_POINTS_PER_CENTROID = 39
+
+
+def default_nlist(count: int) -> int:
+    """Número de listas IVF: ~4·√n, limitado para que haya datos de entrenamiento suficientes."""
+    return max(1, min(int(4 * math.sqrt(count)), count // _MIN_POINTS_PER_CENTROID))
+
+
+def _unwrap(index):
+    # Los índices de la ingesta envuelven flat y hnsw en un IndexIDMap2 (ids estables por fragmento)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_type_of(index) -> str:
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return "flat"
+    return "ivfpq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf"
+
+
+def build_ann_index(vectors, index_type: str = "flat", labels=None, nlist: int = None, hnsw_m: int = DEFAULT_HNSW_M,
+                    ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION, pq_m: int = DEFAULT_PQ_M):
+    """Construye (y entrena, si hace falta) un índice FAISS con ids (métrica L2, como el de LangChain).
+
+    Cada vector se añade con su etiqueta de `labels` (por defecto, su posición),
+    que es la clave de `index_to_docstore_id`. El índice admite `add_with_ids` y
+    `remove_ids` por etiqueta, así que las actualizaciones incrementales no lo
+    reconstruyen: flat y hnsw van dentro de un IndexIDMap2 e ivf/ivfpq guardan
+    las etiquetas en sus listas (con un mapa directo por tabla hash para
+    reconstruir por etiqueta en la búsqueda MMR).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+    labels = np.arange(count, dtype=np.int64) if labels is None else np.asarray(labels, dtype=np.int64)
+    if index_type == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    elif index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        hnsw.hnsw.efConstruction = ef_construction
+        index = faiss.IndexIDMap2(hnsw)
+    elif index_type in ("ivf", "ivfpq"):
+        nlist = nlist or default_nlist(count)
+        if index_type == "ivf":
+            index = faiss.index_factory(dimension, f"IVF{nlist},Flat")
+        else:
+            if dimension % pq_m:
+                raise ValueError(f"pq_m={pq_m} debe dividir la dimensión de los embeddings ({dimension}).")
+            if count < 2 ** PQ_BITS:
+                raise ValueError(f"Se necesitan al menos {2 ** PQ_BITS} fragmentos para entrenar un índice ivfpq.")
+            index = faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}x{PQ_BITS}")
+        index.train(vectors)
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        raise ValueError(f"Tipo de índice no soportado: {index_type} (opciones: {', '.join(INDEX_TYPES)})")
+
+    if count:
+        index.add_with_ids(vectors, labels)
+    return index
+
+
+def with_ids(index):
+    """Índice equivalente que admite `add_with_ids`/`remove_ids` por etiqueta, sin reentrenar.
+
+    Los índices guardados antes de las etiquetas estables usan la posición como
+    etiqueta: ivf/ivfpq solo cambian de mapa directo, y flat/hnsw se copian a un
+    IndexIDMap2 con sus vectores exactos.
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return index
+    index_type = index_type_of(index)
+    if index_type in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    if index_type == "hnsw":
+        return build_ann_index(vectors, "hnsw", hnsw_m=index.hnsw.nb_neighbors(1), ef_construction=index.hnsw.efConstruction)
+    return build_ann_index(vectors, "flat")
+
+
+def update_vectors(index, remove_labels, vectors, labels):
+    """Quita y añade vectores por etiqueta sobre el índice existente; devuelve el índice resultante.
+
+    ivf e ivfpq no se reentrenan: los vectores nuevos se asignan con los centroides
+    y los códigos PQ ya entrenados (se reentrenan con --full, desde los embeddings
+    originales). HNSW no admite borrados: si los hay, se reconstruye el grafo con
+    los vectores exactos que guarda, sin entrenamiento ni pérdida.
+    """
+    remove_labels = np.asarray(remove_labels, dtype=np.int64)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, index.d)
+    labels = np.asarray(labels, dtype=np.int64)
+    if len(remove_labels) and index_type_of(index) == "hnsw":
+        hnsw = _unwrap(index)
+        current = faiss.vector_to_array(index.id_map)
+        keep = ~np.isin(current, remove_labels)
+        stored = hnsw.reconstruct_n(0, hnsw.ntotal)
+        index = build_ann_index(
+            np.vstack([stored[keep], vectors]), "hnsw", labels=np.concatenate([current[keep], labels]),
+            hnsw_m=hnsw.hnsw.nb_neighbors(1), ef_construction=hnsw.hnsw.efConstruction,
+        )
+        return index
+    if len(remove_labels):
+        index.remove_ids(remove_labels)
+    if len(labels):
+        index.add_with_ids(vectors, labels)
+    return index
+
+
+def positional_index(index):
+    """Copia del índice cuyas etiquetas son las posiciones 0..n-1; devuelve también la etiqueta original de cada posición.
+
+    Es lo que publica el formato nativo. No se reentrena ni se vuelve a codificar
+    nada: flat y hnsw se desenvuelven del IndexIDMap2 (su orden interno ya es
+    posicional) y en ivf/ivfpq se copian los códigos de cada lista con las
+    etiquetas renumeradas.
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        # Copia: el índice interno es del envoltorio y se libera con él
+        return faiss.clone_index(_unwrap(index)), faiss.vector_to_array(index.id_map)
+    if index_type_of(index) not in ("ivf", "ivfpq"):
+        return index, np.arange(index.ntotal, dtype=np.int64)
+
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    sizes = [invlists.list_size(list_no) for list_no in range(ivf.nlist)]
+    entries = [
+        faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy() if size else np.zeros(0, dtype=np.int64)
+        for list_no, size in enumerate(sizes)
+    ]
+    labels = np.sort(np.concatenate(entries)) if entries else np.zeros(0, dtype=np.int64)
+
+    copy = faiss.clone_index(index)
+    copy_ivf = faiss.extract_index_ivf(copy)
+    copy_ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    copy.reset()
+    for list_no, (size, ids) in enumerate(zip(sizes, entries)):
+        if not size:
+            continue
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+        positions = np.searchsorted(labels, ids).astype(np.int64)
+        copy_ivf.invlists.add_entries(list_no, size, faiss.swig_ptr(positions), faiss.swig_ptr(codes))
+    copy_ivf.ntotal = copy.ntotal = len(labels)
+    # La búsqueda MMR de LangChain reconstruye los vectores candidatos por posición
+    copy_ivf.make_direct_map()
+    return copy, labels
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None) -> None:
+    """Ajusta los parámetros de búsqueda del índice cargado; se ignoran los que no le aplican."""
+    index_type = index_type_of(index)
+    space = faiss.ParameterSpace()
+    if nprobe and index_type in ("ivf", "ivfpq"):
+        space.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search and index_type == "hnsw":
+        space.set_index_parameter(index, "efSearch", ef_search)
+
+
+def add_index_arguments(parser) -> None:
+    """Opciones de línea de comandos para elegir el tipo de índice en la ingesta."""
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                        help="tipo de índice FAISS (por defecto, el que ya tenga el índice o flat)")
+    parser.add_argument("--nlist", type=int, default=None, help="listas IVF (por defecto ~4·√n)")
+    parser.add_argument("--hnsw-m", type=int, default=None, help=f"vecinos por nodo HNSW (por defecto {DEFAULT_HNSW_M})")
+    parser.add_argument("--pq-m", type=int, default=None, help=f"subcuantizadores PQ (por defecto {DEFAULT_PQ_M})")
+
+
+def index_params_from_args(args) -> dict:
+    params = {"nlist": args.nlist, "hnsw_m": args.hnsw_m, "pq_m": args.pq_m}
+    return {name: value for name, value in params.items() if value is not None}
@@ -0,0 +1,134 @@
+import re
+import time
+from collections import OrderedDict
+from typing import FrozenSet, List, Optional
+import numpy as np
+from unidecode import unidecode
+
+# Palabras sin contenido que no cambian el sentido de la pregunta
+STOPWORDS = frozenset("""
+a al algo como con cual cuales cuando de del donde el en es esta este esto hay la las lo los me mi mis o para
+pero por que quien se ser si sobre son su sus te tu un una unas uno unos y ya
+an and are at be can do does for how i in is it me my of on or the to what when where which who why you your
+""".split())
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def content_words(question: str) -> FrozenSet[str]:
+    """Palabras con contenido de la pregunta, en minúsculas y sin acentos."""
+    return frozenset(word for word in _NON_WORD.sub(" ", unidecode(question).lower()).split() if word not in STOPWORDS)
+
+
+class CacheEntry:
+    """Respuesta almacenada para una pregunta independiente (standalone question)."""
+
+    def __init__(self, question: str, embedding: np.ndarray, answer: str) -> None:
+        self.question = question
+        self.words = content_words(question)
+        self.embedding = embedding
+        self.answer = answer
+        self.created_at = time.time()
+        # Identificador del audio pre-renderizado en el AudioStore, si lo hay
+        self.audio_id: Optional[str] = None
+
+
+class SemanticAnswerCache:
+    """Caché de respuestas por similitud del embedding de la pregunta independiente.
+
+    Una pregunta nueva reutiliza la respuesta de otra ya contestada si la similitud
+    coseno de sus embeddings supera `threshold` y, cuando se pasa la pregunta,
+    ambas tienen las mismas palabras con contenido. Las entradas caducan a los
+    `ttl_seconds` y, por encima de `max_entries`, se descartan las menos usadas (LRU).
+
+    El umbral por defecto (0.97) parte de cómo reparte ada-002 las similitudes:
+    están concentradas cerca de 1, y dos preguntas que solo cambian la entidad
+    ("¿a qué hora abre el lunes?" / "...el domingo?") superan 0.95. Por eso el
+    umbral se queda por encima y la comparación de palabras descarta las
+    coincidencias que el embedding no distingue. Con otro modelo de embeddings
+    hay que recalibrarlo (ANSWER_CACHE_THRESHOLD).
+    """
+
+    def __init__(self, threshold: float = 0.97, max_entries: int = 512, ttl_seconds: float = 6 * 3600) -> None:
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._next_key = 0
+        self._keys: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self) -> None:
+        deadline = time.time() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry.created_at < deadline]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, embedding, question: Optional[str] = None) -> Optional[CacheEntry]:
+        """Devuelve la entrada más parecida que supera el umbral (y coincide en palabras con `question`, si se pasa)."""
+        self._expire()
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        if self._matrix is None:
+            self._keys = list(self._entries.keys())
+            self._matrix = np.vstack([self._entries[key].embedding for key in self._keys])
+
+        similarities = self._matrix @ self._normalize(embedding)
+        words = content_words(question) if question is not None else None
+        for best in np.argsort(-similarities):
+            if similarities[best] < self.threshold:
+                break
+            key = self._keys[best]
+            if words is not None and self._entries[key].words != words:
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def add(self, question: str, embedding, answer: str, index_version: Optional[str] = None) -> CacheEntry:
+        """Guarda la respuesta, salvo que se generase con una versión del índice que ya no es la actual."""
+        entry = CacheEntry(question, self._normalize(embedding), answer)
+        if index_version is not None and index_version != self.index_version:
+            return entry
+        self._entries[self._next_key] = entry
+        self._next_key += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+
+    def set_index_version(self, version: str) -> None:
+        """Vacía la caché si las respuestas se generaron con otro índice de vectores."""
+        if version != self.index_version:
+            self.clear()
+            self.index_version = version
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "threshold": self.threshold,
+            "index_version": self.index_version,
+        }
@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import uuid
+import threading
+from typing import Iterator, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+# Tipos de contenido por extensión de los audios generados
+MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "pcm": "audio/L16",
+}
+
+_FILE_NAME_PATTERN = re.compile(r"^([0-9a-f]{32})\.([a-z0-9]+)$")
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Un .tmp más antiguo que esto es de una escritura interrumpida (ningún audio tarda tanto en escribirse)
+_STALE_TMP_SECONDS = 300
+# Tamaño de los trozos en los que se envía un audio
+_CHUNK_BYTES = 64 * 1024
+
+
+class AudioStore:
+    """Almacén de audios por respuesta, con claves UUID, caducidad (TTL) y tamaño máximo."""
+
+    def __init__(self, directory: str, ttl_seconds: float = 900, max_bytes: int = 500 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.sweep_temporary()
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def path(self, audio_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{audio_id}.{extension}")
+
+    def put(self, data: bytes, extension: str, audio_id: Optional[str] = None) -> str:
+        """Guarda el audio de forma atómica y devuelve su identificador."""
+        audio_id = audio_id or self.new_id()
+        final_path = self.path(audio_id, extension)
+        # Nombre único: dos escrituras simultáneas de la misma clave no comparten el temporal
+        tmp_path = f"{final_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, final_path)
+        return audio_id
+
+    def parse(self, file_name: str) -> Optional[Tuple[str, str]]:
+        """Devuelve (identificador, extensión) si el nombre corresponde a un audio del almacén."""
+        match = _FILE_NAME_PATTERN.match(file_name)
+        if not match or match.group(2) not in MEDIA_TYPES:
+            return None
+        return match.group(1), match.group(2)
+
+    def resolve(self, file_name: str) -> Optional[Tuple[str, str]]:
+        """Devuelve (ruta, tipo de contenido) para un nombre servido por la API, o None."""
+        parsed = self.parse(file_name)
+        if parsed is None:
+            return None
+        file_path = os.path.join(self.directory, file_name)
+        if not os.path.isfile(file_path):
+            return None
+        if time.time() - os.path.getmtime(file_path) > self.ttl_seconds:
+            return None
+        return file_path, MEDIA_TYPES[parsed[1]]
+
+    def sweep_temporary(self, max_age_seconds: float = _STALE_TMP_SECONDS) -> int:
+        """Elimina los .tmp que dejaron escrituras interrumpidas (al arrancar y en cada desalojo)."""
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith(".tmp"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > max_age_seconds:
+                    removed += self._remove(entry.path)
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def evict(self) -> int:
+        """Elimina los audios caducados y, si se supera el tamaño máximo, los más antiguos."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            removed = self.sweep_temporary()
+            for entry in os.scandir(self.directory):
+                if not entry.is_file() or not _FILE_NAME_PATTERN.match(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    removed += self._remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                removed += self._remove(path)
+                total -= size
+            return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+def _parse_range(range_header: str, size: int) -> Tuple[int, int]:
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        raise ValueError(range_header)
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        # Rango de sufijo: los últimos N bytes
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError(range_header)
+    return start, end
+
+
+def _read_chunks(f, length: int, chunk_size: int = _CHUNK_BYTES) -> Iterator[bytes]:
+    """Lee `length` bytes desde la posición actual de `f`, por trozos, y cierra el fichero al terminar."""
+    try:
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def range_response(file_path: str, media_type: str, range_header: Optional[str]) -> Response:
+    """Sirve un fichero completo o el rango de bytes pedido en la cabecera Range, leyéndolo por trozos.
+
+    El fichero se abre antes de responder, así que un desalojo durante el envío no lo corta.
+    """
+    f = open(file_path, "rb")
+    size = os.fstat(f.fileno()).st_size
+    headers = {"Accept-Ranges": "bytes"}
+    status_code = 200
+    start, end = 0, size - 1
+
+    if range_header:
+        try:
+            start, end = _parse_range(range_header, size)
+        except ValueError:
+            f.close()
+            raise HTTPException(status_code=416, detail="Rango no válido", headers={"Content-Range": f"bytes */{size}"})
+        f.seek(start)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        status_code = 206
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read_chunks(f, end - start + 1), status_code=status_code, media_type=media_type, headers=headers)
@@ -0,0 +1,120 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Set
+from metrics import stage_metrics
+
+
+class Coalescer:
+    """Agrupa las llamadas idénticas simultáneas en una sola.
+
+    Mientras una llamada con la misma clave está en curso, las siguientes
+    esperan su resultado en lugar de repetirla. La llamada se protege con
+    `asyncio.shield`: si un cliente se desconecta, el resto sigue esperando.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        task = self._inflight.get(key)
+        if task is not None:
+            stage_metrics.increment(f"{self.name}_coalesced")
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+class MicroBatcher:
+    """Junta las peticiones que llegan en una ventana de unos milisegundos en una sola llamada.
+
+    `process` recibe la lista de elementos del lote y devuelve sus resultados en
+    el mismo orden. La primera petición de un lote abre la ventana de `window`
+    segundos; el lote se envía al cerrarse la ventana o al llegar a `max_size`
+    elementos. Las peticiones con la misma clave mientras otra está pendiente o
+    en curso comparten su resultado (no se envían dos veces).
+
+    Contadores en stage_metrics: `<name>_requests`, `<name>_coalesced`,
+    `<name>_batches` y `<name>_batched` (elementos enviados); latencia de cada
+    llamada en la etapa `<name>_batch`.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List], Awaitable[List]],
+        window: float = 0.005,
+        max_size: int = 64,
+        name: str = "batch",
+    ) -> None:
+        self._process = process
+        self.window = window
+        self.max_size = max_size
+        self.name = name
+        self._loop = None
+        self._pending: Dict[Hashable, object] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # El bucle de eventos solo guarda una referencia débil a las tareas: sin esta, un lote
+        # en curso podría liberarse y sus futuros no se resolverían nunca
+        self._tasks: Set[asyncio.Task] = set()
+        self._timer = None
+
+    async def submit(self, key: Hashable, item):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Un bucle de eventos nuevo (p. ej. otro asyncio.run): lo anterior ya no se puede esperar
+            self._loop = loop
+            self._pending.clear()
+            self._inflight.clear()
+            self._tasks.clear()
+            self._timer = None
+
+        stage_metrics.increment(f"{self.name}_requests")
+        future = self._inflight.get(key)
+        if future is not None:
+            stage_metrics.increment(f"{self.name}_coalesced")
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        # Evita el aviso de excepción no recuperada si todos los que esperaban se han cancelado
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        self._pending[key] = item
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = self._loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict) -> None:
+        keys = list(batch)
+        stage_metrics.increment(f"{self.name}_batches")
+        stage_metrics.increment(f"{self.name}_batched", len(keys))
+        start = time.perf_counter()
+        try:
+            results = await self._process([batch[key] for key in keys])
+            if len(results) != len(keys):
+                raise RuntimeError(f"El lote de {len(keys)} elementos devolvió {len(results)} resultados.")
+        except Exception as e:
+            for key in keys:
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            stage_metrics.observe(f"{self.name}_batch", time.perf_counter() - start)
+        for key, result in zip(keys, results):
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(result)
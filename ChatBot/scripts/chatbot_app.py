@@ -54,12 +54,14 @@ def aplicar_estilo_personalizado():
 def enviar_pregunta_escrita_al_modelo(pregunta):
     try:
         # Realizar la solicitud al servidor para obtener la respuesta del chatbot
-        response = requests.post(f"{url_servidor}/answer", json={"text": pregunta})
+        # Se envía el identificador de sesión para que el servidor use el historial de esta conversación
+        response = requests.post(f"{url_servidor}/answer", json={"text": pregunta, "session_id": st.session_state.get("session_id")})
         response.raise_for_status()  # Lanzar una excepción en caso de error de solicitud
 
         # Obtener la respuesta del chatbot
         respuesta = response.json()
         answer = respuesta["text_response"]
+        st.session_state["session_id"] = respuesta.get("session_id")
 
         # Mostrar la respuesta del chatbot
         st.write("Respuesta del chatbot:")
@@ -72,8 +74,11 @@ def enviar_pregunta_escrita_al_modelo(pregunta):
 
 # Función para obtener el historial del chat desde la API
 def get_chat_history():
+    session_id = st.session_state.get("session_id")
+    if not session_id:
+        return []
     try:
-        response = requests.get(f"{url_servidor}/chat_history")
+        response = requests.get(f"{url_servidor}/chat_history", params={"session_id": session_id, "limit": 100})
         response.raise_for_status()  # Lanzar una excepción si la solicitud falla
         return response.json().get("chat_history", [])
     except Exception as e:
@@ -124,6 +129,73 @@ def main():
                     const startButton = document.getElementById('btn-start-recording');
                     const stopButton = document.getElementById('btn-stop-recording');
 
+                    // Sesión de la conversación, la asigna el servidor en la primera respuesta
+                    let sessionId = null;
+
+                    // Envía la grabación a /converse y reproduce el audio de la respuesta a medida que llega:
+                    // transcripción, respuesta y audio en una sola petición (eventos NDJSON, audio en base64)
+                    function conversarEnStreaming(blob) {
+                        return new Promise(function(resolve, reject) {
+                            const mediaSource = new MediaSource();
+                            const audioElement = new Audio();
+                            audioElement.src = URL.createObjectURL(mediaSource);
+                            mediaSource.addEventListener('sourceopen', async function() {
+                                try {
+                                    const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+                                    let formData = new FormData();
+                                    formData.append('file', blob, 'grabacion_audio.webm');
+                                    formData.append('format', 'mp3');
+                                    if (sessionId) {
+                                        formData.append('session_id', sessionId);
+                                    }
+                                    const response = await fetch('https://mwy0tuecpg.execute-api.eu-central-1.amazonaws.com/converse', {
+                                        method: 'POST',
+                                        body: formData
+                                    });
+                                    if (!response.ok) {
+                                        throw new Error('Error ' + response.status + ' en /converse');
+                                    }
+                                    sessionId = response.headers.get('X-Session-Id') || sessionId;
+                                    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                                    let pendiente = '';
+                                    let reproduciendo = false;
+                                    while (true) {
+                                        const { done, value } = await reader.read();
+                                        if (done) break;
+                                        pendiente += value;
+                                        const lineas = pendiente.split('\\n');
+                                        pendiente = lineas.pop();
+                                        for (const linea of lineas) {
+                                            if (!linea) continue;
+                                            const evento = JSON.parse(linea);
+                                            if (evento.type === 'transcript') {
+                                                console.log('Transcripción recibida:', evento.text);
+                                            } else if (evento.type === 'audio') {
+                                                const audio = Uint8Array.from(atob(evento.data), c => c.charCodeAt(0));
+                                                await new Promise(r => {
+                                                    sourceBuffer.addEventListener('updateend', r, { once: true });
+                                                    sourceBuffer.appendBuffer(audio);
+                                                });
+                                                if (!reproduciendo) {
+                                                    reproduciendo = true;
+                                                    audioElement.play();
+                                                }
+                                            } else if (evento.type === 'end') {
+                                                console.log('Latencias (ms):', evento.timings);
+                                            } else if (evento.type === 'error') {
+                                                throw new Error(evento.detail);
+                                            }
+                                        }
+                                    }
+                                    mediaSource.endOfStream();
+                                    resolve();
+                                } catch (error) {
+                                    reject(error);
+                                }
+                            }, { once: true });
+                        });
+                    }
+
                     function stopStream() {
                         if (stream) {
                             stream.getTracks().forEach(track => track.stop());
@@ -165,46 +237,10 @@ def main():
                             recorder.stopRecording(function() {
                                 let blob = recorder.getBlob();
 
-                                // Enviar el archivo de audio al servidor
-                                let formData = new FormData();
-                                formData.append('file', blob, 'grabacion_audio.webm');
-                                fetch('https://mwy0tuecpg.execute-api.eu-central-1.amazonaws.com/speech_to_text', {
-                                    method: 'POST',
-                                    body: formData
-                                })
-                                .then(response => response.json())
-                                .then(data => {
-                                    console.log('Transcripción recibida:', data.text);
-
-                                    // Realizar la solicitud fetch adicional para obtener la respuesta del servidor
-                                    fetch('https://mwy0tuecpg.execute-api.eu-central-1.amazonaws.com/answer', {
-                                        method: 'POST',
-                                        headers: {
-                                            'Content-Type': 'application/json'
-                                        },
-                                        body: JSON.stringify({ text: data.text })
-                                    })
-                                    .then(response => response.json())
-                                    .then(data => {
-                                        console.log('Respuesta del servidor:', data);
-
-                                        // Obtener la URL del archivo de audio
-                                        const audioUrl = data.audio_url_mp3;
-
-                                        // Reproducir el archivo de audio
-                                        const audioElement = new Audio(audioUrl);
-                                        audioElement.play();
-                                    })
-                                    .catch(error => {
-                                        console.error('Error al enviar la solicitud de audio:', error);
-                                    })
-                                    .finally(() => {
-                                        startButton.disabled = false;
-                                        stopStream(); // Detener el flujo de medios
-                                    });
-                                })
+                                // Una sola petición: transcripción, respuesta y audio en streaming
+                                conversarEnStreaming(blob)
                                 .catch(error => {
-                                    console.error('Error al enviar el audio:', error);
+                                    console.error('Error en la conversación:', error);
                                 })
                                 .finally(() => {
                                     startButton.disabled = false;
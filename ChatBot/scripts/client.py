@@ -1,57 +1,61 @@
-import os
-import time
-import requests
-
-# Definir la URL del servidor
-url_servidor = "http://localhost:8000"
-
-# Definir la ruta del archivo de audio MP3 original
-ruta_archivo_audio_mp3_original = r"C:\Users\ferna\OneDrive\Escritorio\GitHub\Alvearium-VR\ChatBot\audio_files\Record (online-voice-recorder.com).mp3"
-
-# Definir la ruta del archivo de audio WAV
-ruta_archivo_audio_wav = r"C:\Users\ferna\OneDrive\Escritorio\GitHub\Alvearium-VR\ChatBot\scripts\temp_audio_resampled.wav"
-
-# Definir la ruta del archivo de audio MP3 de respuesta
-ruta_archivo_audio_mp3_respuesta = r"C:\Users\ferna\OneDrive\Escritorio\GitHub\Alvearium-VR\ChatBot\audio_files\respuesta.mp3"
-
-try:
-    # Eliminar el archivo WAV existente, si lo hay
-    if os.path.exists(ruta_archivo_audio_wav):
-        os.remove(ruta_archivo_audio_wav)
-
-    # Realizar la solicitud al servidor para convertir el MP3 a WAV
-    response_mp3_to_wav = requests.post(f"{url_servidor}/ask_audio", files={"file": open(ruta_archivo_audio_mp3_original, "rb")})
-    response_mp3_to_wav.raise_for_status()  # Lanzar una excepción en caso de error de solicitud
+"""Prueba rápida de un servidor en marcha: voz -> texto -> respuesta -> audio.
 
-    # Esperar un tiempo para que el servidor tenga tiempo de crear el archivo WAV
-    time.sleep(2)  # Ajusta el tiempo de espera según sea necesario
+Envía un audio a /speech_to_text, pregunta la transcripción a /answer y
+descarga el MP3 de la respuesta. Por defecto usa el audio de prueba de
+benchmarks/fixtures; para probar sin gastar llamadas a OpenAI, arranca el
+servidor con OPENAI_BASE_URL apuntando a benchmarks/mock_openai.py.
 
-    # Realizar la solicitud al servidor para convertir el audio WAV a texto (STT)
-    with open(ruta_archivo_audio_wav, "rb") as file:
-        audio_data = {"file": file}
-        response_stt = requests.post(f"{url_servidor}/speech_to_text", files=audio_data)
-    response_stt.raise_for_status()  # Lanzar una excepción en caso de error de solicitud
+Uso (desde ChatBot/scripts):
 
-    # Obtener la transcripción de audio a texto
-    transcription = response_stt.json().get("text")
-
-    print(f"Transcripción de audio a texto exitosa: {transcription}")
-
-    # Realizar la solicitud al servidor para obtener la respuesta del chatbot
-    response_answer = requests.post(f"{url_servidor}/answer", json={"text": transcription})
-    response_answer.raise_for_status()  # Lanzar una excepción en caso de error de solicitud
-
-    # Obtener la respuesta del chatbot
-    answer = response_answer.content
-
-    # Guardar la respuesta del chatbot en un archivo de audio MP3
-    with open(ruta_archivo_audio_mp3_respuesta, "wb") as audio_file:
-        audio_file.write(answer)
-
-    print("Respuesta del chatbot generada correctamente")
-
-except requests.exceptions.RequestException as e:
-    print(f"Error en la solicitud: {e}")
-except Exception as e:
-    print(f"Error inesperado: {e}")
+    python client.py --url http://localhost:8000 --output respuesta.mp3
+"""
+import os
+import sys
+import time
+import argparse
+import requests
 
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "question.mp3")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000", help="URL del servidor")
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="audio con la pregunta")
+    parser.add_argument("--output", help="fichero donde guardar el MP3 de la respuesta")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    try:
+        # Audio a texto (STT)
+        start = time.perf_counter()
+        with open(args.audio, "rb") as file:
+            response_stt = requests.post(f"{args.url}/speech_to_text", files={"file": (os.path.basename(args.audio), file)}, timeout=args.timeout)
+        response_stt.raise_for_status()
+        transcription = response_stt.json().get("text")
+        print(f"Transcripción ({time.perf_counter() - start:.2f} s): {transcription}")
+
+        # Respuesta del chatbot (texto y audio)
+        start = time.perf_counter()
+        response_answer = requests.post(f"{args.url}/answer", json={"text": transcription}, timeout=args.timeout)
+        response_answer.raise_for_status()
+        answer = response_answer.json()
+        print(f"Respuesta ({time.perf_counter() - start:.2f} s): {answer['text_response']}")
+
+        # Audio de la respuesta, servido por el propio servidor
+        start = time.perf_counter()
+        response_audio = requests.get(f"{args.url}/audio_files/{answer['audio_id']}.mp3", timeout=args.timeout)
+        response_audio.raise_for_status()
+        print(f"Audio ({time.perf_counter() - start:.2f} s): {len(response_audio.content)} bytes")
+        if args.output:
+            with open(args.output, "wb") as audio_file:
+                audio_file.write(response_audio.content)
+            print(f"Audio guardado en {args.output}")
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error en la solicitud: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
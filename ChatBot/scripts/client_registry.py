@@ -0,0 +1,402 @@
+"""Clientes HTTP compartidos para todas las llamadas a OpenAI (chat, embeddings, TTS y STT).
+
+Un único pool de conexiones por proceso (uno asíncrono para el servidor y uno
+síncrono para la ingesta) con keep-alive, HTTP/2 si está instalado `h2`,
+límites y timeouts configurables y reintentos con backoff exponencial y
+jitter (los errores y códigos de estado que pueden llegar después de que
+OpenAI haya procesado la petición solo se reintentan si es idempotente). Los clientes de OpenAI y los modelos de LangChain se construyen
+sobre estos pools, así que la conexión TLS se establece una vez y se reutiliza.
+
+`pool_stats()` devuelve el uso del pool: peticiones en curso frente al máximo
+de conexiones, conexiones abiertas y nuevas, espera para obtener conexión y
+reintentos.
+"""
+import os
+import time
+import random
+import socket
+import asyncio
+import threading
+from collections import Counter
+from functools import lru_cache
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+try:
+    import h2  # noqa: F401  (lo necesita httpx para HTTP/2)
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+HTTP2 = os.environ.get("OPENAI_HTTP2", "1") == "1" and _H2_AVAILABLE
+MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# Connect corto (falla rápido y se reintenta); lectura larga para respuestas en streaming
+TIMEOUT = httpx.Timeout(
+    connect=float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5")),
+    read=float(os.environ.get("OPENAI_READ_TIMEOUT", "60")),
+    write=float(os.environ.get("OPENAI_WRITE_TIMEOUT", "30")),
+    pool=float(os.environ.get("OPENAI_POOL_TIMEOUT", "10")),
+)
+
+MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "3"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Rechazos que garantizan que la petición no se procesó: se reintentan con cualquier método
+# (503 solo si trae Retry-After; sin él puede venir de un proxy tras reenviar la petición)
+RATE_LIMIT_STATUS = 429
+UNAVAILABLE_STATUS = 503
+# Errores de conexión: la petición no llegó a enviarse, siempre se puede repetir
+CONNECT_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout)
+# Errores tras enviar la petición: puede que OpenAI ya la esté procesando (y facturando), así que
+# solo se repiten las peticiones idempotentes (métodos de lectura o rutas en IDEMPOTENT_PATHS)
+READ_EXCEPTIONS = (httpx.ReadTimeout, httpx.RemoteProtocolError)
+RETRY_EXCEPTIONS = CONNECT_EXCEPTIONS + READ_EXCEPTIONS
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Sufijos de ruta que se pueden repetir aunque sean POST (los embeddings no tienen efectos; chat y TTS sí)
+IDEMPOTENT_PATHS = tuple(
+    path for path in os.environ.get("OPENAI_IDEMPOTENT_PATHS", "/embeddings").split(",") if path
+)
+
+
+class PoolStats:
+    """Contadores y medidas del pool, compartidos por los transportes síncrono y asíncrono."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._wait_seconds = 0.0
+
+    def started(self) -> None:
+        with self._lock:
+            self.counters["requests"] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def waited(self, seconds: float) -> None:
+        with self._lock:
+            self._wait_seconds += seconds
+            self.counters["pool_waits"] += 1
+
+    def increment(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            requests = self.counters["requests"]
+            return {
+                "http2": HTTP2,
+                "max_connections": MAX_CONNECTIONS,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                # Con HTTP/1.1 cada petición en curso ocupa una conexión: 1.0 = pool lleno. Con HTTP/2
+                # varias peticiones comparten conexión y el cociente no dice nada
+                "saturation": None if HTTP2 else round(self.in_flight / MAX_CONNECTIONS, 3),
+                "mean_pool_wait_ms": round(self._wait_seconds / max(self.counters["pool_waits"], 1) * 1000, 2),
+                "connection_reuse": round(1 - self.counters["new_connections"] / requests, 3) if requests else None,
+                **self.counters,
+            }
+
+
+stats = PoolStats()
+
+
+def _retry_delay(attempt: int, response: httpx.Response = None) -> float:
+    """Backoff exponencial con jitter completo; respeta Retry-After si el servidor lo envía."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("retry-after", 0)))
+        except ValueError:
+            pass
+    return min(delay, BACKOFF_MAX_SECONDS)
+
+
+def _idempotent(request: httpx.Request) -> bool:
+    return request.method in IDEMPOTENT_METHODS or request.url.path.endswith(IDEMPOTENT_PATHS)
+
+
+def _can_retry(request: httpx.Request, error: Exception) -> bool:
+    return isinstance(error, CONNECT_EXCEPTIONS) or _idempotent(request)
+
+
+def _can_retry_status(request: httpx.Request, response: httpx.Response) -> bool:
+    if response.status_code not in RETRY_STATUS_CODES:
+        return False
+    if response.status_code == RATE_LIMIT_STATUS:
+        return True
+    if response.status_code == UNAVAILABLE_STATUS and "retry-after" in response.headers:
+        return True
+    return _idempotent(request)
+
+
+def _drop_connections(transport: httpx.AsyncHTTPTransport) -> None:
+    """Corta las conexiones de un pool cuyo bucle de eventos ya terminó (ahí no se puede esperar a aclose).
+
+    El socket que expone asyncio no se puede cerrar desde fuera; shutdown termina la
+    conexión TCP y el descriptor se libera al recoger el pool.
+    """
+    for connection in transport._pool.connections:
+        stream = getattr(getattr(connection, "_connection", None), "_network_stream", None)
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class _Trace:
+    """Mide, con los eventos de httpcore, la espera por una conexión libre y las conexiones nuevas."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.connect_seconds = 0.0
+        self._connect_start = None
+        self.done = False
+
+    def event(self, name: str) -> None:
+        if name == "connection.connect_tcp.started":
+            self._connect_start = time.perf_counter()
+        elif name == "connection.connect_tcp.complete":
+            stats.increment("new_connections")
+        elif name == "connection.start_tls.complete" and self._connect_start is not None:
+            stats.increment("tls_handshakes")
+            self.connect_seconds = time.perf_counter() - self._connect_start
+        elif name.endswith("send_request_headers.started") and not self.done:
+            self.done = True
+            if self._connect_start is not None and not self.connect_seconds:
+                self.connect_seconds = time.perf_counter() - self._connect_start
+            stats.waited(max(time.perf_counter() - self.start - self.connect_seconds, 0.0))
+
+
+class _TrackedStream(httpx.AsyncByteStream, httpx.SyncByteStream):
+    """Cuerpo de la respuesta que descuenta la petición en curso cuando se cierra."""
+
+    def __init__(self, stream) -> None:
+        self._stream = stream
+        self._closed = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    def _finish(self) -> None:
+        if not self._closed:
+            self._closed = True
+            stats.finished()
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._finish()
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._finish()
+
+
+def _tracked(response: httpx.Response) -> httpx.Response:
+    return httpx.Response(
+        status_code=response.status_code,
+        headers=response.headers,
+        stream=_TrackedStream(response.stream),
+        extensions=response.extensions,
+    )
+
+
+class RetryingAsyncTransport(httpx.AsyncBaseTransport):
+    """Transporte asíncrono con pool, reintentos con jitter y medición del pool.
+
+    Las conexiones del pool pertenecen al bucle de eventos en el que se abrieron:
+    si se usa desde otro bucle (otro asyncio.run) o después de cerrarlo, abre un
+    pool nuevo y cierra el anterior (en su bucle si sigue vivo; si no, cerrando
+    sus sockets).
+    """
+
+    def __init__(self, **kwargs) -> None:
+        self._options = kwargs
+        self._transport = None
+        self._loop = None
+
+    def _pool(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        if self._transport is None or loop is not self._loop:
+            if self._transport is not None:
+                self._discard(self._transport, self._loop)
+            self._transport = httpx.AsyncHTTPTransport(**self._options)
+            self._loop = loop
+        return self._transport
+
+    @staticmethod
+    def _discard(transport: httpx.AsyncHTTPTransport, loop: asyncio.AbstractEventLoop) -> None:
+        if loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(transport.aclose(), loop)
+        else:
+            _drop_connections(transport)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats.started()
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                trace = _Trace()
+
+                async def on_event(name, info):
+                    trace.event(name)
+
+                request.extensions["trace"] = on_event
+                try:
+                    response = await self._pool().handle_async_request(request)
+                except httpx.PoolTimeout:
+                    stats.increment("pool_timeouts")
+                    raise
+                except RETRY_EXCEPTIONS as e:
+                    if attempt == MAX_RETRIES or not _can_retry(request, e):
+                        raise
+                    stats.increment("retries")
+                    await asyncio.sleep(_retry_delay(attempt))
+                    continue
+                if attempt < MAX_RETRIES and _can_retry_status(request, response):
+                    await response.aclose()
+                    stats.increment("retries")
+                    stats.increment(f"status_{response.status_code}")
+                    await asyncio.sleep(_retry_delay(attempt, response))
+                    continue
+                return _tracked(response)
+        except BaseException:
+            stats.increment("errors")
+            stats.finished()
+            raise
+
+    async def aclose(self) -> None:
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            await transport.aclose()
+
+
+class RetryingTransport(httpx.BaseTransport):
+    """Versión síncrona de RetryingAsyncTransport (ingesta y llamadas síncronas de LangChain)."""
+
+    def __init__(self, **kwargs) -> None:
+        self._transport = httpx.HTTPTransport(**kwargs)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        stats.started()
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                trace = _Trace()
+                request.extensions["trace"] = lambda name, info: trace.event(name)
+                try:
+                    response = self._transport.handle_request(request)
+                except httpx.PoolTimeout:
+                    stats.increment("pool_timeouts")
+                    raise
+                except RETRY_EXCEPTIONS as e:
+                    if attempt == MAX_RETRIES or not _can_retry(request, e):
+                        raise
+                    stats.increment("retries")
+                    time.sleep(_retry_delay(attempt))
+                    continue
+                if attempt < MAX_RETRIES and _can_retry_status(request, response):
+                    response.close()
+                    stats.increment("retries")
+                    stats.increment(f"status_{response.status_code}")
+                    time.sleep(_retry_delay(attempt, response))
+                    continue
+                return _tracked(response)
+        except BaseException:
+            stats.increment("errors")
+            stats.finished()
+            raise
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def _transport_options() -> dict:
+    return {
+        "http2": HTTP2,
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+@lru_cache
+def async_http_client() -> httpx.AsyncClient:
+    """Pool asíncrono del proceso (servidor)."""
+    return httpx.AsyncClient(transport=RetryingAsyncTransport(**_transport_options()), timeout=TIMEOUT)
+
+
+@lru_cache
+def http_client() -> httpx.Client:
+    """Pool síncrono del proceso (ingesta)."""
+    return httpx.Client(transport=RetryingTransport(**_transport_options()), timeout=TIMEOUT)
+
+
+# Los reintentos los hace el transporte; el SDK de OpenAI no reintenta por su cuenta
+@lru_cache
+def async_openai_client(api_key: str = None) -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=api_key, http_client=async_http_client(), timeout=TIMEOUT, max_retries=0)
+
+
+@lru_cache
+def openai_client(api_key: str = None) -> OpenAI:
+    return OpenAI(api_key=api_key, http_client=http_client(), timeout=TIMEOUT, max_retries=0)
+
+
+def chat_model(api_key: str = None, **kwargs):
+    """ChatOpenAI de LangChain sobre los clientes compartidos."""
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        api_key=api_key,
+        client=openai_client(api_key).chat.completions,
+        async_client=async_openai_client(api_key).chat.completions,
+        max_retries=0,
+        **kwargs,
+    )
+
+
+def openai_embeddings(api_key: str = None, **kwargs):
+    """OpenAIEmbeddings de LangChain sobre los clientes compartidos."""
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
+        api_key=api_key,
+        client=openai_client(api_key).embeddings,
+        async_client=async_openai_client(api_key).embeddings,
+        max_retries=0,
+        **kwargs,
+    )
+
+
+def pool_stats() -> dict:
+    return stats.summary()
+
+
+async def close_clients() -> None:
+    """Cierra los pools (al parar el servidor); quien los pida después recibe clientes nuevos."""
+    if async_http_client.cache_info().currsize:
+        await async_http_client().aclose()
+    if http_client.cache_info().currsize:
+        http_client().close()
+    for factory in (async_openai_client, openai_client, async_http_client, http_client):
+        factory.cache_clear()
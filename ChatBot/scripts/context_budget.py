@@ -0,0 +1,169 @@
+"""Montaje del contexto del prompt: sin fragmentos casi duplicados y con un presupuesto de tokens.
+
+Los fragmentos recuperados (en orden de relevancia) pasan por tres pasos:
+
+1. Duplicados: se descartan los fragmentos cuyo SimHash (64 bits sobre
+   trigramas de palabras) está a `max_distance` bits o menos de uno ya
+   aceptado; el corpus tiene textos repetidos en varios ficheros.
+2. Presupuesto: se añaden fragmentos mientras quepan en `budget` tokens
+   (contados con tiktoken; si no está disponible, se estiman por caracteres).
+   El que no cabe entero se recorta si le quedan al menos
+   CONTEXT_MIN_TRUNCATED_TOKENS tokens; si no, se descarta.
+3. Contiguos (opcional): los fragmentos consecutivos de un mismo fichero se
+   unen en uno, en la posición del mejor de ellos. Requiere la posición del
+   fragmento en los metadatos ("chunk"), que guarda la ingesta; si dos
+   fragmentos de un fichero dicen ocupar la misma posición, los de ese fichero
+   se dejan sin unir.
+"""
+import os
+import re
+import hashlib
+from functools import lru_cache
+from typing import List, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from llm_metrics import token_encoder
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1000"))
+CONTEXT_SIMHASH_MAX_DISTANCE = int(os.environ.get("CONTEXT_SIMHASH_MAX_DISTANCE", "8"))
+CONTEXT_MERGE_ADJACENT = os.environ.get("CONTEXT_MERGE_ADJACENT", "0") == "1"
+# Una línea por petición con los tokens ahorrados (para depurar; las métricas se registran siempre)
+CONTEXT_LOG = os.environ.get("CONTEXT_LOG", "0") == "1"
+CONTEXT_MIN_TRUNCATED_TOKENS = 40
+# Modelo cuyo tokenizador cuenta el presupuesto
+CONTEXT_MODEL = "gpt-4o"
+
+_SHINGLE_WORDS = 3
+_CHARS_PER_TOKEN = 4
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=8192)
+def simhash(text: str) -> int:
+    """SimHash de 64 bits de los trigramas de palabras del texto."""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return 0
+    shingles = {" ".join(words[i:i + _SHINGLE_WORDS]) for i in range(max(len(words) - _SHINGLE_WORDS + 1, 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little") for shingle in shingles],
+        dtype=np.uint64,
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = (bits.sum(axis=0) * 2 > len(shingles)).astype(np.uint8)
+    return int(np.packbits(votes, bitorder="little").view(np.uint64)[0])
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def dedupe(docs: List[Document], max_distance: int = CONTEXT_SIMHASH_MAX_DISTANCE) -> Tuple[List[Document], int]:
+    """Descarta los fragmentos casi idénticos a otro más relevante; devuelve los que quedan y cuántos se quitaron."""
+    kept, fingerprints = [], []
+    for doc in docs:
+        fingerprint = simhash(doc.page_content)
+        if any(hamming(fingerprint, other) <= max_distance for other in fingerprints):
+            continue
+        kept.append(doc)
+        fingerprints.append(fingerprint)
+    return kept, len(docs) - len(kept)
+
+
+class TokenCounter:
+    """Cuenta y recorta por tokens con tiktoken, o por caracteres si no se puede cargar."""
+
+    def __init__(self, model: str = CONTEXT_MODEL) -> None:
+        self.encoder = token_encoder(model)
+        # Los mismos fragmentos se recuperan una y otra vez: se recuerda su número de tokens
+        self.count = lru_cache(maxsize=8192)(self._count)
+
+    def _count(self, text: str) -> int:
+        if self.encoder is None:
+            return -(-len(text) // _CHARS_PER_TOKEN)
+        return len(self.encoder.encode(text))
+
+    def truncate(self, text: str, tokens: int) -> str:
+        if self.encoder is None:
+            return text[:tokens * _CHARS_PER_TOKEN]
+        return self.encoder.decode(self.encoder.encode(text)[:tokens])
+
+
+def apply_budget(docs: List[Document], budget: int, counter: TokenCounter, separator_tokens: int = 1) -> Tuple[List[Document], int, int]:
+    """Fragmentos que caben en `budget` tokens, en orden; devuelve también cuántos se recortaron y descartaron."""
+    kept, used, truncated = [], 0, 0
+    for doc in docs:
+        cost = counter.count(doc.page_content) + (separator_tokens if kept else 0)
+        if used + cost <= budget:
+            kept.append(doc)
+            used += cost
+            continue
+        remaining = budget - used - (separator_tokens if kept else 0)
+        if remaining >= CONTEXT_MIN_TRUNCATED_TOKENS:
+            kept.append(Document(page_content=counter.truncate(doc.page_content, remaining), metadata=doc.metadata))
+            truncated = 1
+        return kept, truncated, len(docs) - len(kept)
+    return kept, truncated, 0
+
+
+def merge_adjacent(docs: List[Document]) -> Tuple[List[Document], int]:
+    """Une los fragmentos consecutivos de un mismo fichero; devuelve los fragmentos y cuántas uniones se hicieron."""
+    positions, collisions = {}, set()
+    for doc in docs:
+        source, chunk = doc.metadata.get("source"), doc.metadata.get("chunk")
+        if source is not None and chunk is not None:
+            if positions.setdefault((source, chunk), doc) is not doc:
+                collisions.add(source)
+    # Posiciones repetidas (p. ej. un índice con posiciones desactualizadas): no se sabe qué es contiguo
+    positions = {key: doc for key, doc in positions.items() if key[0] not in collisions}
+
+    merged, consumed, merges = [], set(), 0
+    for doc in docs:
+        if id(doc) in consumed:
+            continue
+        source, chunk = doc.metadata.get("source"), doc.metadata.get("chunk")
+        if source is None or chunk is None or source in collisions:
+            merged.append(doc)
+            continue
+        start = chunk
+        while (source, start - 1) in positions and id(positions[(source, start - 1)]) not in consumed:
+            start -= 1
+        run = []
+        while (source, start) in positions and id(positions[(source, start)]) not in consumed:
+            run.append(positions[(source, start)])
+            consumed.add(id(run[-1]))
+            start += 1
+        merges += len(run) - 1
+        # Los fragmentos se cortaron sin solapamiento: unidos con un espacio recuperan el texto original
+        merged.append(Document(page_content=" ".join(part.page_content for part in run), metadata=run[0].metadata))
+    return merged, merges
+
+
+def assemble_context(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET, max_distance: int = CONTEXT_SIMHASH_MAX_DISTANCE,
+                     merge: bool = CONTEXT_MERGE_ADJACENT, counter: TokenCounter = None) -> Tuple[List[Document], dict]:
+    """Aplica duplicados, presupuesto y (opcionalmente) unión de contiguos; devuelve los fragmentos y un informe."""
+    counter = counter or _default_counter()
+    tokens_in = sum(counter.count(doc.page_content) for doc in docs)
+    kept, duplicates = dedupe(docs, max_distance)
+    kept, truncated, dropped = apply_budget(kept, budget, counter)
+    merges = 0
+    if merge:
+        kept, merges = merge_adjacent(kept)
+    tokens_out = sum(counter.count(doc.page_content) for doc in kept)
+    return kept, {
+        "chunks_in": len(docs),
+        "chunks_out": len(kept),
+        "duplicates": duplicates,
+        "truncated": truncated,
+        "dropped": dropped,
+        "merged": merges,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_saved": tokens_in - tokens_out,
+        "exact_tokens": counter.encoder is not None,
+    }
+
+
+@lru_cache(maxsize=1)
+def _default_counter() -> TokenCounter:
+    return TokenCounter()
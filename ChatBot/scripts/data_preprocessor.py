@@ -1,25 +1,77 @@
 import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores.faiss import FAISS
-from langchain_openai import OpenAIEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from extract_apis_keys import load
+from embedding_backends import create_embeddings, write_index_tag, check_index_tag
+from lexical_index import LexicalIndex
+from native_index import write_native_index, current_version_directory, NATIVE_INDEX_DIRECTORY
+from ann_index import build_ann_index, with_ids, update_vectors, add_index_arguments, index_params_from_args
+from client_registry import pool_stats
 import re
 import nltk
+from functools import lru_cache
 from unidecode import unidecode
 
+# Manifiesto con los hashes de ficheros y fragmentos, guardado junto al índice FAISS
+MANIFEST_FILENAME = "manifest.json"
+
+# Parámetros de fragmentación del corpus
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 0
+
+# Tamaño de los lotes de fragmentos enviados al modelo de embeddings
+EMBED_BATCH_SIZE = 256
+
+# Expresiones regulares de la normalización, compiladas una sola vez
+_URL_PATTERN = re.compile(r'https?://\S+')
+_DISALLOWED_CHARS_PATTERN = re.compile(r'[^a-zA-Z0-9áéíóúüñÁÉÍÓÚÜÑ\s]')
+
+
+@lru_cache(maxsize=1)
+def sentence_tokenizer():
+    """Tokenizador de frases punkt en español, cargado una vez por proceso."""
+    return nltk.data.load('tokenizers/punkt/spanish.pickle')
+
+
+def number_chunks(chunks):
+    """Guarda en los metadatos la posición de cada fragmento en su fichero, para poder unir fragmentos contiguos."""
+    for position, chunk in enumerate(chunks):
+        chunk.metadata["chunk"] = position
+    return chunks
+
+
+def transform_text(document):
+    """Normaliza un documento: frases unidas por espacios, sin URLs ni símbolos, en minúsculas."""
+    processed_text = sentence_tokenizer().tokenize(document)
+    processed_text = ' '.join(processed_text)
+    processed_text = _URL_PATTERN.sub('', processed_text)
+    processed_text = _DISALLOWED_CHARS_PATTERN.sub('', processed_text)
+    processed_text = processed_text.replace("a3", "ó")
+    processed_text = processed_text.replace("A3", "ó")
+    processed_text = processed_text.lower()
+
+    return processed_text
+
 
 def apiKeys():
     # Carga de la clave de la API OpenAI
     OPENAI_API_KEY = load()[1]
-    openai_embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
+    # Embeddings del backend configurado (EMBEDDING_BACKEND), con caché en disco compartida con el servidor:
+    # repetir la ingesta no vuelve a calcular los embeddings
+    openai_embeddings = create_embeddings(api_key=OPENAI_API_KEY)
     return openai_embeddings
 
 class TextPreprocessor:
     
     def __init__(self, openai_embeddings) -> None:
         self.openai_embeddings = openai_embeddings
-        self.charactersplit = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        self.charactersplit = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
 
     def convert_to_utf8(self, no_utf8_directory, utf8_directory):
         for filename in os.listdir(no_utf8_directory):
@@ -38,16 +90,7 @@ class TextPreprocessor:
                     print(f"Error al convertir '{filename}' a UTF-8: {e}")
 
     def text_transform(self, document):
-        sentence_tokenizer = nltk.data.load('tokenizers/punkt/spanish.pickle')
-        processed_text = sentence_tokenizer.tokenize(document)
-        processed_text = ' '.join(processed_text)
-        processed_text = re.sub(r'https?://\S+', '', processed_text)
-        processed_text = re.sub(r'[^a-zA-Z0-9áéíóúüñÁÉÍÓÚÜÑ\s]', '', processed_text)
-        processed_text = processed_text.replace("a3", "ó")
-        processed_text = processed_text.replace("A3", "ó")
-        processed_text = processed_text.lower()
-        
-        return processed_text
+        return transform_text(document)
 
     def preprocessor(self, utf8_directory):
         for filename in os.listdir(utf8_directory):
@@ -81,6 +124,40 @@ class TextPreprocessor:
                         print(f"Error de E/S: {e}")
     
 
+    def planned_sources(self, no_utf8_directory, utf8_directory):
+        """Fuentes tal como quedarían tras convert_to_utf8 y preprocessor, calculadas en memoria.
+
+        Para --dry-run: no se escribe nada en los directorios de textos.
+        """
+        contents = {}
+        if os.path.isdir(utf8_directory):
+            for filename in os.listdir(utf8_directory):
+                file_path = os.path.join(utf8_directory, filename)
+                if os.path.isfile(file_path) and filename.endswith(".txt"):
+                    try:
+                        with open(file_path, "r", encoding="utf-8") as f:
+                            contents[filename] = f.read()
+                    except UnicodeDecodeError:
+                        with open(file_path, "r", encoding="latin-1") as f:
+                            contents[filename] = f.read()
+        for filename in os.listdir(no_utf8_directory):
+            file_path = os.path.join(no_utf8_directory, filename)
+            if os.path.isfile(file_path) and filename.endswith(".txt"):
+                with open(file_path, "r", encoding="latin-1") as f:
+                    contents[filename] = unidecode(f.read())
+
+        sources = []
+        for filename in sorted(contents):
+            processed_text = self.text_transform(contents[filename])
+            file_hash = hashlib.sha256(processed_text.encode("utf-8")).hexdigest()
+            metadata = {"source": os.path.join(utf8_directory, filename)}
+
+            def load_chunks(processed_text=processed_text, metadata=metadata):
+                return number_chunks(self.charactersplit.create_documents([processed_text], metadatas=[metadata]))
+
+            sources.append((filename, file_hash, load_chunks))
+        return sources
+
     def database(self, utf8_directory):
         embeddings = self.openai_embeddings
         all_documents = []
@@ -93,20 +170,237 @@ class TextPreprocessor:
                 documents = loader.load()
 
                 # Dividir los documentos en fragmentos de texto
-                texts = self.charactersplit.split_documents(documents)
+                texts = number_chunks(self.charactersplit.split_documents(documents))
 
                 #almacenar todos los elementos en la lista
                 all_documents.extend(texts)
         
         vectorstore =  FAISS.from_documents(all_documents, embeddings)
         vectorstore.save_local("faiss_index")
+        write_index_tag("faiss_index", embeddings, vectorstore.index.d)
+        LexicalIndex.from_vectorstore(vectorstore).save("faiss_index")
+        write_native_index(vectorstore, NATIVE_INDEX_DIRECTORY, sidecar_directory="faiss_index")
+
+    @staticmethod
+    def _chunk_ids(filename, chunks):
+        """Identificador de cada fragmento: hash del fichero de origen, el texto y su aparición."""
+        seen = {}
+        ids = []
+        for chunk in chunks:
+            text_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+            occurrence = seen.get(text_hash, 0)
+            seen[text_hash] = occurrence + 1
+            ids.append(hashlib.sha256(f"{filename}:{text_hash}:{occurrence}".encode("utf-8")).hexdigest()[:32])
+        return ids
+
+    def incremental_database(self, utf8_directory, index_directory="faiss_index", dry_run=False, full=False,
+                             index_type=None, index_params=None, native_directory=NATIVE_INDEX_DIRECTORY):
+        """Actualiza el índice embebiendo solo los fragmentos nuevos o modificados.
+
+        Junto al índice se guarda `manifest.json` con el hash de cada fichero y los
+        identificadores de sus fragmentos. Los ficheros sin cambios no se vuelven a
+        leer ni a embeber, y los fragmentos de ficheros modificados o eliminados se
+        borran del índice por su identificador. Con `full=True` se ignora el índice
+        existente y se reconstruye entero (escribiendo también el manifiesto).
+        `index_type` e `index_params` eligen el índice FAISS (ver ann_index.py).
+        """
+        sources = []
+        for filename in sorted(os.listdir(utf8_directory)):
+            if not filename.endswith(".txt"):
+                continue
+            file_path = os.path.join(utf8_directory, filename)
+            with open(file_path, "rb") as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+
+            def load_chunks(file_path=file_path):
+                loader = TextLoader(file_path, autodetect_encoding=True)
+                return number_chunks(self.charactersplit.split_documents(loader.load()))
+
+            sources.append((filename, file_hash, load_chunks))
+
+        return self.update_index(sources, index_directory, dry_run=dry_run, full=full,
+                                 index_type=index_type, index_params=index_params, native_directory=native_directory)
+
+    def update_index(self, sources, index_directory="faiss_index", dry_run=False, full=False,
+                     batch_size=EMBED_BATCH_SIZE, progress=None, index_type=None, index_params=None,
+                     native_directory=NATIVE_INDEX_DIRECTORY):
+        """Aplica al índice los cambios de `sources` respecto al manifiesto.
+
+        `sources` es un iterable (puede ser un generador) de (nombre de fichero, hash
+        del contenido, función que devuelve sus fragmentos); la función solo se llama
+        para ficheros nuevos o modificados. Los embeddings se piden en lotes de
+        `batch_size` en un hilo aparte en cuanto se llena cada lote, mientras se
+        siguen recorriendo las fuentes, y si se pasa, `progress(embebidos, en cola)`
+        se llama después de cada lote.
+
+        `index_type` ("flat", "ivf", "hnsw" o "ivfpq") e `index_params` se guardan en
+        el manifiesto; si no se indican se mantiene la configuración anterior. Los
+        cambios incrementales se aplican sobre el índice existente por etiqueta
+        (remove_ids/add_with_ids, ver ann_index.update_vectors), sin reentrenarlo.
+        Solo se entrena con `full=True` o al cambiar la configuración, y siempre con
+        los embeddings originales de todos los fragmentos (que salen de la caché),
+        nunca con vectores reconstruidos del índice.
+
+        Al terminar se publica también una versión del índice en formato nativo
+        (ver native_index.py) en `native_directory`, que es la que carga el servidor.
+        Si no hay ficheros nuevos, modificados ni eliminados y la configuración del
+        índice no cambia, no se toca nada.
+        """
+        manifest_path = os.path.join(index_directory, MANIFEST_FILENAME)
+        manifest = {"files": {}}
+        index_exists = not full and os.path.exists(os.path.join(index_directory, "index.faiss"))
+        if index_exists and os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        elif index_exists:
+            print("El índice existente no tiene manifiesto: se reconstruirá completo.")
+            index_exists = False
+
+        previous_config = manifest.get("index", {"type": "flat", "params": {}})
+        index_config = previous_config
+        if index_type is not None:
+            index_config = {"type": index_type, "params": index_params or {}}
+        if index_exists and index_config != previous_config:
+            print("Cambia la configuración del índice: se reconstruye completo con los embeddings de la caché.")
+            index_exists = False
+            manifest = {"files": {}}
+
+        new_files = {}
+        documents_to_add = []
+        ids_to_add = []
+        ids_to_delete = []
+        # Id -> posición nueva de los fragmentos conservados de los ficheros modificados
+        kept_positions = {}
+        report = {"added_files": [], "changed_files": [], "removed_files": [], "unchanged_files": 0}
+
+        batches = []
+        queued = 0
+        embedded = 0
+
+        def embed_batch(texts):
+            nonlocal embedded
+            vectors = self.openai_embeddings.embed_documents(texts)
+            embedded += len(vectors)
+            if progress is not None:
+                progress(embedded, queued)
+            return vectors
+
+        def submit_batches(flush=False):
+            nonlocal queued
+            while len(documents_to_add) - queued >= batch_size or (flush and queued < len(documents_to_add)):
+                texts = [document.page_content for document in documents_to_add[queued:queued + batch_size]]
+                batches.append(embedder.submit(embed_batch, texts))
+                queued += len(texts)
+
+        # Un solo hilo de embeddings: los lotes salen en orden mientras se leen y fragmentan los ficheros siguientes
+        embedder = ThreadPoolExecutor(max_workers=1)
+        try:
+            for filename, file_hash, load_chunks in sources:
+                previous = manifest["files"].get(filename)
+                if previous is not None and previous["sha256"] == file_hash:
+                    new_files[filename] = previous
+                    report["unchanged_files"] += 1
+                    continue
+
+                chunks = load_chunks()
+                chunk_ids = self._chunk_ids(filename, chunks)
+                old_ids = set(previous["chunks"]) if previous is not None else set()
+
+                for chunk, chunk_id in zip(chunks, chunk_ids):
+                    if chunk_id not in old_ids:
+                        documents_to_add.append(chunk)
+                        ids_to_add.append(chunk_id)
+                    else:
+                        # El fragmento se conserva, pero su posición en el fichero puede haber cambiado
+                        kept_positions[chunk_id] = chunk.metadata["chunk"]
+                ids_to_delete.extend(old_ids - set(chunk_ids))
+                new_files[filename] = {"sha256": file_hash, "chunks": chunk_ids}
+                report["changed_files" if previous is not None else "added_files"].append(filename)
+                if not dry_run:
+                    submit_batches()
+            if not dry_run:
+                submit_batches(flush=True)
+            vectors = [vector for batch in batches for vector in batch.result()]
+        finally:
+            embedder.shutdown(cancel_futures=True)
+
+        for filename, previous in manifest["files"].items():
+            if filename not in new_files:
+                ids_to_delete.extend(previous["chunks"])
+                report["removed_files"].append(filename)
+
+        report["chunks_to_embed"] = len(ids_to_add)
+        report["chunks_to_delete"] = len(ids_to_delete)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        if dry_run:
+            return report
+
+        # Sin cambios no se reconstruye ni se publica nada: una versión nueva haría que el
+        # servidor recargase el índice y vaciase la caché de respuestas en cada ejecución
+        unchanged = not (report["added_files"] or report["changed_files"] or report["removed_files"])
+        published = native_directory is None or current_version_directory(native_directory) is not None
+        if index_exists and unchanged and index_config == previous_config and published:
+            print("Sin cambios: se mantiene el índice publicado.")
+            return report
+
+        if index_exists:
+            # No se pueden mezclar vectores de dos modelos distintos en el mismo índice
+            check_index_tag(index_directory, self.openai_embeddings)
+            vectorstore = FAISS.load_local(index_directory, self.openai_embeddings, allow_dangerous_deserialization=True)
+            labels = {doc_id: label for label, doc_id in vectorstore.index_to_docstore_id.items()}
+            remove_labels = [labels.pop(doc_id) for doc_id in ids_to_delete]
+            next_label = max(vectorstore.index_to_docstore_id, default=-1) + 1
+            add_labels = list(range(next_label, next_label + len(ids_to_add)))
+            vectorstore.index = update_vectors(with_ids(vectorstore.index), remove_labels, vectors, add_labels)
+            if ids_to_delete:
+                vectorstore.docstore.delete(ids_to_delete)
+            vectorstore.docstore.add(dict(zip(ids_to_add, documents_to_add)))
+            labels.update(zip(ids_to_add, add_labels))
+            for doc_id, position in kept_positions.items():
+                vectorstore.docstore.search(doc_id).metadata["chunk"] = position
+            vectorstore.index_to_docstore_id = {label: doc_id for doc_id, label in labels.items()}
+            print(f"Índice {index_config['type']} actualizado sin reentrenar: +{len(add_labels)} -{len(remove_labels)} "
+                  f"({vectorstore.index.ntotal} vectores).")
+        elif documents_to_add:
+            index = build_ann_index(vectors, index_config["type"], **index_config["params"])
+            vectorstore = FAISS(self.openai_embeddings, index, InMemoryDocstore(dict(zip(ids_to_add, documents_to_add))),
+                                dict(enumerate(ids_to_add)))
+            print(f"Índice {index_config['type']} construido con {vectorstore.index.ntotal} vectores.")
+        else:
+            print("No hay documentos que indexar.")
+            return report
+
+        vectorstore.save_local(index_directory)
+        write_index_tag(index_directory, self.openai_embeddings, vectorstore.index.d)
+        # Índice léxico (BM25) de todos los fragmentos, para la búsqueda híbrida del servidor
+        LexicalIndex.from_vectorstore(vectorstore).save(index_directory)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"files": new_files, "index": index_config}, f, indent=2, ensure_ascii=False)
+        if native_directory is not None:
+            print(f"Índice nativo publicado en '{write_native_index(vectorstore, native_directory, index_directory)}'.")
+        return report
 
 
 if __name__ == "__main__":
-    openai_embeddings = apiKeys()
-    text_processor = TextPreprocessor(openai_embeddings)
+    parser = argparse.ArgumentParser(description="Preprocesa los textos y actualiza el índice FAISS")
+    parser.add_argument("--full", action="store_true", help="reconstruir el índice completo en lugar de actualizarlo")
+    parser.add_argument("--dry-run", action="store_true", help="mostrar qué fragmentos se añadirían o eliminarían sin tocar el índice")
+    add_index_arguments(parser)
+    args = parser.parse_args()
+
     no_utf8_directory = "TXT_no_UTF8"
     utf8_directory = "TXT_UTF8"
+    if args.dry_run:
+        # Solo el plan: ni se reescriben los textos ni se crean la caché de embeddings o el índice
+        text_processor = TextPreprocessor(None)
+        text_processor.update_index(text_processor.planned_sources(no_utf8_directory, utf8_directory), dry_run=True,
+                                    full=args.full, index_type=args.index_type, index_params=index_params_from_args(args))
+        raise SystemExit(0)
+
+    openai_embeddings = apiKeys()
+    text_processor = TextPreprocessor(openai_embeddings)
     text_processor.convert_to_utf8(no_utf8_directory, utf8_directory)
     text_processor.preprocessor(utf8_directory)
-    text_processor.database(utf8_directory)
\ No newline at end of file
+    text_processor.incremental_database(utf8_directory, full=args.full,
+                                        index_type=args.index_type, index_params=index_params_from_args(args))
+    print(f"Conexiones con OpenAI: {pool_stats()}")
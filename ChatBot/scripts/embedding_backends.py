@@ -0,0 +1,137 @@
+import os
+import json
+import asyncio
+from typing import List
+from langchain_core.embeddings import Embeddings
+from client_registry import openai_embeddings
+from embedding_cache import CachedEmbeddings, normalize_text
+from batching import MicroBatcher
+
+# Backend de embeddings: "openai" (remoto) o "local" (sentence-transformers en CPU, sin red)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "openai")
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+LOCAL_EMBEDDING_MODEL = os.environ.get("LOCAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+# Micro-batching de las consultas concurrentes: ventana en milisegundos (0 = desactivado) y tamaño máximo del lote
+EMBEDDING_BATCH_WINDOW_MS = float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_BATCH_MAX_SIZE = int(os.environ.get("EMBEDDING_BATCH_MAX_SIZE", "64"))
+
+# Etiqueta guardada junto al índice con el modelo de embeddings con el que se construyó
+INDEX_TAG_FILENAME = "embedding_model.json"
+
+
+class LocalEmbeddings(Embeddings):
+    """Embeddings calculados en proceso con sentence-transformers, por lotes y en CPU."""
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL, batch_size: int = 64, device: str = "cpu") -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "El backend de embeddings 'local' (EMBEDDING_BACKEND=local) necesita sentence-transformers, "
+                "incluido en requirements.txt: pip install -r requirements.txt"
+            ) from None
+        self.model = model
+        self.batch_size = batch_size
+        self._encoder = SentenceTransformer(model, device=device)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self._encoder.encode(
+            texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+class BatchedEmbeddings(Embeddings):
+    """Junta las consultas asíncronas simultáneas en una sola llamada a `aembed_documents`.
+
+    Las preguntas que llegan en la misma ventana de unos milisegundos se envían
+    en un único lote, y las preguntas iguales (tras normalizar espacios y
+    Unicode) que coinciden en el tiempo comparten el mismo embedding. Las
+    llamadas síncronas y las de documentos, que ya van por lotes, pasan tal cual.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+        max_size: int = EMBEDDING_BATCH_MAX_SIZE,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = embedding_model_name(embeddings)
+        self._batcher = MicroBatcher(embeddings.aembed_documents, window=window_ms / 1000, max_size=max_size, name="embed")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._batcher.submit(normalize_text(text), text)
+
+
+def create_embeddings(
+    api_key: str = None,
+    backend: str = EMBEDDING_BACKEND,
+    cached: bool = True,
+    batch_window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+) -> Embeddings:
+    """Crea el modelo de embeddings configurado, por defecto con micro-batching y envuelto en la caché en disco.
+
+    La caché va por fuera: solo las consultas que no están en ella llegan al lote.
+    """
+    if backend == "openai":
+        embeddings = openai_embeddings(api_key, model=OPENAI_EMBEDDING_MODEL)
+    elif backend == "local":
+        embeddings = LocalEmbeddings()
+    else:
+        raise ValueError(f"Backend de embeddings no soportado: {backend}")
+    if batch_window_ms > 0:
+        embeddings = BatchedEmbeddings(embeddings, window_ms=batch_window_ms)
+    return CachedEmbeddings(embeddings) if cached else embeddings
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    return getattr(embeddings, "model", type(embeddings).__name__)
+
+
+def write_index_tag(index_directory: str, embeddings: Embeddings, dimension: int) -> None:
+    with open(os.path.join(index_directory, INDEX_TAG_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({"model": embedding_model_name(embeddings), "dimension": dimension}, f)
+
+
+def check_index_tag(index_directory: str, embeddings: Embeddings, dimension: int = None) -> None:
+    """Rechaza un índice construido con otro modelo de embeddings que el configurado.
+
+    Los índices anteriores a la etiqueta se construyeron con OPENAI_EMBEDDING_MODEL.
+    """
+    tag_path = os.path.join(index_directory, INDEX_TAG_FILENAME)
+    if os.path.exists(tag_path):
+        with open(tag_path, "r", encoding="utf-8") as f:
+            tag = json.load(f)
+    else:
+        tag = {"model": OPENAI_EMBEDDING_MODEL, "dimension": None}
+
+    model = embedding_model_name(embeddings)
+    if tag["model"] != model:
+        raise ValueError(
+            f"El índice '{index_directory}' se construyó con '{tag['model']}' pero el servidor usa '{model}'. "
+            "Reconstruye el índice con data_preprocessor.py --full o cambia EMBEDDING_BACKEND."
+        )
+    if dimension is not None and tag.get("dimension") not in (None, dimension):
+        raise ValueError(
+            f"El índice '{index_directory}' tiene dimensión {dimension} pero su etiqueta indica {tag['dimension']}."
+        )
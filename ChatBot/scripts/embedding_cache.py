@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import List, Optional
+import numpy as np
+from filelock import FileLock
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: los lectores toman el mismo cerrojo exclusivo que los escritores
+    fcntl = None
+
+# Directorio compartido por el preprocesador y el servidor (EMBEDDING_CACHE_DIRECTORY lo cambia, p. ej. en los benchmarks)
+DEFAULT_CACHE_DIRECTORY = os.environ.get(
+    "EMBEDDING_CACHE_DIRECTORY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache")
+)
+
+_KEY_BYTES = 16
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza Unicode y espacios para que textos equivalentes compartan entrada."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{normalize_text(text)}".encode("utf-8"), digest_size=_KEY_BYTES).digest()
+
+
+class EmbeddingStore:
+    """Almacén binario de embeddings de un modelo.
+
+    - `vectors.f32`: matriz float32 (una fila por embedding), leída con memoria mapeada.
+    - `keys.bin`: claves de 16 bytes, la fila i de vectors.f32 corresponde a la clave i.
+    - `meta.json`: dimensión y generación (cambia cada vez que se compacta).
+
+    Ambos ficheros solo crecen por el final; varios procesos pueden compartirlos
+    porque las escrituras se serializan con un FileLock y cada lector, con un
+    cerrojo compartido sobre el mismo fichero, incorpora las filas nuevas al
+    detectar que el fichero de claves ha crecido. Cuando se supera `max_entries`
+    se compacta quedándose con las entradas usadas más recientemente; las filas
+    se reescriben de la menos a la más reciente, así que tras un reinicio el
+    orden de las filas sigue aproximando el uso.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 200_000) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._keys_path = os.path.join(directory, "keys.bin")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._file_lock = FileLock(self._lock_path)
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._last_used = {}
+        self._count = 0
+        self._dim: Optional[int] = None
+        self._generation = None
+        self._matrix = None
+
+    # -- lectura -------------------------------------------------------------
+
+    @contextmanager
+    def _read_lock(self):
+        """Cerrojo compartido entre lectores: excluye solo una escritura o compactación en curso."""
+        if fcntl is None:
+            with self._file_lock:
+                yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> dict:
+        if not os.path.exists(self._meta_path):
+            return {"dim": None, "generation": 0}
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _refresh(self) -> None:
+        """Carga las claves añadidas por este u otro proceso desde la última lectura.
+
+        Se llama con el cerrojo del fichero tomado (compartido o exclusivo): una
+        compactación a medias cambiaría el número de filas bajo el mapeo.
+        """
+        meta = self._read_meta()
+        if meta["generation"] != self._generation:
+            self._rows.clear()
+            self._last_used.clear()
+            self._count = 0
+            self._generation = meta["generation"]
+            self._dim = meta["dim"]
+            self._matrix = None
+        elif self._dim is None:
+            # El almacén estaba vacío en la última lectura y otro proceso ha fijado la dimensión
+            self._dim = meta["dim"]
+
+        size = os.path.getsize(self._keys_path) if os.path.exists(self._keys_path) else 0
+        count = size // _KEY_BYTES
+        if count <= self._count:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._count * _KEY_BYTES)
+            data = f.read((count - self._count) * _KEY_BYTES)
+        for i in range(count - self._count):
+            key = data[i * _KEY_BYTES:(i + 1) * _KEY_BYTES]
+            self._rows[key] = self._count + i
+            self._last_used.setdefault(key, 0.0)
+        self._count = count
+        self._matrix = None
+
+    def _vectors(self) -> np.ndarray:
+        if self._matrix is None or len(self._matrix) < self._count:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(self._count, self._dim))
+        return self._matrix
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        with self._lock, self._read_lock():
+            self._refresh()
+            if not self._count:
+                return [None] * len(keys)
+            matrix = self._vectors()
+            now = time.time()
+            result = []
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    result.append(None)
+                else:
+                    self._last_used[key] = now
+                    result.append(np.array(matrix[row]))
+            return result
+
+    # -- escritura -----------------------------------------------------------
+
+    def put_many(self, keys: List[bytes], vectors: List[List[float]]) -> None:
+        if not keys:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock:
+            self._refresh()
+            if self._dim is None:
+                self._dim = array.shape[1]
+                self._write_meta()
+            new = [(key, row) for key, row in zip(keys, array) if key not in self._rows]
+            if not new:
+                return
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.vstack([row for _, row in new]).tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(key for key, _ in new))
+            now = time.time()
+            for key, _ in new:
+                self._last_used[key] = now
+            self._refresh()
+            if self._count > self.max_entries:
+                self._compact()
+
+    def _write_meta(self) -> None:
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "generation": self._generation}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _recency(self, key: bytes) -> tuple:
+        # Las entradas no usadas en este proceso se ordenan por fila: las más recientes están al final
+        return self._last_used.get(key, 0.0), self._rows[key]
+
+    def _compact(self) -> None:
+        """Reescribe el almacén conservando el 90 % de `max_entries` más usado recientemente."""
+        keep = sorted(self._rows, key=self._recency, reverse=True)
+        keep = keep[: int(self.max_entries * 0.9)]
+        matrix = self._vectors()
+        # De la menos a la más reciente, para que el orden de las filas conserve el uso
+        keep.reverse()
+        rows = [self._rows[key] for key in keep]
+        keys_by_row = {row: key for key, row in self._rows.items()}
+
+        with open(self._vectors_path + ".tmp", "wb") as f:
+            f.write(np.ascontiguousarray(matrix[rows]).tobytes())
+        with open(self._keys_path + ".tmp", "wb") as f:
+            f.write(b"".join(keys_by_row[row] for row in rows))
+        self._matrix = None
+        os.replace(self._vectors_path + ".tmp", self._vectors_path)
+        os.replace(self._keys_path + ".tmp", self._keys_path)
+
+        last_used = {key: self._last_used.get(key, 0.0) for key in keep}
+        self._generation = (self._generation or 0) + 1
+        self._write_meta()
+        self._rows.clear()
+        self._last_used.clear()
+        self._count = 0
+        self._refresh()
+        self._last_used.update(last_used)
+
+    def __len__(self) -> int:
+        with self._lock, self._read_lock():
+            self._refresh()
+            return self._count
+
+
+class CachedEmbeddings(Embeddings):
+    """Envuelve un modelo de embeddings con la caché persistente en disco.
+
+    Las búsquedas se hacen por lotes: solo los textos que no están en caché se
+    envían al modelo, en una única llamada a `embed_documents`.
+    """
+
+    def __init__(self, embeddings: Embeddings, directory: str = DEFAULT_CACHE_DIRECTORY, max_entries: int = 200_000) -> None:
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        slug = "".join(c if c.isalnum() or c in "-_." else "_" for c in self.model)
+        self.store = EmbeddingStore(os.path.join(directory, slug), max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, texts: List[str]):
+        keys = [cache_key(self.model, text) for text in texts]
+        cached = self.store.get_many(keys)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return keys, cached, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.store.put_many([keys[i] for i in missing], vectors)
+            for i, vector in zip(missing, vectors):
+                cached[i] = vector
+        return [list(map(float, vector)) for vector in cached]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, cached, missing = self._lookup([text])
+        if missing:
+            vector = self.embeddings.embed_query(text)
+            self.store.put_many(keys, [vector])
+            return vector
+        return list(map(float, cached[0]))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            await asyncio.to_thread(self.store.put_many, [keys[i] for i in missing], vectors)
+            for i, vector in zip(missing, vectors):
+                cached[i] = vector
+        return [list(map(float, vector)) for vector in cached]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, cached, missing = await asyncio.to_thread(self._lookup, [text])
+        if missing:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self.store.put_many, keys, [vector])
+            return vector
+        return list(map(float, cached[0]))
@@ -0,0 +1,98 @@
+import time
+import asyncio
+from typing import Callable, List, Optional
+
+
+class LoadedIndex:
+    """Una versión cargada del índice: vectorstore FAISS, índice léxico y su versión."""
+
+    def __init__(self, vectorstore, lexical_index, version: str, directory: str) -> None:
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.version = version
+        self.directory = directory
+        self.loaded_at = time.time()
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "directory": self.directory,
+            "vectors": self.vectorstore.index.ntotal,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class IndexManager:
+    """Mantiene el índice activo y lo sustituye en caliente por una versión nueva.
+
+    La carga se hace en un hilo aparte mientras se siguen atendiendo peticiones;
+    después se cambia la referencia `current` de una sola vez. Cada petición toma
+    `current` al empezar y lo usa hasta el final, así que las peticiones en curso
+    terminan con el índice anterior, que se libera cuando ninguna lo usa.
+    """
+
+    def __init__(self, loader: Callable[[], LoadedIndex], fingerprint: Callable[[], Optional[str]]) -> None:
+        self._loader = loader
+        self._fingerprint = fingerprint
+        self._on_swap: List[Callable[[LoadedIndex], None]] = []
+        self._lock = asyncio.Lock()
+        self.current: Optional[LoadedIndex] = None
+        self.loaded_fingerprint: Optional[str] = None
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._failed_fingerprint: Optional[str] = None
+
+    def on_swap(self, callback: Callable[[LoadedIndex], None]) -> None:
+        """Registra una función a la que se llama con cada índice nuevo (p. ej. para invalidar cachés)."""
+        self._on_swap.append(callback)
+
+    def _activate(self, loaded: LoadedIndex, fingerprint: Optional[str]) -> None:
+        self.current = loaded
+        self.loaded_fingerprint = fingerprint
+        for callback in self._on_swap:
+            callback(loaded)
+
+    async def reload(self, force: bool = True) -> bool:
+        """Carga la versión publicada en segundo plano y la activa. Devuelve si hubo cambio.
+
+        Sirve también para la carga inicial, cuando todavía no hay índice activo.
+
+        Con `force=False` solo se recarga si la huella del índice en disco ha cambiado
+        (y no es una versión que ya falló). Si la carga falla se mantiene el índice
+        activo y el error queda en `last_error`.
+        """
+        async with self._lock:
+            fingerprint = await asyncio.to_thread(self._fingerprint)
+            if not force and fingerprint in (self.loaded_fingerprint, self._failed_fingerprint):
+                return False
+            try:
+                loaded = await asyncio.to_thread(self._loader)
+            except Exception as e:
+                self._failed_fingerprint = fingerprint
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Error al recargar el índice: {self.last_error}")
+                raise
+            if self.current is not None:
+                self.reloads += 1
+            self._activate(loaded, fingerprint)
+            self.last_error = None
+            print(f"Índice {loaded.version} activado ({loaded.vectorstore.index.ntotal} vectores).")
+            return True
+
+    async def watch(self, interval: float) -> None:
+        """Comprueba cada `interval` segundos si se ha publicado un índice nuevo y lo carga."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload(force=False)
+            except Exception:
+                # El error ya se ha registrado; se reintenta en la siguiente comprobación
+                pass
+
+    def status(self) -> dict:
+        return {
+            "active": self.current.describe() if self.current is not None else None,
+            "fingerprint": self.loaded_fingerprint,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
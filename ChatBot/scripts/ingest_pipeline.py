@@ -0,0 +1,123 @@
+"""Ingesta en una sola pasada: decodificar → normalizar → dividir en frases → fragmentar → embeber.
+
+Cada fichero se procesa completo en un worker del pool de procesos (sin pasadas
+intermedias que reescriban los textos), el texto normalizado se escribe una única
+vez en el directorio UTF-8 y, en cuanto termina, sus fragmentos entran en los
+lotes de embeddings de TextPreprocessor.update_index (actualización incremental),
+así que el preprocesado y los embeddings se solapan.
+
+Uso:
+
+    python ingest_pipeline.py --source TXT_no_UTF8 --output TXT_UTF8 --workers 4
+"""
+import os
+import time
+import hashlib
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from unidecode import unidecode
+from ann_index import add_index_arguments, index_params_from_args
+from native_index import NATIVE_INDEX_DIRECTORY
+from data_preprocessor import TextPreprocessor, apiKeys, number_chunks, sentence_tokenizer, transform_text, CHUNK_SIZE, CHUNK_OVERLAP, EMBED_BATCH_SIZE
+
+
+@lru_cache(maxsize=1)
+def _splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def _init_worker():
+    # Carga el tokenizador punkt y el divisor una sola vez por proceso
+    sentence_tokenizer()
+    _splitter()
+
+
+def process_file(source_path, output_directory, write=True):
+    """Procesa un fichero de principio a fin y devuelve (nombre, hash, fragmentos); con `write=False` no escribe nada."""
+    filename = os.path.basename(source_path)
+    with open(source_path, "r", encoding="latin-1") as f:
+        content = unidecode(f.read())
+    processed_text = transform_text(content)
+
+    output_path = os.path.join(output_directory, filename)
+    if write:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(processed_text)
+
+    file_hash = hashlib.sha256(processed_text.encode("utf-8")).hexdigest()
+    chunks = number_chunks(_splitter().create_documents([processed_text], metadatas=[{"source": output_path}]))
+    return filename, file_hash, chunks
+
+
+def run_pipeline(source_directory, output_directory, index_directory="faiss_index", workers=None,
+                 batch_size=EMBED_BATCH_SIZE, dry_run=False, full=False, index_type=None, index_params=None,
+                 native_directory=NATIVE_INDEX_DIRECTORY):
+    # En --dry-run no se escriben los textos ni se crean la caché de embeddings o el índice
+    text_processor = TextPreprocessor(None if dry_run else apiKeys())
+    if not dry_run:
+        os.makedirs(output_directory, exist_ok=True)
+    paths = [
+        os.path.join(source_directory, filename)
+        for filename in sorted(os.listdir(source_directory))
+        if filename.endswith(".txt") and os.path.isfile(os.path.join(source_directory, filename))
+    ]
+
+    start = time.perf_counter()
+    stats = {"files": 0, "chunks": 0, "preprocess_seconds": 0.0}
+
+    def processed_sources():
+        # Cada fichero pasa a update_index en cuanto termina su worker: sus fragmentos
+        # entran en los lotes de embeddings mientras el pool sigue con los demás
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = {pool.submit(process_file, path, output_directory, not dry_run): path for path in paths}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    filename, file_hash, chunks = future.result()
+                except Exception as e:
+                    print(f"Error al procesar '{os.path.basename(futures[future])}': {e}")
+                    continue
+                stats["files"] += 1
+                stats["chunks"] += len(chunks)
+                elapsed = time.perf_counter() - start
+                print(f"[{done}/{len(paths)}] {filename}: {len(chunks)} fragmentos "
+                      f"({done / elapsed:.1f} ficheros/s, {stats['chunks'] / elapsed:.1f} fragmentos/s)")
+                yield filename, file_hash, lambda chunks=chunks: chunks
+        stats["preprocess_seconds"] = time.perf_counter() - start
+
+    def progress(embedded, queued):
+        elapsed = time.perf_counter() - start
+        print(f"Embeddings: {embedded}/{queued} en cola ({embedded / elapsed:.1f} fragmentos/s)")
+
+    report = text_processor.update_index(
+        processed_sources(), index_directory, dry_run=dry_run, full=full, batch_size=batch_size, progress=progress,
+        index_type=index_type, index_params=index_params, native_directory=native_directory,
+    )
+    total_seconds = time.perf_counter() - start
+
+    files, total_chunks, preprocess_seconds = stats["files"], stats["chunks"], stats["preprocess_seconds"]
+    print(f"Preprocesado: {files} ficheros, {total_chunks} fragmentos en {preprocess_seconds:.2f} s "
+          f"({files / preprocess_seconds:.1f} ficheros/s, {total_chunks / preprocess_seconds:.1f} fragmentos/s)")
+    print(f"Total: {total_seconds:.2f} s ({files / total_seconds:.1f} ficheros/s, "
+          f"{total_chunks / total_seconds:.1f} fragmentos/s)")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta en una sola pasada de los textos al índice FAISS")
+    parser.add_argument("--source", default="TXT_no_UTF8", help="directorio con los textos originales (latin-1)")
+    parser.add_argument("--output", default="TXT_UTF8", help="directorio donde se escriben los textos normalizados")
+    parser.add_argument("--index", default="faiss_index", help="directorio del índice FAISS")
+    parser.add_argument("--native-index", default=NATIVE_INDEX_DIRECTORY, help="raíz del índice en formato nativo que carga el servidor")
+    parser.add_argument("--workers", type=int, default=None, help="procesos del pool (por defecto, uno por CPU)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="fragmentos por llamada de embeddings")
+    parser.add_argument("--full", action="store_true", help="reconstruir el índice completo en lugar de actualizarlo")
+    parser.add_argument("--dry-run", action="store_true", help="mostrar qué fragmentos se añadirían o eliminarían sin tocar el índice")
+    add_index_arguments(parser)
+    args = parser.parse_args()
+
+    run_pipeline(args.source, args.output, args.index, workers=args.workers,
+                 batch_size=args.batch_size, dry_run=args.dry_run, full=args.full,
+                 index_type=args.index_type, index_params=index_params_from_args(args),
+                 native_directory=args.native_index)
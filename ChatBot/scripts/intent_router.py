@@ -0,0 +1,232 @@
+"""Enrutado local de saludos y charla trivial antes de la cadena RAG.
+
+"Hola", "¿Quién eres?" o "gracias" no necesitan recuperación ni llamadas a
+gpt-4o: la plantilla de respuesta ya dicta qué contestar. El router los
+reconoce en dos etapas:
+
+1. Palabras clave (sin red): el texto normalizado tiene que estar formado
+   solo por expresiones de charla trivial (y algunas muletillas), de modo que
+   "Hola, ¿qué es Alvearium?" sigue yendo a la cadena.
+2. Centroides de embeddings (desactivada por defecto): solo para preguntas
+   cortas en las que la primera etapa encontró vocabulario de charla trivial
+   y sobra como mucho INTENT_MAX_UNKNOWN_WORDS palabras ("hola, amiguete"),
+   la similitud coseno entre el embedding de la pregunta (que la cadena
+   calcula igualmente) y el centroide de los ejemplos de cada intención. Una
+   pregunta sin vocabulario de charla ("¿Qué es Alvearium?") nunca llega a
+   esta etapa. La escala de similitudes depende del modelo, así que el umbral
+   se calibra para cada backend de embeddings antes de activarla.
+
+La respuesta sale de plantillas en el idioma de la pregunta (español o
+inglés); las españolas son las de los ejemplos de ANSWER_TEMPLATE, cuyo audio
+se pre-renderiza al arrancar.
+"""
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from unidecode import unidecode
+from phrase_cache import CANNED_ANSWERS
+
+# Similitud mínima con el centroide de una intención; 1 o más (por defecto) desactiva la etapa de embeddings.
+# Depende del modelo (ada-002 da similitudes altas incluso entre textos sin relación): se calibra por backend
+INTENT_EMBEDDING_THRESHOLD = float(os.environ.get("INTENT_EMBEDDING_THRESHOLD", "1"))
+# Las preguntas más largas nunca se consideran charla trivial
+INTENT_MAX_WORDS = int(os.environ.get("INTENT_MAX_WORDS", "8"))
+# Palabras ajenas a la charla trivial que admite la etapa de embeddings
+INTENT_MAX_UNKNOWN_WORDS = int(os.environ.get("INTENT_MAX_UNKNOWN_WORDS", "1"))
+
+# Ejemplos por intención e idioma; en orden de prioridad cuando coinciden varias ("hola, ¿cómo estás?")
+INTENTS = {
+    "identity": {
+        "es": ["quién eres", "quién es usted", "qué eres", "cómo te llamas", "cuál es tu nombre"],
+        "en": ["who are you", "what are you", "what is your name", "what's your name", "whats your name"],
+    },
+    "how_are_you": {
+        "es": ["cómo estás", "cómo está", "qué tal", "qué tal estás", "cómo te va", "cómo va todo", "y tú"],
+        "en": ["how are you", "how are you doing", "how is it going", "how's it going", "and you"],
+    },
+    "thanks": {
+        "es": ["gracias", "muchas gracias", "mil gracias", "te lo agradezco", "muy amable"],
+        "en": ["thanks", "thank you", "thank you very much", "thanks a lot"],
+    },
+    "goodbye": {
+        "es": ["adiós", "hasta luego", "hasta pronto", "hasta mañana", "nos vemos", "chao", "chau"],
+        "en": ["bye", "goodbye", "bye bye", "see you", "see you later"],
+    },
+    "greeting": {
+        "es": ["hola", "buenas", "buenos días", "buenas tardes", "buenas noches", "saludos", "encantado", "encantada"],
+        "en": ["hello", "hi", "hey", "hi there", "hello there", "good morning", "good afternoon", "good evening", "nice to meet you"],
+    },
+}
+
+TEMPLATES = {
+    "greeting": {
+        "es": CANNED_ANSWERS[2],
+        "en": "Hi! I'm Alvy, your personal assistant, here to help you with whatever you need.",
+    },
+    "identity": {
+        "es": CANNED_ANSWERS[1],
+        "en": "Hi, nice to meet you, I'm Alvy, your personal assistant, here to help you with whatever you need.",
+    },
+    "how_are_you": {
+        "es": CANNED_ANSWERS[0],
+        "en": "Fine, thanks, I'm here waiting to help you with whatever you need.",
+    },
+    "thanks": {
+        "es": "¡De nada! Si tienes cualquier otra pregunta sobre Alvearium, aquí estoy para ayudarte.",
+        "en": "You're welcome! If you have any other question about Alvearium, I'm here to help you.",
+    },
+    "goodbye": {
+        "es": "¡Hasta pronto! Ha sido un placer ayudarte.",
+        "en": "Goodbye! It was a pleasure to help you.",
+    },
+}
+
+# Palabras que pueden acompañar a la charla trivial sin cambiar la intención
+FILLER_WORDS = {
+    "alvy", "alvi", "oye", "pues", "bueno", "vale", "muy", "bien", "genial", "perfecto", "y", "tu", "a", "todo", "todos", "por", "favor",
+    "please", "oh", "ok", "okay", "fine", "good", "great",
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> List[str]:
+    """Minúsculas sin acentos ni signos de puntuación, como lista de palabras."""
+    return _NON_WORD.sub(" ", unidecode(text).lower()).split()
+
+
+class RoutedIntent:
+    """Intención reconocida y la respuesta que le corresponde."""
+
+    def __init__(self, intent: str, language: str, stage: str, score: float = 1.0) -> None:
+        self.intent = intent
+        self.language = language
+        self.stage = stage
+        self.score = score
+        self.answer = TEMPLATES[intent][language]
+
+
+class IntentRouter:
+    """Clasificador local de charla trivial: palabras clave y centroides de embeddings."""
+
+    def __init__(
+        self,
+        embedding_threshold: float = INTENT_EMBEDDING_THRESHOLD,
+        max_words: int = INTENT_MAX_WORDS,
+        max_unknown_words: int = INTENT_MAX_UNKNOWN_WORDS,
+    ) -> None:
+        self.embedding_threshold = embedding_threshold
+        self.max_words = max_words
+        self.max_unknown_words = max_unknown_words
+        self._priority = {intent: i for i, intent in enumerate(INTENTS)}
+        # Expresión normalizada -> (intención, idioma)
+        self._phrases: Dict[tuple, tuple] = {}
+        for intent, languages in INTENTS.items():
+            for language, examples in languages.items():
+                for example in examples:
+                    self._phrases.setdefault(tuple(normalize(example)), (intent, language))
+        self._longest = max(len(phrase) for phrase in self._phrases)
+        self._labels: List[tuple] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def templates(self) -> List[str]:
+        return [answer for languages in TEMPLATES.values() for answer in languages.values()]
+
+    def _scan(self, words: List[str]) -> Tuple[List[tuple], int]:
+        """Expresiones de charla trivial reconocidas y número de palabras ajenas a ella."""
+        matched, unknown = [], 0
+        i = 0
+        while i < len(words):
+            for length in range(min(self._longest, len(words) - i), 0, -1):
+                phrase = tuple(words[i:i + length])
+                if phrase in self._phrases:
+                    matched.append(self._phrases[phrase])
+                    i += length
+                    break
+            else:
+                if words[i] not in FILLER_WORDS:
+                    unknown += 1
+                i += 1
+        return matched, unknown
+
+    def _match_keywords(self, words: List[str]) -> Optional[RoutedIntent]:
+        matched, unknown = self._scan(words)
+        if not matched or unknown:
+            return None
+        intent = min((intent for intent, _ in matched), key=self._priority.__getitem__)
+        languages = Counter(language for _, language in matched)
+        language = "en" if languages["en"] > languages["es"] else "es"
+        return RoutedIntent(intent, language, "keywords")
+
+    def route(self, question: str) -> Optional[RoutedIntent]:
+        """Etapa de palabras clave: se llama con cada pregunta, antes de cualquier llamada a la API."""
+        with self._lock:
+            self.counters["questions"] += 1
+        words = normalize(question or "")
+        if not words or len(words) > self.max_words:
+            return None
+        return self._record(self._match_keywords(words))
+
+    def fit(self, embeddings) -> None:
+        """Calcula el centroide de los ejemplos de cada intención e idioma con el modelo de embeddings del servidor."""
+        if self.embedding_threshold >= 1:
+            return
+        labels, texts = [], []
+        for intent, languages in INTENTS.items():
+            for language, examples in languages.items():
+                labels.append((intent, language))
+                texts.append(examples)
+        vectors = embeddings.embed_documents([example for examples in texts for example in examples])
+        vectors = np.asarray(vectors, dtype=np.float32)
+        centroids, start = [], 0
+        for examples in texts:
+            centroid = vectors[start:start + len(examples)].mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+            start += len(examples)
+        self._labels = labels
+        self._centroids = np.vstack(centroids)
+
+    def route_embedding(self, question: str, embedding) -> Optional[RoutedIntent]:
+        """Etapa de embeddings, para preguntas cortas con vocabulario de charla que no reconocieron las palabras clave."""
+        if self._centroids is None:
+            return None
+        words = normalize(question or "")
+        if not words or len(words) > self.max_words:
+            return None
+        matched, unknown = self._scan(words)
+        if not matched or unknown > self.max_unknown_words:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        scores = self._centroids @ (vector / norm)
+        best = int(np.argmax(scores))
+        if scores[best] < self.embedding_threshold:
+            return None
+        intent, language = self._labels[best]
+        return self._record(RoutedIntent(intent, language, "embedding", float(scores[best])))
+
+    def _record(self, routed: Optional[RoutedIntent]) -> Optional[RoutedIntent]:
+        if routed is not None:
+            with self._lock:
+                self.counters["short_circuited"] += 1
+                self.counters[f"intent_{routed.intent}"] += 1
+                self.counters[f"stage_{routed.stage}"] += 1
+        return routed
+
+    def stats(self) -> dict:
+        questions = self.counters["questions"]
+        return {
+            "questions": questions,
+            "short_circuited": self.counters["short_circuited"],
+            "short_circuit_share": round(self.counters["short_circuited"] / questions, 3) if questions else 0.0,
+            "by_intent": {intent: self.counters[f"intent_{intent}"] for intent in INTENTS},
+            "by_stage": {stage: self.counters[f"stage_{stage}"] for stage in ("keywords", "embedding")},
+            "embedding_stage": self._centroids is not None,
+        }
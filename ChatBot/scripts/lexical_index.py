@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+from unidecode import unidecode
+
+# Fichero del índice léxico, guardado junto al índice FAISS
+LEXICAL_INDEX_FILENAME = "lexical_index.json"
+
+# Parámetros BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Tolerancia a errores: términos de 4-7 letras admiten 1 edición, de 8 o más admiten 2
+MIN_FUZZY_LENGTH = 4
+LONG_TERM_LENGTH = 8
+FUZZY_WEIGHT = 0.8
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a al algo como con de del el en es esta este la las lo los mas me mi no o para pero por que se si "
+    "sin su sus te tu un una uno y ya yo the of and to in is it for on what who".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas y sin tildes, para que "África" y "africa" sean el mismo término."""
+    return [token for token in _TOKEN_PATTERN.findall(unidecode(text).lower()) if token not in _STOPWORDS]
+
+
+def _max_distance(term: str) -> int:
+    if len(term) < MIN_FUZZY_LENGTH:
+        return 0
+    return 2 if len(term) >= LONG_TERM_LENGTH else 1
+
+
+def _deletes(term: str, distance: int) -> set:
+    """Variantes de `term` con hasta `distance` letras borradas (índice de borrados tipo SymSpell)."""
+    variants = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        variants |= frontier
+    return variants
+
+
+def _levenshtein(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class LexicalIndex:
+    """Índice invertido BM25 sobre los fragmentos del docstore de FAISS.
+
+    Las búsquedas son consultas a diccionarios en memoria; los términos de la
+    pregunta que no están en el vocabulario se sustituyen por los más cercanos
+    (distancia de edición 1-2), con un peso algo menor.
+    """
+
+    def __init__(self, doc_ids: List[str], doc_lengths: List[int], postings: Dict[str, List[Tuple[int, int]]]) -> None:
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.average_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        self.idf = {
+            term: math.log(1 + (len(doc_ids) - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+        self._delete_index = defaultdict(set)
+        for term in postings:
+            for variant in _deletes(term, _max_distance(term)):
+                self._delete_index[variant].add(term)
+
+    @classmethod
+    def build(cls, documents: List[Tuple[str, str]]) -> "LexicalIndex":
+        """Construye el índice a partir de pares (id del docstore, texto)."""
+        doc_ids = []
+        doc_lengths = []
+        postings = defaultdict(list)
+        for position, (doc_id, text) in enumerate(documents):
+            tokens = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                postings[term].append((position, frequency))
+        return cls(doc_ids, doc_lengths, dict(postings))
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "LexicalIndex":
+        documents = []
+        for position in sorted(vectorstore.index_to_docstore_id):
+            doc_id = vectorstore.index_to_docstore_id[position]
+            documents.append((doc_id, vectorstore.docstore.search(doc_id).page_content))
+        return cls.build(documents)
+
+    def save(self, directory: str) -> None:
+        path = os.path.join(directory, LEXICAL_INDEX_FILENAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"doc_ids": self.doc_ids, "doc_lengths": self.doc_lengths, "postings": self.postings}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, directory: str) -> "LexicalIndex":
+        with open(os.path.join(directory, LEXICAL_INDEX_FILENAME), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {term: [tuple(posting) for posting in docs] for term, docs in data["postings"].items()}
+        return cls(data["doc_ids"], data["doc_lengths"], postings)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Términos del vocabulario que corresponden a `term`, con su peso."""
+        if term in self.postings:
+            return [(term, 1.0)]
+        distance = _max_distance(term)
+        if not distance:
+            return []
+        candidates = set()
+        for variant in _deletes(term, distance):
+            candidates |= self._delete_index.get(variant, set())
+        return [(candidate, FUZZY_WEIGHT) for candidate in candidates if _levenshtein(term, candidate) <= distance]
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Devuelve los `k` fragmentos con mayor puntuación BM25 como (id del docstore, puntuación)."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for matched, weight in self._expand(term):
+                idf = self.idf[matched]
+                for position, frequency in self.postings[matched]:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[position] / self.average_length)
+                    scores[position] += weight * idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[position], score) for position, score in best]
+
+
+def reciprocal_rank_fusion(rankings: List[list], limit: int, k: int = 60) -> list:
+    """Fusiona varias listas de documentos ordenadas (Reciprocal Rank Fusion).
+
+    Los documentos se identifican por su contenido, así que un mismo fragmento
+    recuperado por las dos vías suma ambas contribuciones.
+    """
+    scores = defaultdict(float)
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking):
+            key = document.page_content
+            documents.setdefault(key, document)
+            scores[key] += 1.0 / (k + rank + 1)
+    ordered = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [documents[key] for key in ordered]
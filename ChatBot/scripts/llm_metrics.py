@@ -0,0 +1,127 @@
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_community.callbacks.openai_info import get_openai_token_cost_for_model
+from metrics import StageMetrics, stage_metrics
+
+# Precio (USD por 1000 tokens de entrada y de salida) de los modelos que no conoce langchain_community
+EXTRA_MODEL_PRICES = {
+    "gpt-4o": (0.005, 0.015),
+}
+
+_encoders: Dict[str, Any] = {}
+
+
+def token_encoder(model: str):
+    """Codificador de tiktoken del modelo, o None si no se puede cargar (se recuerda el fallo)."""
+    if model not in _encoders:
+        try:
+            import tiktoken
+            try:
+                _encoders[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoders[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoders[model] = None
+    return _encoders[model]
+
+
+def _estimate_prompt_tokens(model: str, prompts: List[str]) -> Optional[int]:
+    encoder = token_encoder(model)
+    if encoder is None:
+        return None
+    return sum(len(encoder.encode(prompt)) for prompt in prompts)
+
+
+def token_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    try:
+        return (get_openai_token_cost_for_model(model, prompt_tokens)
+                + get_openai_token_cost_for_model(model, completion_tokens, is_completion=True))
+    except ValueError:
+        pass
+    for name, (prompt_price, completion_price) in EXTRA_MODEL_PRICES.items():
+        if model == name or model.startswith(f"{name}-20"):
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+    return None
+
+
+class _Run:
+    __slots__ = ("model", "start", "prompts", "streamed_tokens")
+
+    def __init__(self, model: str, prompts: List[str]) -> None:
+        self.model = model
+        self.start = time.perf_counter()
+        self.prompts = prompts
+        self.streamed_tokens = 0
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Callback de LangChain que exporta a las métricas cada llamada a un modelo de chat.
+
+    Por modelo: latencia total y hasta el primer token, llamadas en curso,
+    tokens de entrada y de salida, coste estimado en USD y errores. En
+    streaming OpenAI no devuelve el uso de tokens: la salida se cuenta por
+    tokens recibidos y la entrada se estima con tiktoken al terminar.
+    Se ejecuta en línea (sin hilo aparte) porque solo actualiza contadores.
+    """
+
+    run_inline = True
+
+    def __init__(self, metrics: StageMetrics = stage_metrics) -> None:
+        self.metrics = metrics
+        self._runs: Dict[UUID, _Run] = {}
+
+    def _start(self, run_id: UUID, prompts: List[str], kwargs: dict) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or "unknown"
+        self._runs[run_id] = _Run(model, prompts)
+        self.metrics.gauge_add("llm_calls_in_flight", 1, model=model)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, prompts, kwargs)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        # El texto se guarda sin tokenizar: solo se tokeniza si la respuesta no trae el uso
+        self._start(run_id, [str(message.content) for batch in messages for message in batch], kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        if run.streamed_tokens == 0:
+            self.metrics.histogram("llm_first_token_seconds", time.perf_counter() - run.start, model=run.model)
+        run.streamed_tokens += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        self.metrics.gauge_add("llm_calls_in_flight", -1, model=run.model)
+        self.metrics.histogram("llm_duration_seconds", time.perf_counter() - run.start, model=run.model)
+        self.metrics.increment("llm_requests", model=run.model)
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion_tokens = usage.get("completion_tokens", run.streamed_tokens)
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = _estimate_prompt_tokens(run.model, run.prompts)
+        self.metrics.increment("llm_tokens", completion_tokens, model=run.model, kind="completion")
+        if prompt_tokens is None:
+            self.metrics.increment("llm_prompt_tokens_unknown", model=run.model)
+            return
+        self.metrics.increment("llm_tokens", prompt_tokens, model=run.model, kind="prompt")
+        cost = token_cost(run.model, prompt_tokens, completion_tokens)
+        if cost is not None:
+            self.metrics.increment("llm_cost_usd", cost, model=run.model)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        self.metrics.gauge_add("llm_calls_in_flight", -1, model=run.model)
+        self.metrics.increment("llm_errors", model=run.model, error=type(error).__name__)
+
+
+llm_metrics_handler = LLMMetricsHandler()
@@ -0,0 +1,239 @@
+import re
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+# Límites (en segundos) de los buckets de los histogramas de latencia exportados a Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "chatbot_"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_INVALID_NAME_CHARACTERS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Histogram:
+    """Histograma de buckets fijos: sumar una muestra cuesta una búsqueda binaria y tres sumas."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels_key(labels: dict) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def metric_name(name: str) -> str:
+    return METRIC_PREFIX + _INVALID_NAME_CHARACTERS.sub("_", name)
+
+
+class StageMetrics:
+    """Latencias por etapa del pipeline (condensación, recuperación, generación, TTS...).
+
+    Guarda las últimas `window` muestras de cada etapa para calcular percentiles
+    y un contador de eventos (p. ej. cuántas veces se ha saltado una etapa).
+    Además acumula histogramas, contadores con etiquetas y gauges para el
+    endpoint /metrics en formato Prometheus. Las actualizaciones no usan locks:
+    con el GIL, en el peor caso se pierde alguna muestra entre hilos.
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._totals = Counter()
+        self.counters = Counter()
+        self.labeled_counters: Dict[Tuple[str, Tuple], float] = Counter()
+        self.gauges: Dict[Tuple[str, Tuple], float] = Counter()
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+        self._counter_collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self._samples[stage].append(seconds)
+        self._totals[stage] += 1
+        self.histogram("stage_duration_seconds", seconds, stage=stage)
+
+    def histogram(self, family: str, seconds: float, **labels) -> None:
+        key = (family, _labels_key(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        if labels:
+            self.labeled_counters[(name, _labels_key(labels))] += amount
+        else:
+            self.counters[name] += amount
+
+    def gauge_add(self, name: str, amount: float, **labels) -> None:
+        self.gauges[(name, _labels_key(labels))] += amount
+
+    @contextmanager
+    def in_flight(self, name: str, **labels):
+        """Cuenta en un gauge las operaciones en curso mientras dura el bloque."""
+        self.gauge_add(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.gauge_add(name, -1, **labels)
+
+    def register_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        """Función que devuelve gauges calculados en el momento de la consulta (tamaño de cachés, ratios...)."""
+        self._collectors.append(collector)
+
+    def register_counter_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        """Como register_collector, para totales que solo crecen (aciertos, reintentos...); se exportan como `*_total`."""
+        self._counter_collectors.append(collector)
+
+    @staticmethod
+    def _collect(collectors: List[Callable[[], Dict[str, float]]]):
+        for collector in collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                print(f"Error al recoger métricas: {e}")
+                continue
+            for name, value in collected.items():
+                if value is not None:
+                    yield name, float(value)
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        stages = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            stages[stage] = {
+                "count": self._totals[stage],
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000, 2),
+            }
+        return {"stages": stages, "counters": dict(self.counters)}
+
+    def render_prometheus(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus."""
+        lines = []
+
+        families = defaultdict(list)
+        for (family, labels), histogram in list(self._histograms.items()):
+            families[family].append((labels, histogram))
+        for family, series in sorted(families.items()):
+            name = metric_name(family)
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        counters = defaultdict(list)
+        for name, value in list(self.counters.items()):
+            counters[name].append(((), value))
+        for (name, labels), value in list(self.labeled_counters.items()):
+            counters[name].append((labels, value))
+        for name, value in self._collect(self._counter_collectors):
+            counters[name].append(((), value))
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {metric_name(name)}_total counter")
+            lines.extend(f"{metric_name(name)}_total{_format_labels(labels)} {value}" for labels, value in series)
+
+        gauges = defaultdict(list)
+        for (name, labels), value in list(self.gauges.items()):
+            gauges[name].append((labels, value))
+        for name, value in self._collect(self._collectors):
+            gauges[name].append(((), value))
+        for name, series in sorted(gauges.items()):
+            lines.append(f"# TYPE {metric_name(name)} gauge")
+            lines.extend(f"{metric_name(name)}{_format_labels(labels)} {value}" for labels, value in series)
+
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: peticiones HTTP y WebSockets en curso y duración de cada petición por endpoint.
+
+    El endpoint se resuelve con las rutas de la aplicación antes de atenderla,
+    así que la etiqueta es el nombre de la función y no la URL (que incluye ids).
+    """
+
+    def __init__(self, app, routes, metrics: StageMetrics = stage_metrics) -> None:
+        self.app = app
+        self.routes = routes
+        self.metrics = metrics
+        # Recorrer todas las rutas cuesta decenas de µs: se recuerda el endpoint de las rutas recientes
+        self._resolve = lru_cache(maxsize=1024)(self._match)
+
+    def _match(self, scope_type: str, method: str, path: str) -> str:
+        from starlette.routing import Match
+
+        scope = {"type": scope_type, "method": method, "path": path, "root_path": ""}
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "name", None) or "unknown"
+        return "unmatched"
+
+    def _endpoint(self, scope) -> str:
+        return self._resolve(scope["type"], scope.get("method"), scope["path"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        endpoint = self._endpoint(scope)
+        if scope["type"] == "websocket":
+            with self.metrics.in_flight("websocket_connections", endpoint=endpoint):
+                await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            # La petición sigue en curso mientras se envía el cuerpo (respuestas en streaming)
+            with self.metrics.in_flight("http_requests_in_flight", endpoint=endpoint):
+                await self.app(scope, receive, send_with_status)
+        finally:
+            self.metrics.histogram(
+                "http_request_duration_seconds", time.perf_counter() - start,
+                endpoint=endpoint, method=scope["method"], status=str(status["code"]),
+            )
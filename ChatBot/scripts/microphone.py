@@ -0,0 +1,66 @@
+import os
+import wave
+import tempfile
+import subprocess
+
+# pyaudio solo hace falta para grabar del micrófono local; en un servidor sin audio no se instala
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+MICROPHONE_AVAILABLE = pyaudio is not None
+
+
+# Función para grabar audio
+def record_audio(file_path: str, duration: int = 10):
+    if pyaudio is None:
+        raise RuntimeError("La grabación desde el micrófono necesita pyaudio: pip install pyaudio")
+    CHUNK = 1024
+    FORMAT = pyaudio.paInt16
+    CHANNELS = 1
+    RATE = 16000
+    RECORD_SECONDS = duration
+    
+    audio = pyaudio.PyAudio()
+    
+    stream = audio.open(format=FORMAT, channels=CHANNELS,
+                        rate=RATE, input=True,
+                        frames_per_buffer=CHUNK)
+    
+    print("Recording...")
+    frames = []
+    
+    for i in range(0, int(RATE / CHUNK * RECORD_SECONDS)):
+        data = stream.read(CHUNK)
+        frames.append(data)
+    
+    print("Finished recording.")
+    
+    stream.stop_stream()
+    stream.close()
+    audio.terminate()
+
+    # Guardar el audio en formato WAV temporal
+    wav_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
+    wav_file_path = wav_file.name
+    wav_file.close()
+    
+    with wave.open(wav_file_path, 'wb') as wf:
+        wf.setnchannels(CHANNELS)
+        wf.setsampwidth(audio.get_sample_size(FORMAT))
+        wf.setframerate(RATE)
+        wf.writeframes(b''.join(frames))
+
+    # Convertir el archivo WAV a MP3
+    mp3_file_path = os.path.splitext(file_path)[0] + ".mp3"
+    subprocess.run(['ffmpeg', "-y", "-i", wav_file_path, "-codec:a", "libmp3lame", mp3_file_path])
+    
+    # Leer el contenido del archivo MP3 como bytes
+    with open(mp3_file_path, 'rb') as mp3_file:
+        audio_content = mp3_file.read()
+    
+    # Eliminar el archivo WAV temporal
+    os.remove(wav_file_path)
+    
+    return audio_content
@@ -0,0 +1,243 @@
+"""Formato nativo del índice, sin pickle: índice FAISS en bruto + almacén de fragmentos mapeado en memoria.
+
+Cada versión publicada es un directorio inmutable dentro de la raíz:
+
+    faiss_native/
+        CURRENT                    nombre de la versión activa (se cambia con os.replace)
+        20240530-101500-a1b2c3/
+            index.faiss            índice FAISS (faiss.write_index)
+            chunks.idx             por fragmento: desplazamiento, longitud e índice de metadatos
+            chunks.txt             textos de todos los fragmentos en UTF-8, uno tras otro
+            ids.bin                id del docstore de cada posición (ancho fijo)
+            ids_sorted.bin         los mismos ids ordenados, para buscar por id en O(log n)
+            ids_sorted.u32         posición correspondiente a cada id ordenado
+            meta.json              número de fragmentos, ancho de los ids y tabla de metadatos distintos
+            embedding_model.json   (y lexical_index.json) copiados del directorio de origen
+
+La carga solo abre los ficheros: los fragmentos se leen del disco al recuperarlos.
+Una versión nueva se escribe en un directorio temporal y se activa de forma
+atómica, así que un servidor en marcha nunca ve un índice a medio escribir.
+
+Conversión del índice existente (index.faiss + index.pkl de LangChain):
+
+    python native_index.py --source faiss_index --target faiss_native
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import pickle
+import argparse
+from collections.abc import Mapping
+from typing import Optional, Tuple
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores.faiss import FAISS
+from ann_index import positional_index
+
+NATIVE_INDEX_DIRECTORY = "faiss_native"
+NATIVE_FORMAT_VERSION = 1
+CURRENT_FILENAME = "CURRENT"
+# Versiones que se conservan en disco (la activa y la anterior)
+KEEP_VERSIONS = 2
+# Ficheros del directorio de origen que acompañan a cada versión
+SIDECAR_FILENAMES = ("embedding_model.json", "lexical_index.json")
+
+_RECORD_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("metadata", "<u4")])
+
+
+def _map(path: str, dtype) -> np.ndarray:
+    # np.memmap no admite ficheros vacíos (índice sin fragmentos)
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class ChunkStore(Docstore):
+    """Docstore de solo lectura sobre los ficheros mapeados en memoria de una versión."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header["format"] != NATIVE_FORMAT_VERSION:
+            raise ValueError(f"Formato de índice nativo no soportado: {header['format']}")
+        self.count = header["count"]
+        self._metadata = header["metadata"]
+        id_dtype = np.dtype(f"S{header['id_width']}")
+        self._records = _map(os.path.join(directory, "chunks.idx"), _RECORD_DTYPE)
+        self._texts = _map(os.path.join(directory, "chunks.txt"), np.uint8)
+        self._ids = _map(os.path.join(directory, "ids.bin"), id_dtype)
+        self._sorted_ids = _map(os.path.join(directory, "ids_sorted.bin"), id_dtype)
+        self._sorted_positions = _map(os.path.join(directory, "ids_sorted.u32"), np.dtype("<u4"))
+
+    def document(self, position: int) -> Document:
+        record = self._records[position]
+        start = int(record["offset"])
+        text = self._texts[start:start + int(record["length"])].tobytes().decode("utf-8")
+        return Document(page_content=text, metadata=dict(self._metadata[int(record["metadata"])]))
+
+    def doc_id(self, position: int) -> str:
+        return self._ids[position].decode("utf-8")
+
+    def position(self, doc_id: str) -> Optional[int]:
+        key = doc_id.encode("utf-8")
+        i = int(np.searchsorted(self._sorted_ids, key))
+        if i < self.count and self._sorted_ids[i] == key:
+            return int(self._sorted_positions[i])
+        return None
+
+    def search(self, search: str):
+        position = self.position(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.document(position)
+
+
+class PositionIds(Mapping):
+    """`index_to_docstore_id` de LangChain resuelto bajo demanda contra el almacén."""
+
+    def __init__(self, store: ChunkStore) -> None:
+        self._store = store
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < self._store.count:
+            raise KeyError(position)
+        return self._store.doc_id(position)
+
+    def __iter__(self):
+        return iter(range(self._store.count))
+
+    def __len__(self) -> int:
+        return self._store.count
+
+
+def _read_faiss_index(path: str):
+    # Los vectores del índice plano/HNSW se mapean en memoria en lugar de copiarse
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if flag is not None:
+        try:
+            return faiss.read_index(path, flag)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+def current_version_directory(root: str) -> Optional[str]:
+    """Directorio de la versión activa, o None si no se ha publicado ninguna."""
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, version)
+
+
+def load_native_index(root: str, embeddings) -> Tuple[FAISS, str]:
+    """Abre la versión activa como un vectorstore FAISS de LangChain; devuelve también su directorio."""
+    directory = current_version_directory(root)
+    if directory is None:
+        raise FileNotFoundError(f"No hay ninguna versión publicada en '{root}'.")
+    index = _read_faiss_index(os.path.join(directory, "index.faiss"))
+    store = ChunkStore(directory)
+    if index.ntotal != store.count:
+        raise ValueError(f"El índice de '{directory}' tiene {index.ntotal} vectores y {store.count} fragmentos.")
+    return FAISS(embeddings, index, store, PositionIds(store)), directory
+
+
+def write_native_index(vectorstore: FAISS, root: str, sidecar_directory: str = None) -> str:
+    """Publica `vectorstore` como una versión nueva de `root` y la activa de forma atómica.
+
+    El índice de la ingesta usa etiquetas estables por fragmento; se publica una
+    copia con las posiciones 0..n-1 como etiquetas (ver ann_index.positional_index).
+    """
+    index, labels = positional_index(vectorstore.index)
+    index_to_docstore_id = {position: vectorstore.index_to_docstore_id[int(label)] for position, label in enumerate(labels)}
+    return _publish(index, vectorstore.docstore, index_to_docstore_id, root, sidecar_directory)
+
+
+def _publish(index, docstore, index_to_docstore_id, root: str, sidecar_directory: str = None) -> str:
+    positions = sorted(index_to_docstore_id)
+    if positions != list(range(index.ntotal)):
+        raise ValueError("index_to_docstore_id no cubre las posiciones 0..n-1 del índice.")
+    ids = [index_to_docstore_id[position].encode("utf-8") for position in positions]
+    documents = [docstore.search(index_to_docstore_id[position]) for position in positions]
+
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(root, exist_ok=True)
+    tmp_directory = os.path.join(root, f".{version}.tmp")
+    os.makedirs(tmp_directory)
+
+    metadata_table = {}
+    records = np.zeros(len(documents), dtype=_RECORD_DTYPE)
+    offset = 0
+    with open(os.path.join(tmp_directory, "chunks.txt"), "wb") as f:
+        for i, document in enumerate(documents):
+            encoded = document.page_content.encode("utf-8")
+            f.write(encoded)
+            key = json.dumps(document.metadata, sort_keys=True, ensure_ascii=False)
+            records[i] = (offset, len(encoded), metadata_table.setdefault(key, len(metadata_table)))
+            offset += len(encoded)
+    records.tofile(os.path.join(tmp_directory, "chunks.idx"))
+
+    id_width = max((len(doc_id) for doc_id in ids), default=1)
+    id_array = np.array(ids, dtype=f"S{id_width}")
+    order = np.argsort(id_array, kind="stable")
+    id_array.tofile(os.path.join(tmp_directory, "ids.bin"))
+    id_array[order].tofile(os.path.join(tmp_directory, "ids_sorted.bin"))
+    order.astype("<u4").tofile(os.path.join(tmp_directory, "ids_sorted.u32"))
+
+    faiss.write_index(index, os.path.join(tmp_directory, "index.faiss"))
+    if sidecar_directory is not None:
+        for filename in SIDECAR_FILENAMES:
+            if os.path.exists(os.path.join(sidecar_directory, filename)):
+                shutil.copy2(os.path.join(sidecar_directory, filename), tmp_directory)
+    with open(os.path.join(tmp_directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": NATIVE_FORMAT_VERSION,
+            "count": len(documents),
+            "id_width": id_width,
+            "metadata": [json.loads(key) for key in metadata_table],
+        }, f, ensure_ascii=False)
+
+    directory = os.path.join(root, version)
+    os.rename(tmp_directory, directory)
+    current_path = os.path.join(root, CURRENT_FILENAME)
+    with open(current_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(current_path + ".tmp", current_path)
+    _remove_old_versions(root, version)
+    return directory
+
+
+def _remove_old_versions(root: str, current: str) -> None:
+    # Un servidor que aún tenga mapeada una versión borrada sigue leyéndola sin problemas
+    versions = sorted(
+        name for name in os.listdir(root)
+        if name != current and not name.startswith(".") and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[:len(versions) - (KEEP_VERSIONS - 1)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def convert(source_directory: str, target_root: str) -> str:
+    """Convierte un índice guardado con FAISS.save_local (index.faiss + index.pkl)."""
+    index = faiss.read_index(os.path.join(source_directory, "index.faiss"))
+    # index.pkl lo ha generado nuestra propia ingesta; es la última vez que se deserializa
+    with open(os.path.join(source_directory, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return _publish(index, docstore, index_to_docstore_id, target_root, sidecar_directory=source_directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte un índice FAISS de LangChain al formato nativo")
+    parser.add_argument("--source", default="faiss_index", help="directorio con index.faiss e index.pkl")
+    parser.add_argument("--target", default=NATIVE_INDEX_DIRECTORY, help="raíz del índice nativo")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    directory = convert(args.source, args.target)
+    print(f"Índice nativo publicado en '{directory}' ({time.perf_counter() - start:.2f} s).")
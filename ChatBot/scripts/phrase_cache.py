@@ -0,0 +1,289 @@
+"""Caché de audio por frase: el TTS de una frase ya sintetizada no se vuelve a pedir.
+
+Cada audio se guarda en `directory` con el nombre `<clave>.<formato>`, donde la
+clave es el hash de (texto normalizado, voz, modelo, formato); la escritura es
+atómica (os.replace), así que varios workers pueden compartir el directorio.
+Los audios más usados se mantienen además en memoria, de modo que un saludo
+se sirve en milisegundos. El tamaño en disco está acotado: se eliminan los
+audios usados hace más tiempo, salvo las respuestas fijas (CANNED_ANSWERS).
+
+El servidor anota cada respuesta servida en un registro de solo añadido
+(AnswerLog, una respuesta por línea). Como CLI, pre-renderiza las respuestas
+fijas y las N respuestas más frecuentes de ese registro o de un fichero con una
+respuesta por línea:
+
+    python phrase_cache.py --top 50
+    python phrase_cache.py --log answers.log --answers respuestas.txt --top 100 --format mp3 opus
+"""
+import os
+import time
+import hashlib
+import argparse
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+from embedding_cache import normalize_text
+
+TTS_MODEL = "tts-1"
+TTS_VOICE = "nova"
+
+PHRASE_CACHE_DIRECTORY = os.environ.get("PHRASE_CACHE_DIRECTORY", "phrase_audio")
+PHRASE_CACHE_MAX_BYTES = int(os.environ.get("PHRASE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+PHRASE_CACHE_MEMORY_BYTES = int(os.environ.get("PHRASE_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+
+# Registro de respuestas servidas (vacío = desactivado); al superar el tamaño se rota a `<ruta>.1`
+ANSWER_LOG_PATH = os.environ.get("ANSWER_LOG_PATH", "answers.log")
+ANSWER_LOG_MAX_BYTES = int(os.environ.get("ANSWER_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Respuestas fijas de los ejemplos de ANSWER_TEMPLATE (saludos y "no te he entendido")
+CANNED_ANSWERS = [
+    "Bien, gracias, estoy aquí esperando para ayudarte con lo que necesites.",
+    "Hola, encantado de conocerte, soy Alvy, tu asistente personal, estoy aquí para ayudarte con lo que necesites.",
+    "¡Hola! ¿Quién eres? Soy Alvy, tu asistente personal, estoy aquí para ayudarte con lo que necesites.",
+    "I didn't quite understand you, please repeat your question.",
+    "Can you repeat the question, please?",
+]
+
+# Intervalo mínimo entre dos barridos del directorio
+_EVICTION_INTERVAL_SECONDS = 60
+# Un acierto solo actualiza la fecha del fichero (para el desalojo) si es más antigua que esto
+_TOUCH_INTERVAL_SECONDS = 3600
+
+
+def phrase_key(text: str, voice: str, model: str, response_format: str) -> str:
+    return hashlib.blake2b(
+        f"{model}\0{voice}\0{response_format}\0{normalize_text(text)}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+class PhraseAudioCache:
+    """Audios de TTS por (texto, voz, modelo, formato) en disco, con los más recientes en memoria."""
+
+    def __init__(self, directory: str = PHRASE_CACHE_DIRECTORY, max_bytes: int = PHRASE_CACHE_MAX_BYTES,
+                 memory_bytes: int = PHRASE_CACHE_MEMORY_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._last_eviction = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, response_format: str) -> str:
+        return os.path.join(self.directory, f"{key}.{response_format}")
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = audio
+            self._memory_size += len(audio)
+            while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+                _, dropped = self._memory.popitem(last=False)
+                self._memory_size -= len(dropped)
+
+    def get(self, text: str, voice: str = TTS_VOICE, model: str = TTS_MODEL, response_format: str = "mp3") -> Optional[bytes]:
+        audio = self._load(phrase_key(text, voice, model, response_format), response_format)
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return audio
+
+    def _load(self, key: str, response_format: str) -> Optional[bytes]:
+        """Audio de memoria o de disco (y lo deja en memoria), sin contar aciertos ni fallos."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                return audio
+        path = self._path(key, response_format)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            modified = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        if time.time() - modified > _TOUCH_INTERVAL_SECONDS:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        self._remember(key, audio)
+        return audio
+
+    def put(self, text: str, audio: bytes, voice: str = TTS_VOICE, model: str = TTS_MODEL,
+            response_format: str = "mp3", pinned: bool = False) -> None:
+        if not audio:
+            return
+        key = phrase_key(text, voice, model, response_format)
+        path = self._path(key, response_format)
+        # Otro worker (o una síntesis simultánea) puede haberlo guardado ya
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        if pinned:
+            self._pinned.add(f"{key}.{response_format}")
+        self._remember(key, audio)
+        if time.time() - self._last_eviction > _EVICTION_INTERVAL_SECONDS:
+            self.evict()
+
+    def contains(self, text: str, voice: str = TTS_VOICE, model: str = TTS_MODEL, response_format: str = "mp3") -> bool:
+        key = phrase_key(text, voice, model, response_format)
+        return key in self._memory or os.path.exists(self._path(key, response_format))
+
+    def pin(self, text: str, voice: str = TTS_VOICE, model: str = TTS_MODEL, response_format: str = "mp3") -> None:
+        """Excluye el audio del desalojo y lo carga en memoria (sin contar en las estadísticas)."""
+        key = phrase_key(text, voice, model, response_format)
+        self._pinned.add(f"{key}.{response_format}")
+        self._load(key, response_format)
+
+    def evict(self) -> int:
+        """Si el directorio supera `max_bytes`, elimina los audios usados hace más tiempo."""
+        with self._lock:
+            self._last_eviction = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.name))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name in self._pinned:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            removed += 1
+            total -= size
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "pinned": len(self._pinned),
+        }
+
+
+class AnswerLog:
+    """Registro de solo añadido con una línea por respuesta servida, compartible entre workers.
+
+    Cada respuesta se escribe normalizada (en una línea) con una sola escritura en
+    modo append, así que las líneas de varios procesos no se mezclan. Al superar
+    `max_bytes` el fichero pasa a `<ruta>.1` (se conserva una sola copia).
+    """
+
+    def __init__(self, path: str = ANSWER_LOG_PATH, max_bytes: int = ANSWER_LOG_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def record(self, answer: str) -> None:
+        if not self.path or not answer:
+            return
+        line = (normalize_text(answer) + "\n").encode("utf-8")
+        with self._lock:
+            try:
+                if os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+            except FileNotFoundError:
+                pass
+            with open(self.path, "ab") as f:
+                f.write(line)
+
+    def paths(self) -> List[str]:
+        """Ficheros del registro, del más antiguo al más reciente."""
+        return [path for path in (self.path + ".1", self.path) if os.path.exists(path)]
+
+
+def frequent_answers(log_path: Optional[str] = ANSWER_LOG_PATH, answers_path: Optional[str] = None, top: int = 50) -> List[Tuple[str, int]]:
+    """Las `top` respuestas más repetidas del registro de respuestas servidas y/o de un fichero de respuestas."""
+    counts = Counter()
+    paths = AnswerLog(log_path).paths() if log_path else []
+    if answers_path:
+        paths.append(answers_path)
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            counts.update(normalize_text(line) for line in f if line.strip())
+    return counts.most_common(top)
+
+
+def prerender(cache: PhraseAudioCache, texts: Iterable[str], synthesize: Callable[[str, str], bytes],
+              formats: Iterable[str] = ("mp3",), workers: int = 4, pinned: bool = False) -> dict:
+    """Sintetiza (en paralelo) los textos que aún no están en la caché, en cada formato."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    pending = [(text, fmt) for text in dict.fromkeys(texts) for fmt in formats]
+    missing = [(text, fmt) for text, fmt in pending if not cache.contains(text, response_format=fmt)]
+
+    def render(item):
+        text, fmt = item
+        cache.put(text, synthesize(text, fmt), response_format=fmt, pinned=pinned)
+
+    report = {"phrases": len(pending), "rendered": 0, "errors": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item, future in [(item, executor.submit(render, item)) for item in missing]:
+            try:
+                future.result()
+                report["rendered"] += 1
+            except Exception as e:
+                report["errors"] += 1
+                print(f"No se pudo sintetizar '{item[0][:40]}' ({item[1]}): {e}")
+    if pinned:
+        for text, fmt in pending:
+            cache.pin(text, response_format=fmt)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", default=ANSWER_LOG_PATH, help="registro de respuestas servidas (ANSWER_LOG_PATH)")
+    parser.add_argument("--answers", help="fichero adicional con una respuesta por línea")
+    parser.add_argument("--top", type=int, default=50, help="número de respuestas frecuentes a pre-renderizar")
+    parser.add_argument("--format", nargs="+", default=["mp3"], help="formatos de audio")
+    parser.add_argument("--directory", default=PHRASE_CACHE_DIRECTORY)
+    parser.add_argument("--workers", type=int, default=4, help="síntesis en paralelo")
+    parser.add_argument("--dry-run", action="store_true", help="mostrar las respuestas sin sintetizarlas")
+    args = parser.parse_args()
+
+    frequent = frequent_answers(args.log, args.answers, args.top)
+    for answer, count in frequent:
+        print(f"{count:6d}  {answer[:100]}")
+    texts = CANNED_ANSWERS + [answer for answer, _ in frequent]
+    if args.dry_run:
+        raise SystemExit(0)
+
+    from extract_apis_keys import load
+    from client_registry import openai_client
+
+    client = openai_client(load()[1])
+
+    def synthesize(text: str, response_format: str) -> bytes:
+        return client.audio.speech.create(model=TTS_MODEL, voice=TTS_VOICE, input=text, response_format=response_format).content
+
+    start = time.perf_counter()
+    cache = PhraseAudioCache(args.directory)
+    report = prerender(cache, texts, synthesize, formats=args.format, workers=args.workers)
+    print(f"{report['rendered']} audios nuevos de {report['phrases']} ({report['errors']} errores) "
+          f"en {time.perf_counter() - start:.1f} s")
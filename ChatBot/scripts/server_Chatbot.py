@@ -1,37 +1,72 @@
 import os
-from typing import List, Tuple
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+import re
+import json
+import base64
+import time
+import asyncio
+import hashlib
+import uuid
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, BackgroundTasks, Header, WebSocket, WebSocketDisconnect, Query
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from langserve import add_routes
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.prompts import ChatPromptTemplate
 from langchain.prompts.prompt import PromptTemplate
 from langchain.schema import format_document
 from langchain.schema.output_parser import StrOutputParser
 from langchain.schema.runnable import RunnableMap, RunnablePassthrough
-from langchain.vectorstores.faiss import FAISS
-from langchain_community.callbacks import get_openai_callback
-from operator import itemgetter
+from langchain_core.runnables import RunnableLambda, RunnableGenerator
 from extract_apis_keys import load
+from audio_store import AudioStore, range_response
+from batching import Coalescer
+from client_registry import async_openai_client, chat_model, close_clients, pool_stats
+from tts_stream import split_sentences, stream_speech, stream_answer
+import transcoder
+import stt
+from answer_cache import SemanticAnswerCache, CacheEntry
+from intent_router import IntentRouter
+from context_budget import assemble_context, CONTEXT_LOG
+from phrase_cache import PhraseAudioCache, AnswerLog, CANNED_ANSWERS, TTS_MODEL, TTS_VOICE, prerender
+from metrics import stage_metrics, MetricsMiddleware, PROMETHEUS_CONTENT_TYPE
+from llm_metrics import llm_metrics_handler
+from session_store import create_session_store, format_turn
+from embedding_backends import create_embeddings, check_index_tag
+from index_manager import IndexManager, LoadedIndex
+from lexical_index import LexicalIndex, LEXICAL_INDEX_FILENAME, reciprocal_rank_fusion
+from microphone import record_audio, MICROPHONE_AVAILABLE
 import tempfile
-import pyaudio
-import wave
 from fastapi.responses import JSONResponse
-from openai import OpenAI
-import subprocess
-import base64
 from fastapi.middleware.cors import CORSMiddleware
 from io import BytesIO
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El servidor responde ya (liveness) mientras el modelo de embeddings y el índice
+    # se cargan en segundo plano; /health/ready indica cuándo puede recibir tráfico
+    app.state.warm_up = asyncio.create_task(_warm_up())
+    app.state.phrase_prerender = asyncio.create_task(_prerender_canned_answers())
+    yield
+    for task_name in ("warm_up", "phrase_prerender", "index_watcher"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    await close_clients()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="LangChain Server",
     version="1.0",
     description="Spin up a simple API server using Langchain's Runnable interfaces",
 )
 
+# Peticiones en curso y duración por endpoint para /metrics
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Permitir solicitudes desde cualquier origen
@@ -46,13 +81,22 @@ UPLOAD_DIRECTORY = "audio_files"
 
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
-# Configura las credenciales de autenticación de Google Cloud
-GOOGLE_APPLICATION_CREDENTIALS = load()
+# Audios generados por respuesta: caducan a los 15 minutos y ocupan como máximo 500 MB
+AUDIO_TTL_SECONDS = 15 * 60
+AUDIO_STORE_MAX_BYTES = 500 * 1024 * 1024
+audio_store = AudioStore(UPLOAD_DIRECTORY, ttl_seconds=AUDIO_TTL_SECONDS, max_bytes=AUDIO_STORE_MAX_BYTES)
+
+# Credenciales de Google Cloud y clave de la API OpenAI (el fichero .env se lee una sola vez)
+GOOGLE_APPLICATION_CREDENTIALS, OPENAI_API_KEY, _ = load()
 
-# Carga de la clave de la API OpenAI
-OPENAI_API_KEY = load()[1]
-openai_embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
-client = OpenAI(api_key=OPENAI_API_KEY)
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """Embeddings del backend configurado (EMBEDDING_BACKEND: "openai" o "local"), con caché en disco
+    compartida con data_preprocessor. Se crean al arrancar en segundo plano (el backend local carga un modelo)."""
+    return create_embeddings(api_key=OPENAI_API_KEY)
+
+# Cliente compartido (pool de conexiones) para TTS y STT; el chat y los embeddings usan el mismo pool
+async_client = async_openai_client(OPENAI_API_KEY)
 
 # Plantillas de conversación y respuesta
 _TEMPLATE = """Given the following conversation and a follow up question, rephrase the 
@@ -109,37 +153,226 @@ def _combine_documents(
 
 MAX_CHAT_HISTORY_LENGTH = 6
 
+# Sesiones: "memory" por proceso o "sqlite" para compartirlas entre varios workers de uvicorn
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "sessions.sqlite3")
+SESSION_IDLE_SECONDS = 30 * 60
+session_store = create_session_store(SESSION_BACKEND, MAX_CHAT_HISTORY_LENGTH, SESSION_IDLE_SECONDS, SESSION_DB_PATH)
+
 # Función para formatear el historial del chat
 def _format_chat_history(chat_history: List[Tuple]) -> str:
     """Format chat history into a string."""
-    buffer = ""
     truncated_history = chat_history[-MAX_CHAT_HISTORY_LENGTH:]
-    for dialogue_turn in truncated_history:
-        human = "Human: " + dialogue_turn[0]
-        ai = "Assistant: " + dialogue_turn[1]
-        buffer += "\n" + "\n".join([human, ai])
-    return buffer
+    return "".join(format_turn(dialogue_turn[0], dialogue_turn[1]) for dialogue_turn in truncated_history)
 
-# Carga del índice de vectores
-index_directory = "./faiss_index"
-persisted_vectorstore = FAISS.load_local(index_directory, openai_embeddings, allow_dangerous_deserialization=True)
-retriever = persisted_vectorstore.as_retriever(search_type="mmr")
+# Modelo más barato y rápido para reescribir la pregunta cuando sí hay historial
+CONDENSE_MODEL = "gpt-3.5-turbo"
 
-'''index_directory = "./faiss_index"
-persisted_vectorstore = FAISS.load_local(index_directory, openai_embeddings)
-retriever = persisted_vectorstore.as_retriever(search_type="mmr")'''
+# Palabras que remiten a turnos anteriores ("¿y cuánto cuesta eso?", "what about there?")
+_REFERENCE_WORDS = re.compile(
+    r"\b(él|ella|ellos|ellas|ello|eso|esto|ese|esa|esos|esas|este|esta|estos|estas|aquel|aquella|aquello|"
+    r"ahí|allí|allá|entonces|también|it|its|that|this|those|these|they|them|there|he|she|also)\b",
+    re.IGNORECASE,
+)
+_MIN_SELF_CONTAINED_WORDS = 4
 
-# Definición del mapeo de entrada y contexto
-_inputs = RunnableMap(
-    standalone_question=RunnablePassthrough.assign(
-        chat_history=lambda x: _format_chat_history(x["chat_history"])
+def _needs_condensing(chat_history: List[Tuple], question: str) -> bool:
+    """Decide si la pregunta necesita reescribirse con el historial para ser independiente."""
+    if not any(turn[0].strip() or turn[1].strip() for turn in chat_history):
+        return False
+    if question.strip().lower().startswith(("y ", "and ")):
+        return True
+    if len(question.split()) < _MIN_SELF_CONTAINED_WORDS:
+        return True
+    return bool(_REFERENCE_WORDS.search(question))
+
+def _index_version(directory: str) -> str:
+    """Huella del índice en disco (nombre, tamaño y fecha de sus ficheros)."""
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(directory)):
+        stat = os.stat(os.path.join(directory, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+# Parámetros de la búsqueda MMR y del índice aproximado (ivf: nprobe, hnsw: efSearch)
+RETRIEVER_K = int(os.environ.get("RETRIEVER_K", "4"))
+RETRIEVER_FETCH_K = int(os.environ.get("RETRIEVER_FETCH_K", "20"))
+RETRIEVER_LAMBDA_MULT = float(os.environ.get("RETRIEVER_LAMBDA_MULT", "0.5"))
+RETRIEVER_SEARCH_KWARGS = {"k": RETRIEVER_K, "fetch_k": RETRIEVER_FETCH_K, "lambda_mult": RETRIEVER_LAMBDA_MULT}
+FAISS_NPROBE = int(os.environ.get("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", "64"))
+
+# Índice de vectores: formato nativo (sin pickle, fragmentos leídos bajo demanda) si está publicado
+NATIVE_INDEX_DIRECTORY = os.environ.get("NATIVE_INDEX_DIRECTORY", "./faiss_native")
+LEGACY_INDEX_DIRECTORY = "./faiss_index"
+# Cada cuántos segundos se comprueba si hay un índice nuevo publicado (0 = solo recarga manual)
+INDEX_WATCH_SECONDS = float(os.environ.get("INDEX_WATCH_SECONDS", "30"))
+# Token para los endpoints de administración (sin definir, no se exige)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+def _load_index() -> LoadedIndex:
+    # FAISS se importa al cargar el índice, no al importar el servidor
+    from langchain_community.vectorstores.faiss import FAISS
+    from native_index import load_native_index, current_version_directory
+    from ann_index import set_search_params, index_type_of
+
+    embeddings = get_embeddings()
+    if current_version_directory(NATIVE_INDEX_DIRECTORY) is not None:
+        vectorstore, directory = load_native_index(NATIVE_INDEX_DIRECTORY, embeddings)
+    else:
+        print(f"No hay índice nativo en '{NATIVE_INDEX_DIRECTORY}'; se carga faiss_index con pickle. "
+              "Conviértelo con: python native_index.py --source faiss_index")
+        directory = LEGACY_INDEX_DIRECTORY
+        vectorstore = FAISS.load_local(directory, embeddings, allow_dangerous_deserialization=True)
+
+    # El índice debe haberse construido con el mismo modelo de embeddings que usa el servidor
+    check_index_tag(directory, embeddings, vectorstore.index.d)
+    set_search_params(vectorstore.index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH)
+    print(f"Índice FAISS '{index_type_of(vectorstore.index)}' con {vectorstore.index.ntotal} vectores.")
+
+    # Índice léxico (BM25) construido en la ingesta; los índices anteriores se indexan al cargarlos
+    if os.path.exists(os.path.join(directory, LEXICAL_INDEX_FILENAME)):
+        lexical = LexicalIndex.load(directory)
+    else:
+        print(f"No se encontró {LEXICAL_INDEX_FILENAME} en '{directory}', se construye en memoria.")
+        lexical = LexicalIndex.from_vectorstore(vectorstore)
+    return LoadedIndex(vectorstore, lexical, _index_version(directory), directory)
+
+def _published_index_fingerprint() -> Optional[str]:
+    """Cambia cuando se publica un índice nuevo (versión nativa activa o ficheros de faiss_index)."""
+    from native_index import current_version_directory
+
+    native = current_version_directory(NATIVE_INDEX_DIRECTORY)
+    if native is not None:
+        return native
+    return _index_version(LEGACY_INDEX_DIRECTORY) if os.path.isdir(LEGACY_INDEX_DIRECTORY) else None
+
+index_manager = IndexManager(_load_index, _published_index_fingerprint)
+
+# Búsqueda híbrida: candidatos léxicos fusionados con los de MMR por Reciprocal Rank Fusion
+LEXICAL_TOP_K = 8
+RRF_K = 60
+
+# Caché semántica de respuestas, ligada a la versión del índice cargado; el umbral está calibrado
+# para text-embedding-ada-002 (ver SemanticAnswerCache) y además exige las mismas palabras con contenido
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", str(6 * 3600)))
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+)
+# Cada índice nuevo invalida las respuestas generadas con el anterior
+index_manager.on_swap(lambda loaded: answer_cache.set_index_version(loaded.version))
+
+async def _warm_up():
+    """Carga del modelo de embeddings, del índice y de los centroides del router de intenciones tras arrancar;
+    después, vigilancia de índices nuevos."""
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(get_embeddings)
+        await index_manager.reload()
+        print(f"Servidor listo en {time.perf_counter() - start:.2f} s.")
+    except Exception as e:
+        print(f"El índice no se pudo cargar al arrancar: {e}")
+    try:
+        # Centroides de las intenciones de charla trivial (los ejemplos quedan en la caché de embeddings)
+        await asyncio.to_thread(intent_router.fit, get_embeddings())
+    except Exception as e:
+        print(f"El router de intenciones solo usará palabras clave: {e}")
+    finally:
+        if INDEX_WATCH_SECONDS > 0:
+            app.state.index_watcher = asyncio.create_task(index_manager.watch(INDEX_WATCH_SECONDS))
+
+def _active_index() -> LoadedIndex:
+    loaded = index_manager.current
+    if loaded is None:
+        raise HTTPException(status_code=503, detail="El índice todavía se está cargando.")
+    return loaded
+
+# Reescritura de la pregunta con el historial (solo cuando hace falta)
+_condense_chain = (
+    RunnablePassthrough.assign(
+        # Las sesiones del servidor ya traen el historial formateado de forma incremental
+        chat_history=lambda x: x.get("formatted_chat_history") or _format_chat_history(x["chat_history"])
     )
     | CONDENSE_QUESTION_PROMPT
-    | ChatOpenAI(api_key=OPENAI_API_KEY, model="gpt-4o", temperature=0.7)
-    | StrOutputParser(),
+    | chat_model(OPENAI_API_KEY, model=CONDENSE_MODEL, temperature=0, callbacks=[llm_metrics_handler])
+    | StrOutputParser()
 )
+
+def _condense(x):
+    if not _needs_condensing(x["chat_history"], x["question"]):
+        stage_metrics.increment("condense_skipped")
+        return x["question"]
+    with stage_metrics.time("condense"):
+        return _condense_chain.invoke(x)
+
+async def _acondense(x):
+    if not _needs_condensing(x["chat_history"], x["question"]):
+        stage_metrics.increment("condense_skipped")
+        return x["question"]
+    with stage_metrics.time("condense"):
+        return await _condense_chain.ainvoke(x)
+
+# Definición del mapeo de entrada y contexto
+_inputs = RunnableMap(
+    standalone_question=RunnableLambda(_condense, afunc=_acondense),
+)
+
+# El embedding de la pregunta independiente se calcula una sola vez y se usa
+# tanto para la caché de respuestas como para la búsqueda MMR en FAISS
+def _embed_question(x):
+    with stage_metrics.time("embed"):
+        return get_embeddings().embed_query(x["standalone_question"])
+
+async def _aembed_question(x):
+    with stage_metrics.time("embed"):
+        return await get_embeddings().aembed_query(x["standalone_question"])
+
+_embed = RunnablePassthrough.assign(
+    question_embedding=RunnableLambda(_embed_question, afunc=_aembed_question)
+)
+_prepare = _inputs | _embed
+
+def _lexical_search(loaded: LoadedIndex, question: str):
+    with stage_metrics.time("retrieve_lexical"):
+        matches = loaded.lexical_index.search(question, k=LEXICAL_TOP_K)
+    return [loaded.vectorstore.docstore.search(doc_id) for doc_id, _ in matches]
+
+def _fuse(vector_docs, lexical_docs):
+    return reciprocal_rank_fusion([vector_docs, lexical_docs], limit=RETRIEVER_K, k=RRF_K)
+
+# Cada petición usa el índice que estaba activo al empezar ("index"), aunque se recargue mientras tanto
+def _retrieve(x):
+    loaded = x.get("index") or _active_index()
+    with stage_metrics.time("retrieve"):
+        vector_docs = loaded.vectorstore.max_marginal_relevance_search_by_vector(x["question_embedding"], **RETRIEVER_SEARCH_KWARGS)
+        return _fuse(vector_docs, _lexical_search(loaded, x["standalone_question"]))
+
+async def _aretrieve(x):
+    loaded = x.get("index") or _active_index()
+    with stage_metrics.time("retrieve"):
+        vector_docs = await loaded.vectorstore.amax_marginal_relevance_search_by_vector(x["question_embedding"], **RETRIEVER_SEARCH_KWARGS)
+        return _fuse(vector_docs, _lexical_search(loaded, x["standalone_question"]))
+
+def _assemble_context(docs):
+    """Quita fragmentos casi duplicados y ajusta el contexto al presupuesto de tokens antes de unirlo."""
+    with stage_metrics.time("context_assembly"):
+        docs, report = assemble_context(docs)
+    stage_metrics.increment("context_tokens", report["tokens_out"], kind="sent")
+    stage_metrics.increment("context_tokens", report["tokens_saved"], kind="saved")
+    stage_metrics.increment("context_chunks_removed", report["duplicates"], reason="duplicate")
+    stage_metrics.increment("context_chunks_removed", report["dropped"], reason="budget")
+    if CONTEXT_LOG:
+        print(f"Contexto: {report['tokens_in']} -> {report['tokens_out']} tokens ({report['tokens_saved']} ahorrados; "
+              f"{report['duplicates']} duplicados, {report['dropped']} descartados, {report['truncated']} recortados, "
+              f"{report['merged']} uniones)")
+    return _combine_documents(docs)
+
 _context = {
-    "context": itemgetter("standalone_question") | retriever | _combine_documents,
+    "context": RunnableLambda(_retrieve, afunc=_aretrieve) | _assemble_context,
     "question": lambda x: x["standalone_question"],
 }
 
@@ -153,117 +386,219 @@ class ChatHistory(BaseModel):
     )
     question: str
 
-# Cadena de procesamiento de la conversación
-conversational_qa_chain = (
-    _inputs | _context | ANSWER_PROMPT | ChatOpenAI(model="gpt-4o", max_tokens=300, temperature=0.7) | StrOutputParser()
+# Generación de la respuesta a partir de la pregunta independiente y su embedding
+_answer_chain = (
+    _context | ANSWER_PROMPT | chat_model(OPENAI_API_KEY, model="gpt-4o", max_tokens=300, temperature=0.7, callbacks=[llm_metrics_handler]) | StrOutputParser()
 )
+
+# Saludos y charla trivial se contestan con plantillas, sin recuperación ni LLM
+intent_router = IntentRouter()
+
+def _short_circuit(routed, start: float) -> str:
+    stage_metrics.increment("intent_routed", intent=routed.intent, stage=routed.stage)
+    stage_metrics.observe("answer_short_circuit", time.perf_counter() - start)
+    return routed.answer
+
+# Respuestas servidas, una por línea: de aquí salen las más frecuentes que pre-renderiza phrase_cache.py
+answer_log = AnswerLog()
+
+async def cached_answer(inputs: dict):
+    """Devuelve la entrada de caché de la respuesta, generándola si no hay ninguna parecida."""
+    entry = await _resolve_answer(inputs)
+    if entry is not None:
+        await asyncio.to_thread(answer_log.record, entry.answer)
+    return entry
+
+async def _resolve_answer(inputs: dict):
+    start = time.perf_counter()
+    routed = intent_router.route(inputs["question"])
+    if routed is not None:
+        return CacheEntry(inputs["question"], None, _short_circuit(routed, start))
+    loaded = _active_index()
+    prepared = await _prepare.ainvoke(inputs)
+    routed = intent_router.route_embedding(prepared["standalone_question"], prepared["question_embedding"])
+    if routed is not None:
+        return CacheEntry(inputs["question"], None, _short_circuit(routed, start))
+    entry = answer_cache.lookup(prepared["question_embedding"], prepared["standalone_question"])
+    if entry is None:
+        with stage_metrics.time("generate"):
+            answer = await _answer_chain.ainvoke({**prepared, "index": loaded})
+        if not answer:
+            return None
+        entry = answer_cache.add(
+            prepared["standalone_question"], prepared["question_embedding"], answer, index_version=loaded.version
+        )
+    stage_metrics.observe("answer_pipeline", time.perf_counter() - start)
+    return entry
+
+async def _astream_cached_answer(inputs):
+    """Como cached_answer, pero emitiendo los tokens del LLM a medida que llegan."""
+    async for chat_input in inputs:
+        start = time.perf_counter()
+        routed = intent_router.route(chat_input["question"])
+        if routed is not None:
+            answer = _short_circuit(routed, start)
+            yield answer
+            await asyncio.to_thread(answer_log.record, answer)
+            continue
+        loaded = _active_index()
+        prepared = await _prepare.ainvoke(chat_input)
+        routed = intent_router.route_embedding(prepared["standalone_question"], prepared["question_embedding"])
+        if routed is not None:
+            answer = _short_circuit(routed, start)
+            yield answer
+            await asyncio.to_thread(answer_log.record, answer)
+            continue
+        entry = answer_cache.lookup(prepared["question_embedding"], prepared["standalone_question"])
+        if entry is not None:
+            stage_metrics.observe("answer_pipeline", time.perf_counter() - start)
+            yield entry.answer
+            await asyncio.to_thread(answer_log.record, entry.answer)
+            continue
+        tokens = []
+        generate_start = time.perf_counter()
+        async for token in _answer_chain.astream({**prepared, "index": loaded}):
+            if not tokens:
+                stage_metrics.observe("generate_first_token", time.perf_counter() - generate_start)
+            tokens.append(token)
+            yield token
+        stage_metrics.observe("generate", time.perf_counter() - generate_start)
+        stage_metrics.observe("answer_pipeline", time.perf_counter() - start)
+        if tokens:
+            answer = "".join(tokens)
+            answer_cache.add(prepared["standalone_question"], prepared["question_embedding"], answer, index_version=loaded.version)
+            await asyncio.to_thread(answer_log.record, answer)
+
+# Cadena de procesamiento de la conversación
+conversational_qa_chain = RunnableGenerator(_astream_cached_answer)
 chain = conversational_qa_chain.with_types(input_type=ChatHistory)
 
-# Variable global para almacenar el historial del chat
-global_chat_history = []
+async def _session_inputs(request_body: dict, session_id: str) -> dict:
+    """Entrada de la cadena: el historial enviado por el cliente o, si no lo envía, el de su sesión."""
+    question = request_body.get("text")
+    chat_history = request_body.get("chat_history")
+    if chat_history is not None:
+        return {"chat_history": chat_history, "question": question}
+    return {
+        "chat_history": await asyncio.to_thread(session_store.history, session_id),
+        "formatted_chat_history": await asyncio.to_thread(session_store.formatted_history, session_id),
+        "question": question,
+    }
 
 
-# Función para grabar audio
-def record_audio(file_path: str, duration: int = 10):
-    CHUNK = 1024
-    FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-    RATE = 16000
-    RECORD_SECONDS = duration
-    
-    audio = pyaudio.PyAudio()
-    
-    stream = audio.open(format=FORMAT, channels=CHANNELS,
-                        rate=RATE, input=True,
-                        frames_per_buffer=CHUNK)
-    
-    print("Recording...")
-    frames = []
-    
-    for i in range(0, int(RATE / CHUNK * RECORD_SECONDS)):
-        data = stream.read(CHUNK)
-        frames.append(data)
-    
-    print("Finished recording.")
-    
-    stream.stop_stream()
-    stream.close()
-    audio.terminate()
-
-    # Guardar el audio en formato WAV temporal
-    wav_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-    wav_file_path = wav_file.name
-    wav_file.close()
-    
-    with wave.open(wav_file_path, 'wb') as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(audio.get_sample_size(FORMAT))
-        wf.setframerate(RATE)
-        wf.writeframes(b''.join(frames))
-
-    # Convertir el archivo WAV a MP3
-    mp3_file_path = os.path.splitext(file_path)[0] + ".mp3"
-    subprocess.run(['ffmpeg', "-y", "-i", wav_file_path, "-codec:a", "libmp3lame", mp3_file_path])
-    
-    # Leer el contenido del archivo MP3 como bytes
-    with open(mp3_file_path, 'rb') as mp3_file:
-        audio_content = mp3_file.read()
-    
-    # Eliminar el archivo WAV temporal
-    os.remove(wav_file_path)
-    
-    return audio_content
+# Peticiones simultáneas con la misma respuesta (p. ej. desde la caché) comparten una sola síntesis
+tts_coalescer = Coalescer("tts")
 
-def text_to_speech(text: str, save_path: str) -> bytes:
-    try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        response = client.audio.speech.create(
-            model="tts-1",
-            voice="nova",
-            input=text
+# Audio ya sintetizado por (texto, voz, modelo, formato): saludos y respuestas frecuentes no vuelven al TTS
+phrase_cache = PhraseAudioCache()
+# Formatos en los que se pre-renderizan las respuestas fijas al arrancar
+PHRASE_PRERENDER_FORMATS = os.environ.get("PHRASE_PRERENDER_FORMATS", transcoder.SOURCE_FORMAT).split(",")
+
+async def _synthesize(text: str, response_format: str) -> bytes:
+    audio = await asyncio.to_thread(phrase_cache.get, text, TTS_VOICE, TTS_MODEL, response_format)
+    if audio is not None:
+        stage_metrics.increment("tts_phrase_cache_hit")
+        return audio
+    with stage_metrics.time("tts"), stage_metrics.in_flight("tts_in_flight"):
+        response = await async_client.audio.speech.create(
+            model=TTS_MODEL,
+            voice=TTS_VOICE,
+            input=text,
+            response_format=response_format,
         )
+    await asyncio.to_thread(phrase_cache.put, text, response.content, TTS_VOICE, TTS_MODEL, response_format)
+    return response.content
 
-        # Guardar el audio en formato MP3
-        mp3_file_path = save_path
-        mp3_subprocess = subprocess.Popen(['ffmpeg', "-y", "-i", "pipe:0", "-codec:a", "libmp3lame", mp3_file_path], stdin=subprocess.PIPE)
-        mp3_subprocess.communicate(input=response.read())
-        mp3_subprocess.wait()
+async def _prerender_canned_answers():
+    """Sintetiza al arrancar las respuestas fijas y las plantillas del router de intenciones
+    (y cada una de sus frases, para el streaming) que falten en disco."""
+    texts = list(dict.fromkeys(CANNED_ANSWERS + intent_router.templates()))
+    for answer in list(texts):
+        texts += [sentence async for sentence in split_sentences(_single(answer))]
 
-        # Convertir el archivo MP3 a WAV
-        wav_file_path = save_path.replace('.mp3', '.wav')
-        wav_subprocess = subprocess.run(['ffmpeg', '-y', '-i', mp3_file_path, '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', '2', wav_file_path], check=True)
+    def synthesize(text: str, response_format: str) -> bytes:
+        return asyncio.run_coroutine_threadsafe(_synthesize(text, response_format), loop).result()
 
-        # Leer el contenido del archivo WAV como bytes
-        with open(wav_file_path, 'rb') as audio_file:
-            audio_content = audio_file.read()
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        report = await asyncio.to_thread(prerender, phrase_cache, texts, synthesize, PHRASE_PRERENDER_FORMATS, pinned=True)
+        print(f"Respuestas fijas pre-renderizadas: {report} en {time.perf_counter() - start:.2f} s.")
+    except Exception as e:
+        print(f"No se pudieron pre-renderizar las respuestas fijas: {e}")
 
-        return audio_content
+async def _single(text: str):
+    yield text
+
+async def text_to_speech(text: str, response_format: str = transcoder.SOURCE_FORMAT) -> bytes:
+    """Pide el audio directamente en el formato final; no hace falta transcodificar."""
+    try:
+        return await tts_coalescer.run((text, response_format), lambda: _synthesize(text, response_format))
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def speech_to_text_internal(file_path: str) -> str:
+# Formatos de audio para el streaming por frases; "pcm" es 16 bits, 24 kHz, mono sin cabecera
+STREAM_AUDIO_FORMATS = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "pcm": "audio/L16;rate=24000;channels=1",
+}
+
+async def text_to_speech_stream(text: str, response_format: str = "mp3"):
+    """Sintetiza una frase y devuelve el audio a medida que llega de OpenAI (o de golpe si ya estaba en caché)."""
+    cached = await asyncio.to_thread(phrase_cache.get, text, TTS_VOICE, TTS_MODEL, response_format)
+    if cached is not None:
+        stage_metrics.increment("tts_phrase_cache_hit")
+        yield cached
+        return
+    start = time.perf_counter()
+    first_chunk = True
+    chunks = []
+    with stage_metrics.in_flight("tts_in_flight"):
+        async with async_client.audio.speech.with_streaming_response.create(
+            model=TTS_MODEL,
+            voice=TTS_VOICE,
+            input=text,
+            response_format=response_format,
+        ) as response:
+            async for chunk in response.iter_bytes(4096):
+                if first_chunk:
+                    first_chunk = False
+                    stage_metrics.observe("tts_stream_first_byte", time.perf_counter() - start)
+                chunks.append(chunk)
+                yield chunk
+    stage_metrics.observe("tts_stream", time.perf_counter() - start)
+    # Solo se guarda el audio completo: si el cliente corta el stream no se llega aquí
+    await asyncio.to_thread(phrase_cache.put, text, b"".join(chunks), TTS_VOICE, TTS_MODEL, response_format)
+
+def answer_audio_stream(chat_inputs: dict, response_format: str):
+    """Encadena el flujo de tokens de la cadena con el TTS frase a frase."""
+    tokens = chain.astream(chat_inputs)
+    return stream_speech(
+        split_sentences(tokens),
+        lambda sentence: text_to_speech_stream(sentence, response_format),
+    )
+
+async def speech_to_text_internal(audio: bytes, filename: str = "audio.webm") -> Tuple[str, dict]:
+    """Transcribe el audio (en memoria) con Whisper; devuelve el texto y el informe de bytes y latencias."""
     try:
-        print(file_path)
-        with open(file_path, "rb") as file:
-        # Detecta el texto del audio
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=file,
-                response_format="text",
-                prompt="Alvearium, alvea"
-            )
-
-        return transcription
-    
+        with stage_metrics.in_flight("stt_in_flight"):
+            transcription, report = await stt.transcribe(async_client, audio, filename)
     except Exception as e:
+        stage_metrics.increment("stt_errors")
         raise Exception(f"Error en la transcripción de voz a texto: {e}")
-    
+    return transcription, report
+
 # Ruta para la grabación de audio
 @app.post("/record_audio")
 async def record_audio_endpoint(duration: int = 10):
+    if not MICROPHONE_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Este servidor no tiene pyaudio: la grabación desde el micrófono no está disponible.")
     file_path = os.path.join(UPLOAD_DIRECTORY, "recorded_audio.mp3")
-    file_content = record_audio(file_path, duration)
+    # La grabación es bloqueante, se ejecuta en un hilo aparte
+    file_content = await asyncio.to_thread(record_audio, file_path, duration)
 
     with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_audio_file:
         tmp_audio_file.write(bytes(file_content))
@@ -281,69 +616,282 @@ async def record_audio_endpoint(duration: int = 10):
 
 @app.post("/answer")
 async def get_answer(request_body: dict):
-    global global_chat_history
-    
     # Extraer la pregunta del cuerpo de la solicitud
     question = request_body.get("text")  # Cambiado de "question" a "text"
     if not question:
         raise HTTPException(status_code=400, detail="Transcripción no proporcionada en el cuerpo de la solicitud.")
     
-    # Extraer el historial de chat del cuerpo de la solicitud, o usar una lista vacía si no está presente
-    chat_history = request_body.get("chat_history", [])
+    # Extraer el historial de chat del cuerpo de la solicitud o, si no está presente, el de la sesión
+    session_id = request_body.get("session_id") or uuid.uuid4().hex
+    chat_inputs = await _session_inputs(request_body, session_id)
     
-    # Llama a tu lógica existente para obtener la respuesta
-    with get_openai_callback() as cb:
-        answer = chain.invoke({"chat_history": chat_history, "question": question})  # Cambiado "respuesta" por "answer"
-        print(cb)
-        # Si ocurrió algún error al obtener la respuesta, lanza una excepción HTTP
-        if not answer:
-            raise HTTPException(status_code=500, detail="Error al procesar la pregunta")
+    # Llama a tu lógica existente para obtener la respuesta (o la de una pregunta equivalente ya contestada);
+    # los tokens y el coste de cada llamada al modelo se cuentan en /metrics
+    entry = await cached_answer(chat_inputs)
+    # Si ocurrió algún error al obtener la respuesta, lanza una excepción HTTP
+    if entry is None:
+        raise HTTPException(status_code=500, detail="Error al procesar la pregunta")
+    answer = entry.answer
     
-    # Convertir la respuesta del chatbot a audio utilizando la función text_to_speech
-    file_path = os.path.join(UPLOAD_DIRECTORY, "respuesta.mp3")
-    audio_content = text_to_speech(answer, file_path)
+    # Convertir la respuesta del chatbot a audio utilizando la función text_to_speech,
+    # con un identificador propio para que respuestas simultáneas no se pisen.
+    # Solo se guarda el MP3 del TTS; el WAV se genera cuando un cliente lo pide.
+    # Si la respuesta viene de la caché y su audio sigue disponible, se reutiliza.
+    audio_id = entry.audio_id
+    if audio_id is None or audio_store.resolve(f"{audio_id}.{transcoder.SOURCE_FORMAT}") is None:
+        audio_content = await text_to_speech(answer)
+        audio_id = await asyncio.to_thread(audio_store.put, audio_content, transcoder.SOURCE_FORMAT)
+        entry.audio_id = audio_id
+        await asyncio.to_thread(audio_store.evict)
 
     
-    # Actualizar el historial de chat global con la nueva conversación
-    global_chat_history.append(("Usuario", question))
-    global_chat_history.append(("Asistente", answer))
+    # Actualizar el historial de la sesión con la nueva conversación
+    await asyncio.to_thread(session_store.append, session_id, question, answer)
     
     base_url = "https://mwy0tuecpg.execute-api.eu-central-1.amazonaws.com"
 
     # Construir la URL completa del archivo de audio
-    audio_file_path_mp3 = "audio_files/respuesta.mp3"
+    audio_file_path_mp3 = f"audio_files/{audio_id}.mp3"
     audio_url_mp3 = f"{base_url}/{audio_file_path_mp3}"
 
-    audio_file_path_wav = "audio_files/respuesta.wav"
+    audio_file_path_wav = f"audio_files/{audio_id}.wav"
     audio_url_wav = f"{base_url}/{audio_file_path_wav}"
-    
-    # Codificar el contenido de audio a Base64
-    audio_base64 = base64.b64encode(audio_content).decode('utf-8')
 
     response_data = {
         "audio_url_mp3": audio_url_mp3,  # Cambiado de "audio_base64" a "audio_url"
         "text_response": answer,
         "audio_url_wav": audio_url_wav,
+        "audio_id": audio_id,
+        "session_id": session_id,
     }
 
     # Devolver el contenido del archivo temporal como respuesta
     return JSONResponse(content=response_data)
 
-@app.post("/speech_to_text")
-async def stt_endpoint(file: UploadFile = File(...)):
+@app.post("/answer/stream_audio")
+async def stream_answer_audio(request_body: dict):
+    """Devuelve el audio de la respuesta en una respuesta HTTP por fragmentos (chunked)."""
+    question = request_body.get("text")
+    if not question:
+        raise HTTPException(status_code=400, detail="Transcripción no proporcionada en el cuerpo de la solicitud.")
+    response_format = request_body.get("format", "mp3")
+    if response_format not in STREAM_AUDIO_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato de audio no soportado: {response_format}")
+    session_id = request_body.get("session_id") or uuid.uuid4().hex
+    chat_inputs = await _session_inputs(request_body, session_id)
+
+    async def body():
+        sentences = []
+        async for index, sentence, chunk in answer_audio_stream(chat_inputs, response_format):
+            if index == len(sentences):
+                sentences.append(sentence)
+            yield chunk
+        await asyncio.to_thread(session_store.append, session_id, question, " ".join(sentences))
+
+    return StreamingResponse(
+        body(),
+        media_type=STREAM_AUDIO_FORMATS[response_format],
+        headers={"X-Session-Id": session_id},
+    )
+
+@app.websocket("/ws/answer")
+async def websocket_answer(websocket: WebSocket):
+    """Streaming de la respuesta por WebSocket.
+
+    El cliente envía {"text": ..., "session_id": ..., "format": "mp3" | "pcm" | ...}.
+    Por cada frase el servidor envía un mensaje JSON {"type": "sentence", "index", "text"}
+    seguido de uno o varios mensajes binarios con su audio, y al terminar
+    {"type": "end", "text_response": ..., "session_id": ...}. Si el cliente no envía
+    session_id, toda la conexión comparte una sesión nueva.
+    """
+    await websocket.accept()
+    connection_session_id = uuid.uuid4().hex
     try:
-        # Guardar el archivo de audio en el directorio de almacenamiento
-        file_path = os.path.join(UPLOAD_DIRECTORY, file.filename)
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
+        while True:
+            request_body = await websocket.receive_json()
+            question = request_body.get("text")
+            response_format = request_body.get("format", "mp3")
+            if not question or response_format not in STREAM_AUDIO_FORMATS:
+                await websocket.send_json({"type": "error", "detail": "Petición no válida"})
+                continue
+
+            session_id = request_body.get("session_id") or connection_session_id
+            chat_inputs = await _session_inputs(request_body, session_id)
+
+            sentences = []
+            try:
+                async for index, sentence, chunk in answer_audio_stream(chat_inputs, response_format):
+                    if index == len(sentences):
+                        sentences.append(sentence)
+                        await websocket.send_json({"type": "sentence", "index": index, "text": sentence})
+                    await websocket.send_bytes(chunk)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+
+            answer = " ".join(sentences)
+            await asyncio.to_thread(session_store.append, session_id, question, answer)
+            await websocket.send_json({"type": "end", "text_response": answer, "session_id": session_id})
+    except WebSocketDisconnect:
+        pass
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+async def _transcribe_question(audio: bytes, filename: str) -> Tuple[str, dict]:
+    """STT de /converse: transcribe el audio y rechaza las grabaciones sin voz."""
+    if not audio:
+        raise HTTPException(status_code=400, detail="Audio vacío.")
+    try:
+        question, report = await speech_to_text_internal(audio, filename)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    question = question.strip()
+    if not question:
+        raise HTTPException(status_code=422, detail="No se ha reconocido ninguna pregunta en el audio.")
+    return question, report
+
+async def converse_events(question: str, chat_inputs: dict, session_id: str, response_format: str, start: float, timings: dict):
+    """Respuesta de /converse como secuencia de eventos: tokens, frases y audio (bytes).
 
-        # Llamar a la función de transcripción de voz a texto con la ruta del archivo
-        transcription = await speech_to_text_internal(file_path)
+    Completa `timings` con las latencias desde el inicio de la petición (primer
+    token, primer audio y total) y termina con el evento "end", que las incluye.
+    """
+    tokens = []
+    sentences = 0
+    events = stream_answer(chain.astream(chat_inputs), lambda sentence: text_to_speech_stream(sentence, response_format))
+    async for event in events:
+        if event[0] == "token":
+            if not tokens:
+                timings["first_token_ms"] = _elapsed_ms(start)
+            tokens.append(event[1])
+            yield {"type": "token", "text": event[1]}
+            continue
+        _, index, sentence, chunk = event
+        if index == sentences:
+            sentences += 1
+            yield {"type": "sentence", "index": index, "text": sentence}
+        if "first_audio_ms" not in timings:
+            timings["first_audio_ms"] = _elapsed_ms(start)
+            stage_metrics.observe("converse_first_audio", timings["first_audio_ms"] / 1000)
+        yield chunk
 
-        # Eliminar el archivo después de procesarlo si es necesario
-        os.remove(file_path)
+    answer = "".join(tokens).strip()
+    await asyncio.to_thread(session_store.append, session_id, question, answer)
+    timings["total_ms"] = _elapsed_ms(start)
+    stage_metrics.observe("converse", timings["total_ms"] / 1000)
+    yield {"type": "end", "text_response": answer, "session_id": session_id, "timings": timings}
 
-        return {"text": transcription}
+@app.post("/converse")
+async def converse(
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    response_format: str = Form("mp3", alias="format"),
+):
+    """Voz a voz en una sola petición: STT, cadena y TTS en el servidor.
+
+    La respuesta es NDJSON (un evento JSON por línea) que se envía a medida que
+    hay datos: {"type": "transcript", "text", "session_id", "stt"}, después
+    {"type": "token", "text"} por cada token, {"type": "sentence", "index", "text"}
+    al empezar cada frase y {"type": "audio", "index", "data"} con el audio en
+    base64, y por último {"type": "end", "text_response", "session_id", "timings"}.
+
+    La latencia del STT va en la cabecera Server-Timing (se conoce antes de
+    empezar a responder); el desglose completo (stt_ms, first_token_ms,
+    first_audio_ms, total_ms) va en el evento "end", que hace de trailer.
+    """
+    start = time.perf_counter()
+    if response_format not in STREAM_AUDIO_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato de audio no soportado: {response_format}")
+    question, report = await _transcribe_question(await file.read(), file.filename)
+    session_id = session_id or uuid.uuid4().hex
+    chat_inputs = await _session_inputs({"text": question}, session_id)
+    timings = {"stt_ms": _elapsed_ms(start)}
+
+    async def body():
+        yield json.dumps({"type": "transcript", "text": question, "session_id": session_id, "stt": report}, ensure_ascii=False) + "\n"
+        index = 0
+        try:
+            async for event in converse_events(question, chat_inputs, session_id, response_format, start, timings):
+                if isinstance(event, bytes):
+                    event = {"type": "audio", "index": index, "data": base64.b64encode(event).decode("ascii")}
+                elif event["type"] == "sentence":
+                    index = event["index"]
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            # Las cabeceras ya se han enviado: el error se comunica como un evento más
+            yield json.dumps({"type": "error", "detail": str(e), "timings": timings}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson",
+        headers={
+            "X-Session-Id": session_id,
+            "Server-Timing": f"stt;dur={timings['stt_ms']}",
+        },
+    )
+
+@app.websocket("/ws/converse")
+async def websocket_converse(websocket: WebSocket):
+    """/converse por WebSocket.
+
+    El cliente puede enviar un mensaje JSON {"session_id", "format", "filename"}
+    con la configuración de los siguientes turnos, y envía cada pregunta como un
+    mensaje binario con el audio grabado. El servidor responde con
+    {"type": "transcript", ...}, los eventos "token" y "sentence" de /converse, el
+    audio de cada frase en mensajes binarios y {"type": "end", ..., "timings"}.
+    """
+    await websocket.accept()
+    config = {"session_id": uuid.uuid4().hex, "format": "mp3", "filename": "audio.webm"}
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is not None:
+                try:
+                    update = json.loads(message["text"])
+                except ValueError:
+                    update = None
+                if not isinstance(update, dict) or update.get("format", config["format"]) not in STREAM_AUDIO_FORMATS:
+                    await websocket.send_json({"type": "error", "detail": "Configuración no válida"})
+                    continue
+                config.update({key: value for key, value in update.items() if key in config and value})
+                continue
+
+            start = time.perf_counter()
+            try:
+                question, report = await _transcribe_question(message.get("bytes") or b"", config["filename"])
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "detail": e.detail})
+                continue
+            session_id = config["session_id"]
+            chat_inputs = await _session_inputs({"text": question}, session_id)
+            timings = {"stt_ms": _elapsed_ms(start)}
+            await websocket.send_json({"type": "transcript", "text": question, "session_id": session_id, "stt": report})
+            try:
+                async for event in converse_events(question, chat_inputs, session_id, config["format"], start, timings):
+                    if isinstance(event, bytes):
+                        await websocket.send_bytes(event)
+                    else:
+                        await websocket.send_json(event)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": str(e), "timings": timings})
+    except WebSocketDisconnect:
+        pass
+
+@app.post("/speech_to_text")
+async def stt_endpoint(file: UploadFile = File(...)):
+    try:
+        # El audio no pasa por audio_files/: UploadFile lo mantiene en memoria (SpooledTemporaryFile),
+        # así que subidas simultáneas con el mismo nombre de fichero no se pisan
+        audio = await file.read()
+        transcription, report = await speech_to_text_internal(audio, file.filename)
+        return {"text": transcription, "stt": report}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -353,34 +901,165 @@ def delete_file(path: str):
 
 # Ruta para la conversión de texto a voz (TTS)
 @app.post("/text_to_speech")
-async def generate_speech(text: str) -> bytes:
+async def generate_speech(text: str):
     try:
-        response = text_to_speech(text)  # Llama a la función para generar el audio
-        
-        # Lee el contenido del archivo temporal
-        audio_content = response.read()
+        audio_content = await text_to_speech(text)  # Llama a la función para generar el audio
 
         # Devuelve el contenido de audio como respuesta
-        return audio_content
+        return Response(content=audio_content, media_type="audio/mpeg")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Ruta para ver el historial del chat
 @app.get("/chat_history")
-async def view_chat_history():
-    global global_chat_history
-    # La función `view_chat_history` devuelve el historial global del chat
-    return {"chat_history": global_chat_history}
+async def view_chat_history(session_id: str, offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100)):
+    # Devuelve una página del historial de la sesión como pares (interlocutor, mensaje)
+    turns = await asyncio.to_thread(session_store.history, session_id)
+    messages = []
+    for human, ai in turns[offset:offset + limit]:
+        messages.append(("Usuario", human))
+        messages.append(("Asistente", ai))
+    return {
+        "session_id": session_id,
+        "chat_history": messages,
+        "offset": offset,
+        "limit": limit,
+        "total": len(turns),
+    }
+
+# Latencias por etapa del pipeline de respuesta
+@app.get("/metrics/stages")
+async def view_stage_metrics():
+    return stage_metrics.summary()
+
+# Estado de cachés, índice y pool de conexiones para /metrics
+def _embedding_cache_counts():
+    if not get_embeddings.cache_info().currsize:
+        return None
+    embeddings = get_embeddings()
+    hits, misses = getattr(embeddings, "hits", None), getattr(embeddings, "misses", None)
+    return None if hits is None else (hits, misses)
+
+def _collect_gauges() -> dict:
+    """Valores instantáneos (ratios, tamaños, peticiones en curso), calculados en cada consulta a /metrics."""
+    gauges = {}
+    cache = answer_cache.stats()
+    gauges["answer_cache_entries"] = cache["entries"]
+    gauges["answer_cache_hit_ratio"] = cache["hit_rate"]
+    gauges["intent_short_circuit_ratio"] = intent_router.stats()["short_circuit_share"]
+    phrases = phrase_cache.stats()
+    gauges.update({
+        "phrase_cache_hit_ratio": phrases["hit_rate"],
+        "phrase_cache_memory_bytes": phrases["memory_bytes"],
+    })
+    counts = _embedding_cache_counts()
+    if counts is not None:
+        hits, misses = counts
+        gauges["embedding_cache_hit_ratio"] = hits / (hits + misses) if hits + misses else 0.0
+    pool = pool_stats()
+    gauges.update({
+        "openai_pool_in_flight": pool["in_flight"],
+        "openai_pool_peak_in_flight": pool["peak_in_flight"],
+        "openai_pool_saturation": pool["saturation"],
+        "openai_pool_mean_wait_seconds": pool["mean_pool_wait_ms"] / 1000,
+    })
+    loaded = index_manager.current
+    gauges["index_vectors"] = loaded.vectorstore.index.ntotal if loaded is not None else 0
+    return gauges
+
+def _collect_counters() -> dict:
+    """Totales acumulados desde el arranque; Prometheus los recibe como counters (`*_total`)."""
+    cache = answer_cache.stats()
+    phrases = phrase_cache.stats()
+    pool = pool_stats()
+    counters = {
+        "answer_cache_hits": cache["hits"],
+        "answer_cache_misses": cache["misses"],
+        "phrase_cache_hits": phrases["hits"],
+        "phrase_cache_misses": phrases["misses"],
+        "openai_pool_new_connections": pool.get("new_connections", 0),
+        "openai_pool_retries": pool.get("retries", 0),
+        "index_reloads": index_manager.reloads,
+    }
+    counts = _embedding_cache_counts()
+    if counts is not None:
+        counters["embedding_cache_hits"], counters["embedding_cache_misses"] = counts
+    return counters
+
+stage_metrics.register_collector(_collect_gauges)
+stage_metrics.register_counter_collector(_collect_counters)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Métricas en formato Prometheus: latencias por etapa, tokens, coste, cachés y peticiones en curso."""
+    return Response(stage_metrics.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/metrics/http_pool")
+async def view_http_pool_metrics():
+    """Uso del pool de conexiones con OpenAI: peticiones en curso, saturación, esperas y reintentos."""
+    return pool_stats()
+
+@app.get("/answer_cache/stats")
+async def answer_cache_stats():
+    return answer_cache.stats()
+
+@app.get("/phrase_cache/stats")
+async def phrase_cache_stats():
+    return phrase_cache.stats()
+
+@app.get("/intent_router/stats")
+async def intent_router_stats():
+    """Parte del tráfico contestada con plantillas, por intención y por etapa; las latencias
+    de cada camino están en /metrics/stages (answer_short_circuit y answer_pipeline)."""
+    return intent_router.stats()
+
+# Vaciar la caché de respuestas (p. ej. tras cambiar las plantillas)
+@app.delete("/answer_cache")
+async def clear_answer_cache():
+    answer_cache.clear()
+    return answer_cache.stats()
+
+def _require_admin(token: Optional[str]) -> None:
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Token de administración no válido.")
+
+@app.post("/admin/index/reload")
+async def reload_index(x_admin_token: Optional[str] = Header(None)):
+    """Carga en segundo plano el índice publicado y lo activa para las peticiones nuevas."""
+    _require_admin(x_admin_token)
+    try:
+        reloaded = await index_manager.reload(force=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo cargar el índice, se mantiene el anterior: {e}")
+    return {"reloaded": reloaded, **index_manager.status()}
+
+@app.get("/index/status")
+async def index_status():
+    return index_manager.status()
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Listo cuando hay un índice cargado; mientras tanto 503 (con el error si la carga falló)."""
+    if index_manager.current is None:
+        return JSONResponse(status_code=503, content={"status": "starting", "last_error": index_manager.last_error})
+    return {"status": "ready", "index_version": index_manager.current.version}
 
 # Ruta para servir archivos de audio
 @app.get("/audio_files/{file_name}")
-async def get_audio_file(file_name: str):
-    file_path = os.path.join("audio_files", file_name)
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="audio/mpeg")
-    else:
-        return {"error": "Archivo no encontrado"}
+async def get_audio_file(file_name: str, range_header: Optional[str] = Header(None, alias="Range")):
+    resolved = audio_store.resolve(file_name)
+    if resolved is None:
+        # Formatos derivados (p. ej. WAV) se generan solo la primera vez que se piden
+        resolved = await transcoder.materialize(audio_store, file_name)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    file_path, media_type = resolved
+    return await asyncio.to_thread(range_response, file_path, media_type, range_header)
 
 # Manejar solicitudes para el ícono de favicon
 @app.get("/favicon.ico", include_in_schema=False)
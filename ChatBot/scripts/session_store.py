@@ -0,0 +1,166 @@
+import time
+import sqlite3
+import threading
+from collections import deque
+from typing import List, Tuple
+
+# Intervalo mínimo entre dos barridos de sesiones inactivas
+_EVICTION_INTERVAL_SECONDS = 60
+
+
+def format_turn(human: str, ai: str) -> str:
+    """Formatea un turno de conversación tal y como lo espera CONDENSE_QUESTION_PROMPT."""
+    return "\n" + "\n".join(["Human: " + human, "Assistant: " + ai])
+
+
+class _Session:
+    __slots__ = ("turns", "formatted", "last_seen")
+
+    def __init__(self, max_turns: int) -> None:
+        self.turns = deque(maxlen=max_turns)
+        self.formatted = ""
+        self.last_seen = time.time()
+
+
+class InMemorySessionStore:
+    """Historial por sesión en memoria: búfer circular de turnos y texto formateado incremental."""
+
+    def __init__(self, max_turns: int, idle_seconds: float) -> None:
+        self.max_turns = max_turns
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+
+    def append(self, session_id: str, human: str, ai: str) -> None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_turns)
+            if len(session.turns) == self.max_turns:
+                # El turno más antiguo sale del búfer: se quita su prefijo del texto formateado
+                oldest = session.turns[0]
+                session.formatted = session.formatted[len(format_turn(*oldest)):]
+            session.turns.append((human, ai))
+            session.formatted += format_turn(human, ai)
+            session.last_seen = time.time()
+        self._maybe_evict()
+
+    def history(self, session_id: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session.last_seen = time.time()
+            return list(session.turns)
+
+    def formatted_history(self, session_id: str) -> str:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.formatted if session is not None else ""
+
+    def evict_idle(self) -> int:
+        deadline = time.time() - self.idle_seconds
+        with self._lock:
+            idle = [session_id for session_id, session in self._sessions.items() if session.last_seen < deadline]
+            for session_id in idle:
+                del self._sessions[session_id]
+            self._last_eviction = time.time()
+        return len(idle)
+
+    def _maybe_evict(self) -> None:
+        if time.time() - self._last_eviction > _EVICTION_INTERVAL_SECONDS:
+            self.evict_idle()
+
+
+class SQLiteSessionStore:
+    """Mismo comportamiento que InMemorySessionStore, persistido en SQLite.
+
+    Permite que varios workers de uvicorn compartan las sesiones a través del mismo fichero.
+    """
+
+    def __init__(self, path: str, max_turns: int, idle_seconds: float) -> None:
+        self.max_turns = max_turns
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, formatted TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, human TEXT NOT NULL, ai TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, seq))"
+        )
+
+    def append(self, session_id: str, human: str, ai: str) -> None:
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                row = cursor.execute("SELECT formatted FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                formatted = row[0] if row else ""
+                seq = cursor.execute(
+                    "SELECT COALESCE(MAX(seq), -1) + 1 FROM turns WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                cursor.execute("INSERT INTO turns VALUES (?, ?, ?, ?)", (session_id, seq, human, ai))
+                formatted += format_turn(human, ai)
+
+                dropped = cursor.execute(
+                    "SELECT seq, human, ai FROM turns WHERE session_id = ? ORDER BY seq DESC LIMIT -1 OFFSET ?",
+                    (session_id, self.max_turns),
+                ).fetchall()
+                for old_seq, old_human, old_ai in sorted(dropped):
+                    formatted = formatted[len(format_turn(old_human, old_ai)):]
+                    cursor.execute("DELETE FROM turns WHERE session_id = ? AND seq = ?", (session_id, old_seq))
+
+                cursor.execute(
+                    "INSERT INTO sessions VALUES (?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET formatted = excluded.formatted, last_seen = excluded.last_seen",
+                    (session_id, formatted, time.time()),
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        self._maybe_evict()
+
+    def history(self, session_id: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            self._conn.execute("UPDATE sessions SET last_seen = ? WHERE session_id = ?", (time.time(), session_id))
+            rows = self._conn.execute(
+                "SELECT human, ai FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def formatted_history(self, session_id: str) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT formatted FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else ""
+
+    def evict_idle(self) -> int:
+        deadline = time.time() - self.idle_seconds
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM turns WHERE session_id IN (SELECT session_id FROM sessions WHERE last_seen < ?)",
+                (deadline,),
+            )
+            removed = self._conn.execute("DELETE FROM sessions WHERE last_seen < ?", (deadline,)).rowcount
+            self._last_eviction = time.time()
+        return removed
+
+    def _maybe_evict(self) -> None:
+        if time.time() - self._last_eviction > _EVICTION_INTERVAL_SECONDS:
+            self.evict_idle()
+
+
+def create_session_store(backend: str, max_turns: int, idle_seconds: float, path: str = "sessions.sqlite3"):
+    """Crea el almacén de sesiones: "memory" (por proceso) o "sqlite" (compartido entre workers)."""
+    if backend == "memory":
+        return InMemorySessionStore(max_turns, idle_seconds)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, max_turns, idle_seconds)
+    raise ValueError(f"Backend de sesiones no soportado: {backend}")
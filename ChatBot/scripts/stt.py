@@ -0,0 +1,76 @@
+import os
+import time
+import shutil
+from typing import Tuple
+from transcoder import run_ffmpeg
+from metrics import stage_metrics
+
+STT_MODEL = "whisper-1"
+STT_PROMPT = "Alvearium, alvea"
+
+# Normalización previa a la transcripción (opcional, STT_NORMALIZE=1): mono 16 kHz (lo que usa Whisper
+# internamente), silencios recortados y Opus a baja tasa, para subir menos bytes y menos segundos de audio.
+# Cuesta un proceso de ffmpeg por subida, así que solo compensa con grabaciones largas o sin comprimir
+STT_NORMALIZE = os.environ.get("STT_NORMALIZE", "0") == "1"
+STT_SAMPLE_RATE = 16000
+STT_BITRATE = "24k"
+# Silencio: por debajo de -45 dB; se eliminan los tramos de más de 0.6 s dejando 0.3 s
+_SILENCE_FILTER = (
+    "silenceremove=start_periods=1:start_threshold=-45dB:start_silence=0.1"
+    ":stop_periods=-1:stop_duration=0.6:stop_threshold=-45dB:stop_silence=0.3"
+)
+
+
+async def normalize_audio(audio: bytes) -> bytes:
+    """Convierte el audio a Ogg/Opus mono de 16 kHz sin silencios largos, en memoria."""
+    return await run_ffmpeg([
+        "-i", "pipe:0",
+        "-af", _SILENCE_FILTER,
+        "-ac", "1", "-ar", str(STT_SAMPLE_RATE),
+        "-c:a", "libopus", "-b:a", STT_BITRATE, "-application", "voip",
+        "-f", "ogg", "pipe:1",
+    ], input_bytes=audio)
+
+
+async def transcribe(client, audio: bytes, filename: str = "audio.webm", normalize: bool = STT_NORMALIZE) -> Tuple[str, dict]:
+    """Transcribe audio en memoria con el cliente asíncrono de OpenAI.
+
+    Devuelve el texto y un informe con los bytes recibidos y enviados y la
+    latencia de cada etapa. Si la normalización falla (o no hay ffmpeg) o no
+    reduce el tamaño, se envía el audio original.
+    """
+    report = {"bytes_in": len(audio), "normalized": False}
+    upload = (os.path.basename(filename or "audio.webm"), audio)
+
+    if normalize and audio and shutil.which("ffmpeg"):
+        start = time.perf_counter()
+        try:
+            normalized = await normalize_audio(audio)
+        except RuntimeError as e:
+            print(f"No se pudo normalizar el audio, se envía el original: {e}")
+        else:
+            # Un audio que solo contiene silencio queda vacío, y uno corto ya comprimido puede
+            # crecer al recodificarlo: en ambos casos se transcribe el original
+            if normalized and len(normalized) < len(audio):
+                upload = ("audio.ogg", normalized)
+                report["normalized"] = True
+        elapsed = time.perf_counter() - start
+        stage_metrics.observe("stt_normalize", elapsed)
+        report["normalize_ms"] = round(elapsed * 1000, 1)
+
+    report["bytes_sent"] = len(upload[1])
+    report["bytes_saved"] = report["bytes_in"] - report["bytes_sent"]
+    stage_metrics.increment("stt_bytes_in", report["bytes_in"])
+    stage_metrics.increment("stt_bytes_sent", report["bytes_sent"])
+
+    start = time.perf_counter()
+    transcription = await client.audio.transcriptions.create(
+        model=STT_MODEL,
+        file=upload,
+        response_format="text",
+        prompt=STT_PROMPT,
+    )
+    elapsed = time.perf_counter() - start
+    stage_metrics.observe("stt", elapsed)
+    report["transcribe_ms"] = round(elapsed * 1000, 1)
+    return transcription, report
@@ -0,0 +1,113 @@
+import io
+import wave
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from metrics import stage_metrics
+
+# Formato WAV que espera el cliente de Unreal: PCM 16 bits, 44.1 kHz, estéreo
+WAV_SAMPLE_RATE = 44100
+WAV_CHANNELS = 2
+
+# Formato que se pide directamente al backend TTS y a partir del cual se generan los demás
+SOURCE_FORMAT = "mp3"
+
+
+class _KeyLock:
+    """Cerrojo por clave que cuenta cuántas peticiones lo esperan o lo tienen."""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+
+
+_locks: Dict[str, _KeyLock] = {}
+
+
+async def run_ffmpeg(args: List[str], input_bytes: bytes = None) -> bytes:
+    """Ejecuta ffmpeg sin bloquear el bucle de eventos y devuelve su stdout."""
+    start = time.perf_counter()
+    with stage_metrics.in_flight("ffmpeg_in_flight"):
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-loglevel", "error", *args,
+            stdin=asyncio.subprocess.PIPE if input_bytes is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate(input=input_bytes)
+    stage_metrics.observe("ffmpeg", time.perf_counter() - start)
+    if process.returncode != 0:
+        stage_metrics.increment("ffmpeg_errors")
+        raise RuntimeError(f"ffmpeg terminó con código {process.returncode}: {stderr.decode(errors='ignore')}")
+    return stdout
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int, channels: int, sample_width: int = 2) -> bytes:
+    """Añade la cabecera WAV a un bloque PCM en memoria."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+async def to_wav(audio: bytes) -> bytes:
+    """Convierte audio comprimido a WAV con una única llamada a ffmpeg de tubería a tubería.
+
+    ffmpeg solo decodifica y remuestrea a PCM crudo; la cabecera WAV se escribe en
+    proceso para que los tamaños sean correctos (ffmpeg no puede rellenarlos al
+    escribir en una tubería).
+    """
+    pcm = await run_ffmpeg([
+        "-i", "pipe:0",
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ar", str(WAV_SAMPLE_RATE), "-ac", str(WAV_CHANNELS),
+        "pipe:1",
+    ], input_bytes=audio)
+    return pcm_to_wav(pcm, WAV_SAMPLE_RATE, WAV_CHANNELS)
+
+
+# Conversores disponibles desde SOURCE_FORMAT, se aplican solo cuando un cliente pide ese formato
+CONVERTERS = {
+    "wav": to_wav,
+}
+
+
+async def materialize(store, file_name: str) -> Optional[Tuple[str, str]]:
+    """Genera bajo demanda un formato derivado a partir del audio original del almacén."""
+    parsed = store.parse(file_name)
+    if parsed is None:
+        return None
+    audio_id, extension = parsed
+    if extension not in CONVERTERS:
+        return None
+
+    key_lock = _locks.setdefault(file_name, _KeyLock())
+    key_lock.waiters += 1
+    try:
+        async with key_lock.lock:
+            # Otra petición puede haberlo generado mientras esperábamos
+            resolved = store.resolve(file_name)
+            if resolved is not None:
+                return resolved
+
+            source = store.resolve(f"{audio_id}.{SOURCE_FORMAT}")
+            if source is None:
+                return None
+            source_audio = await asyncio.to_thread(_read_file, source[0])
+            converted = await CONVERTERS[extension](source_audio)
+            await asyncio.to_thread(store.put, converted, extension, audio_id)
+            return store.resolve(file_name)
+    finally:
+        # Al liberarse, el cerrojo aparece libre aunque haya peticiones esperando: solo se
+        # elimina cuando no queda ninguna, para que una nueva no cree otro y convierta en paralelo
+        key_lock.waiters -= 1
+        if key_lock.waiters == 0:
+            _locks.pop(file_name, None)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
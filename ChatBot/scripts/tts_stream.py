@@ -0,0 +1,131 @@
+import re
+import asyncio
+from typing import AsyncIterator, Callable, Tuple
+
+# Fin de frase: puntuación final seguida de espacio (evita cortar en "3.5" o en URLs)
+_SENTENCE_END = re.compile(r"([.!?…]+[\"'»”)]*)(\s+)")
+
+# Longitud mínima de una frase antes de mandarla al TTS, para no sintetizar fragmentos sueltos
+MIN_SENTENCE_CHARS = 20
+
+
+async def split_sentences(tokens: AsyncIterator[str], min_chars: int = MIN_SENTENCE_CHARS) -> AsyncIterator[str]:
+    """Agrupa el flujo de tokens del LLM en frases completas."""
+    buffer = ""
+    async for token in tokens:
+        buffer += token
+        while True:
+            boundary = None
+            for match in _SENTENCE_END.finditer(buffer):
+                if match.end(1) >= min_chars:
+                    boundary = match
+                    break
+            if boundary is None:
+                break
+            sentence = buffer[:boundary.end(1)].strip()
+            buffer = buffer[boundary.end():]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def stream_speech(
+    sentences: AsyncIterator[str],
+    synthesize: Callable[[str], AsyncIterator[bytes]],
+    prefetch: int = 2,
+) -> AsyncIterator[Tuple[int, str, bytes]]:
+    """Sintetiza cada frase en cuanto está completa y devuelve el audio en orden.
+
+    Produce tuplas (índice de frase, frase, fragmento de audio). Hasta `prefetch`
+    frases se sintetizan en paralelo mientras se reproduce la anterior.
+    """
+    pending = asyncio.Queue()
+    semaphore = asyncio.Semaphore(prefetch)
+    tasks = []
+
+    async def fetch(sentence: str, chunks: asyncio.Queue):
+        try:
+            async with semaphore:
+                async for chunk in synthesize(sentence):
+                    await chunks.put(chunk)
+        except Exception as e:
+            await chunks.put(e)
+        finally:
+            await chunks.put(None)
+
+    async def produce():
+        try:
+            index = 0
+            async for sentence in sentences:
+                chunks = asyncio.Queue()
+                tasks.append(asyncio.create_task(fetch(sentence, chunks)))
+                await pending.put((index, sentence, chunks))
+                index += 1
+        except Exception as e:
+            await pending.put(e)
+        finally:
+            await pending.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            index, sentence, chunks = item
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield index, sentence, chunk
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_answer(
+    tokens: AsyncIterator[str],
+    synthesize: Callable[[str], AsyncIterator[bytes]],
+    prefetch: int = 2,
+) -> AsyncIterator[tuple]:
+    """Como stream_speech, pero entregando también los tokens del texto según llegan.
+
+    Produce ("token", texto) por cada token del LLM y ("audio", índice de frase,
+    frase, fragmento) por cada fragmento de audio, intercalados en el orden en el
+    que están disponibles: el texto no espera a que se sintetice su frase.
+    """
+    events = asyncio.Queue()
+
+    async def tap():
+        async for token in tokens:
+            await events.put(("token", token))
+            yield token
+
+    async def speak():
+        audio = stream_speech(split_sentences(tap()), synthesize, prefetch)
+        try:
+            async for index, sentence, chunk in audio:
+                await events.put(("audio", index, sentence, chunk))
+        except Exception as e:
+            await events.put(e)
+        finally:
+            await audio.aclose()
+            await events.put(None)
+
+    speaker = asyncio.create_task(speak())
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    finally:
+        speaker.cancel()
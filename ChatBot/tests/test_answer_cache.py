@@ -0,0 +1,94 @@
+"""Pruebas de la caché semántica de respuestas: umbral, palabras con contenido, LRU, caducidad y versión del índice."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, content_words
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def with_similarity(similarity: float):
+    """Vector unitario cuya similitud coseno con (1, 0) es `similarity`."""
+    return vector(similarity, np.sqrt(1 - similarity ** 2))
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticAnswerCache(threshold=0.97, max_entries=3, ttl_seconds=60)
+    cache.set_index_version("v1")
+    return cache
+
+
+def test_hit_above_threshold(cache):
+    cache.add("¿A qué hora abre el lunes?", vector(1, 0), "A las 9.", index_version="v1")
+    entry = cache.lookup(with_similarity(0.99))
+    assert entry is not None and entry.answer == "A las 9."
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_miss_below_threshold(cache):
+    cache.add("¿A qué hora abre el lunes?", vector(1, 0), "A las 9.", index_version="v1")
+    assert cache.lookup(with_similarity(0.96)) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_different_entity_is_a_miss_even_with_a_close_embedding(cache):
+    cache.add("¿A qué hora abre el lunes?", vector(1, 0), "A las 9.", index_version="v1")
+    assert cache.lookup(with_similarity(0.99), "¿A qué hora abre el domingo?") is None
+    assert cache.lookup(with_similarity(0.99), "¿a que hora abre el LUNES") is not None
+
+
+def test_word_check_falls_back_to_the_next_candidate(cache):
+    cache.add("¿Cuánto cuesta la entrada?", vector(1, 0), "10 euros.", index_version="v1")
+    cache.add("¿Cuánto cuesta el parking?", with_similarity(0.98), "5 euros.", index_version="v1")
+    entry = cache.lookup(with_similarity(0.995), "¿Cuánto cuesta el parking?")
+    assert entry is not None and entry.answer == "5 euros."
+
+
+def test_content_words_ignore_stopwords_accents_and_punctuation():
+    assert content_words("¿Qué es Alvearium?") == {"alvearium"}
+    assert content_words("¿A qué hora abre el lunes?") == {"hora", "abre", "lunes"}
+
+
+def test_lru_evicts_the_least_recently_used(cache):
+    for i, name in enumerate(["uno", "dos", "tres"]):
+        cache.add(name, np.eye(4, dtype=np.float32)[i], name, index_version="v1")
+    assert cache.lookup(np.eye(4)[0]).answer == "uno"
+    cache.add("cuatro", np.eye(4, dtype=np.float32)[3], "cuatro", index_version="v1")
+    assert cache.stats()["entries"] == 3
+    assert cache.lookup(np.eye(4)[1]) is None
+    assert cache.lookup(np.eye(4)[0]).answer == "uno"
+
+
+def test_entries_expire_after_ttl(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache.add("¿Qué es Alvearium?", vector(1, 0), "Una colmena.", index_version="v1")
+    now[0] += 59
+    assert cache.lookup(vector(1, 0)) is not None
+    now[0] += 2
+    assert cache.lookup(vector(1, 0)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_new_index_version_clears_the_cache(cache):
+    cache.add("¿Qué es Alvearium?", vector(1, 0), "Una colmena.", index_version="v1")
+    cache.set_index_version("v1")
+    assert cache.lookup(vector(1, 0)) is not None
+    cache.set_index_version("v2")
+    assert cache.lookup(vector(1, 0)) is None
+    assert cache.stats()["index_version"] == "v2"
+
+
+def test_answers_from_a_previous_index_are_not_stored(cache):
+    cache.set_index_version("v2")
+    cache.add("¿Qué es Alvearium?", vector(1, 0), "Una colmena.", index_version="v1")
+    assert cache.stats()["entries"] == 0
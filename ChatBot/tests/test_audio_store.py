@@ -0,0 +1,117 @@
+"""Pruebas del almacén de audios: nombres, caducidad, desalojo, temporales y respuestas con Range."""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from audio_store import AudioStore, _parse_range, range_response
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AudioStore(str(tmp_path), ttl_seconds=60, max_bytes=1000)
+
+
+def age(path: str, seconds: float) -> None:
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def body(response) -> bytes:
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+
+def test_put_and_resolve(store):
+    audio_id = store.put(b"audio", "mp3")
+    file_path, media_type = store.resolve(f"{audio_id}.mp3")
+    assert media_type == "audio/mpeg"
+    with open(file_path, "rb") as f:
+        assert f.read() == b"audio"
+    assert not [name for name in os.listdir(store.directory) if name.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("file_name", ["../secreto.mp3", "respuesta.mp3", "0" * 32 + ".exe", "0" * 32 + ".mp3"])
+def test_resolve_rejects_unknown_names(store, file_name):
+    assert store.resolve(file_name) is None
+
+
+def test_expired_audio_is_not_served_and_is_evicted(store):
+    audio_id = store.put(b"audio", "mp3")
+    age(store.path(audio_id, "mp3"), 61)
+    assert store.resolve(f"{audio_id}.mp3") is None
+    assert store.evict() == 1
+    assert not os.path.exists(store.path(audio_id, "mp3"))
+
+
+def test_evict_removes_oldest_over_max_bytes(store):
+    ids = [store.put(b"x" * 400, "mp3") for _ in range(3)]
+    for seconds, audio_id in zip((30, 20, 10), ids):
+        age(store.path(audio_id, "mp3"), seconds)
+    assert store.evict() == 1
+    assert not os.path.exists(store.path(ids[0], "mp3"))
+    assert all(os.path.exists(store.path(audio_id, "mp3")) for audio_id in ids[1:])
+
+
+def test_stale_temporary_files_are_swept_at_startup(tmp_path):
+    stale, fresh = tmp_path / ("a" * 32 + ".mp3.1.2.tmp"), tmp_path / ("b" * 32 + ".mp3.1.2.tmp")
+    stale.write_bytes(b"x")
+    fresh.write_bytes(b"x")
+    age(str(stale), 600)
+    AudioStore(str(tmp_path))
+    assert not stale.exists() and fresh.exists()
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-3", (0, 3)),
+    ("bytes=4-", (4, 9)),
+    ("bytes=-3", (7, 9)),
+    ("bytes=5-100", (5, 9)),
+    ("bytes=-100", (0, 9)),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 10) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=-", "bytes=10-", "bytes=5-2", "items=0-1", "bytes=0-1,3-4"])
+def test_parse_range_rejects_invalid_ranges(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 10)
+
+
+def test_range_response_full_file(store):
+    audio_id = store.put(b"0123456789", "mp3")
+    response = range_response(store.path(audio_id, "mp3"), "audio/mpeg", None)
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "10"
+    assert body(response) == b"0123456789"
+
+
+def test_range_response_partial_content(store):
+    audio_id = store.put(b"0123456789", "mp3")
+    response = range_response(store.path(audio_id, "mp3"), "audio/mpeg", "bytes=2-5")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 2-5/10"
+    assert response.headers["content-length"] == "4"
+    assert body(response) == b"2345"
+
+
+def test_range_response_survives_eviction_while_sending(store):
+    audio_id = store.put(b"0123456789", "mp3")
+    response = range_response(store.path(audio_id, "mp3"), "audio/mpeg", "bytes=-4")
+    os.remove(store.path(audio_id, "mp3"))
+    assert body(response) == b"6789"
+
+
+def test_range_response_unsatisfiable(store):
+    audio_id = store.put(b"0123456789", "mp3")
+    with pytest.raises(HTTPException) as error:
+        range_response(store.path(audio_id, "mp3"), "audio/mpeg", "bytes=20-")
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */10"
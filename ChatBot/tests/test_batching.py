@@ -0,0 +1,156 @@
+"""Pruebas del micro-batching y de la coalescencia de llamadas simultáneas."""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from batching import Coalescer, MicroBatcher
+
+
+class Recorder:
+    """`process` de prueba: guarda cada lote y devuelve los elementos en mayúsculas."""
+
+    def __init__(self, delay: float = 0.0, error: Exception = None, results=None) -> None:
+        self.batches = []
+        self.delay = delay
+        self.error = error
+        self.results = results
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.results if self.results is not None else [item.upper() for item in items]
+
+
+def test_requests_in_the_same_window_share_a_batch():
+    process = Recorder()
+    batcher = MicroBatcher(process, window=0.01)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(text, text) for text in ["a", "b", "c"]))
+
+    assert asyncio.run(main()) == ["A", "B", "C"]
+    assert process.batches == [["a", "b", "c"]]
+
+
+def test_max_size_sends_the_batch_without_waiting_for_the_window():
+    process = Recorder()
+    batcher = MicroBatcher(process, window=10, max_size=2)
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(batcher.submit("a", "a"), batcher.submit("b", "b")), timeout=1)
+
+    assert asyncio.run(main()) == ["A", "B"]
+    assert process.batches == [["a", "b"]]
+
+
+def test_same_key_is_sent_once():
+    process = Recorder(delay=0.01)
+    batcher = MicroBatcher(process, window=0.01)
+
+    async def main():
+        first = asyncio.ensure_future(batcher.submit("a", "a"))
+        await asyncio.sleep(0.015)
+        # El lote ya está en curso: la misma clave espera su resultado
+        return await asyncio.gather(first, batcher.submit("a", "a"), batcher.submit("a", "a"))
+
+    assert asyncio.run(main()) == ["A", "A", "A"]
+    assert process.batches == [["a"]]
+
+
+def test_errors_reach_every_request_of_the_batch():
+    batcher = MicroBatcher(Recorder(error=RuntimeError("caído")), window=0.005)
+
+    async def main():
+        return await asyncio.gather(batcher.submit("a", "a"), batcher.submit("b", "b"), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_wrong_number_of_results_is_an_error():
+    batcher = MicroBatcher(Recorder(results=["solo uno"]), window=0.005)
+
+    async def main():
+        return await asyncio.gather(batcher.submit("a", "a"), batcher.submit("b", "b"), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main()))
+
+
+def test_a_cancelled_request_does_not_cancel_the_others():
+    batcher = MicroBatcher(Recorder(delay=0.01), window=0.005)
+
+    async def main():
+        cancelled = asyncio.ensure_future(batcher.submit("a", "a"))
+        waiting = asyncio.ensure_future(batcher.submit("a", "a"))
+        await asyncio.sleep(0.001)
+        cancelled.cancel()
+        return await waiting
+
+    assert asyncio.run(main()) == "A"
+
+
+def test_batcher_works_across_event_loops():
+    process = Recorder()
+    batcher = MicroBatcher(process, window=0.005)
+    assert asyncio.run(batcher.submit("a", "a")) == "A"
+    assert asyncio.run(batcher.submit("a", "a")) == "A"
+    assert process.batches == [["a"], ["a"]]
+
+
+def test_coalescer_runs_identical_calls_once():
+    coalescer = Coalescer("test")
+    calls = []
+
+    async def factory(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key * 2
+
+    async def main():
+        return await asyncio.gather(
+            coalescer.run("a", lambda: factory("a")),
+            coalescer.run("a", lambda: factory("a")),
+            coalescer.run("b", lambda: factory("b")),
+        )
+
+    assert asyncio.run(main()) == ["aa", "aa", "bb"]
+    assert sorted(calls) == ["a", "b"]
+    assert not coalescer._inflight
+
+
+def test_coalescer_survives_a_cancelled_caller():
+    coalescer = Coalescer("test")
+
+    async def factory():
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def main():
+        first = asyncio.ensure_future(coalescer.run("a", factory))
+        second = asyncio.ensure_future(coalescer.run("a", factory))
+        await asyncio.sleep(0.001)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_coalescer_propagates_errors_and_forgets_the_key():
+    coalescer = Coalescer("test")
+
+    async def failing():
+        raise ValueError("mal")
+
+    async def main():
+        with pytest.raises(ValueError):
+            await coalescer.run("a", failing)
+        await asyncio.sleep(0)
+        return coalescer._inflight
+
+    assert asyncio.run(main()) == {}
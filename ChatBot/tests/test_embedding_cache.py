@@ -0,0 +1,140 @@
+"""Pruebas de la caché de embeddings en disco: lectura, persistencia entre procesos, compactación y cerrojos."""
+import os
+import sys
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from embedding_cache import CachedEmbeddings, EmbeddingStore, cache_key, normalize_text
+
+DIMENSION = 8
+
+
+def key(i: int) -> bytes:
+    return cache_key("test", f"texto {i}")
+
+
+def vector(i: int) -> list:
+    return [float(i)] * DIMENSION
+
+
+def test_put_and_get(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many([key(1), key(2)], [vector(1), vector(2)])
+    first, missing, second = store.get_many([key(1), key(3), key(2)])
+    assert first.tolist() == vector(1) and second.tolist() == vector(2)
+    assert missing is None
+    assert len(store) == 2
+
+
+def test_repeated_keys_are_stored_once(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many([key(1)], [vector(1)])
+    store.put_many([key(1), key(2)], [vector(9), vector(2)])
+    assert len(store) == 2
+    assert store.get_many([key(1)])[0].tolist() == vector(1)
+
+
+def test_rows_written_by_another_instance_are_visible(tmp_path):
+    reader, writer = EmbeddingStore(str(tmp_path)), EmbeddingStore(str(tmp_path))
+    assert reader.get_many([key(1)]) == [None]
+    writer.put_many([key(1)], [vector(1)])
+    assert reader.get_many([key(1)])[0].tolist() == vector(1)
+
+
+def test_compaction_keeps_the_most_recently_used(tmp_path):
+    store = EmbeddingStore(str(tmp_path), max_entries=10)
+    store.put_many([key(i) for i in range(10)], [vector(i) for i in range(10)])
+    # Las tres primeras se usan ahora: pasan a ser las más recientes
+    store.get_many([key(i) for i in range(3)])
+    store.put_many([key(10)], [vector(10)])
+    assert len(store) == 9
+    kept = store.get_many([key(i) for i in range(11)])
+    assert all(kept[i] is not None for i in (0, 1, 2, 10))
+    assert sum(row is None for row in kept) == 2
+    for i, row in enumerate(kept):
+        if row is not None:
+            assert row.tolist() == vector(i)
+
+
+def test_order_of_rows_keeps_recency_across_restarts(tmp_path):
+    store = EmbeddingStore(str(tmp_path), max_entries=10)
+    store.put_many([key(i) for i in range(10)], [vector(i) for i in range(10)])
+    store.get_many([key(0)])
+    store.put_many([key(10)], [vector(10)])
+    # Un proceso nuevo no conoce los usos del anterior: compacta por orden de fila
+    restarted = EmbeddingStore(str(tmp_path), max_entries=10)
+    restarted.put_many([key(i) for i in range(11, 13)], [vector(i) for i in range(11, 13)])
+    assert restarted.get_many([key(0)])[0] is not None
+
+
+def test_other_instances_see_a_compaction(tmp_path):
+    reader = EmbeddingStore(str(tmp_path), max_entries=10)
+    writer = EmbeddingStore(str(tmp_path), max_entries=10)
+    writer.put_many([key(i) for i in range(10)], [vector(i) for i in range(10)])
+    assert reader.get_many([key(9)])[0].tolist() == vector(9)
+    writer.put_many([key(10)], [vector(10)])
+    for i, row in enumerate(reader.get_many([key(i) for i in range(11)])):
+        assert row is None or row.tolist() == vector(i)
+    assert len(reader) == len(writer)
+
+
+def test_concurrent_reader_never_sees_a_wrong_vector(tmp_path):
+    writer = EmbeddingStore(str(tmp_path), max_entries=50)
+    reader = EmbeddingStore(str(tmp_path), max_entries=50)
+    done = threading.Event()
+    wrong = []
+
+    def read():
+        while not done.is_set():
+            for i, row in enumerate(reader.get_many([key(i) for i in range(200)])):
+                if row is not None and row.tolist() != vector(i):
+                    wrong.append(i)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    try:
+        for start in range(0, 200, 5):
+            writer.put_many([key(i) for i in range(start, start + 5)], [vector(i) for i in range(start, start + 5)])
+    finally:
+        done.set()
+        thread.join()
+    assert wrong == []
+
+
+class CountingEmbeddings(Embeddings):
+    model = "counting"
+
+    def __init__(self) -> None:
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text))] * DIMENSION for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_cached_embeddings_only_embed_missing_texts(tmp_path):
+    model = CountingEmbeddings()
+    cached = CachedEmbeddings(model, directory=str(tmp_path))
+    assert cached.embed_documents(["a", "bb"]) == [[1.0] * DIMENSION, [2.0] * DIMENSION]
+    assert cached.embed_documents(["bb", "ccc", "a"]) == [[2.0] * DIMENSION, [3.0] * DIMENSION, [1.0] * DIMENSION]
+    assert model.texts == ["a", "bb", "ccc"]
+    assert (cached.hits, cached.misses) == (2, 3)
+
+
+def test_equivalent_texts_share_an_entry(tmp_path):
+    model = CountingEmbeddings()
+    cached = CachedEmbeddings(model, directory=str(tmp_path))
+    cached.embed_query("¿Qué es  Alvearium?")
+    cached.embed_query(" ¿Qué es Alvearium? ")
+    assert len(model.texts) == 1
+    assert normalize_text("á  b") == "á b"
+
+
+def test_models_do_not_share_entries():
+    assert cache_key("counting", "hola") != cache_key("otro-modelo", "hola")
@@ -0,0 +1,99 @@
+"""Pruebas del router de charla trivial: qué preguntas cortas se contestan con plantilla y cuáles van a la cadena.
+
+Uso (desde ChatBot):
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from intent_router import INTENTS, IntentRouter
+
+# Una dimensión por intención y una más para todo lo demás
+AXES = list(INTENTS) + ["other"]
+
+
+def axis(name: str) -> list:
+    vector = np.zeros(len(AXES), dtype=np.float32)
+    vector[AXES.index(name)] = 1.0
+    return vector.tolist()
+
+
+class FakeEmbeddings:
+    """Embeddings deterministas: cada ejemplo de una intención cae en su eje."""
+
+    def embed_documents(self, texts):
+        examples = {
+            example: intent for intent, languages in INTENTS.items() for examples in languages.values() for example in examples
+        }
+        return [axis(examples.get(text, "other")) for text in texts]
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(embedding_threshold=1)
+
+
+@pytest.fixture
+def embedding_router():
+    router = IntentRouter(embedding_threshold=0.9)
+    router.fit(FakeEmbeddings())
+    return router
+
+
+@pytest.mark.parametrize("question, intent, language", [
+    ("Hola", "greeting", "es"),
+    ("¡Buenos días, Alvy!", "greeting", "es"),
+    ("¿Quién eres?", "identity", "es"),
+    ("Hola, ¿cómo estás?", "how_are_you", "es"),
+    ("Muchas gracias", "thanks", "es"),
+    ("Adiós", "goodbye", "es"),
+    ("Hi there, who are you?", "identity", "en"),
+])
+def test_keywords_route_small_talk(router, question, intent, language):
+    routed = router.route(question)
+    assert routed is not None
+    assert (routed.intent, routed.language, routed.stage) == (intent, language, "keywords")
+
+
+@pytest.mark.parametrize("question", [
+    "¿Qué es Alvearium?",
+    "Hola, ¿qué es Alvearium?",
+    "¿Cuánto cuesta la entrada?",
+    "Gracias, ¿dónde está la colmena?",
+    "",
+])
+def test_keywords_leave_questions_to_the_chain(router, question):
+    assert router.route(question) is None
+
+
+def test_embedding_stage_off_by_default(router):
+    router.fit(FakeEmbeddings())
+    assert router.route_embedding("Hola, amiguete", axis("greeting")) is None
+    assert router.stats()["embedding_stage"] is False
+
+
+def test_embedding_stage_routes_small_talk_with_one_unknown_word(embedding_router):
+    assert embedding_router.route("Hola, amiguete") is None
+    routed = embedding_router.route_embedding("Hola, amiguete", axis("greeting"))
+    assert routed is not None
+    assert (routed.intent, routed.stage) == ("greeting", "embedding")
+
+
+@pytest.mark.parametrize("question", [
+    "¿Qué es Alvearium?",
+    "¿Quién fundó Alvearium?",
+    "Hola, ¿qué es Alvearium?",
+])
+def test_embedding_stage_skips_short_knowledge_questions(embedding_router, question):
+    # Aunque el embedding se parezca al de un saludo, sin vocabulario de charla no se usa la plantilla
+    assert embedding_router.route_embedding(question, axis("greeting")) is None
+
+
+def test_embedding_stage_needs_a_close_centroid(embedding_router):
+    assert embedding_router.route_embedding("Hola, amiguete", axis("other")) is None
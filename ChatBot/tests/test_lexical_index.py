@@ -0,0 +1,82 @@
+"""Pruebas del índice léxico BM25 (con tolerancia a errores) y de Reciprocal Rank Fusion."""
+import os
+import sys
+
+import pytest
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+CORPUS = [
+    ("colmena", "Alvearium es una colmena de innovación en Madrid."),
+    ("horario", "El horario de apertura es de lunes a viernes, de nueve a seis."),
+    ("africa", "Alvearium colabora con proyectos de emprendimiento en África."),
+    ("entrada", "La entrada es gratuita para los socios de la colmena."),
+]
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex.build(CORPUS)
+
+
+def ids(results):
+    return [doc_id for doc_id, _ in results]
+
+
+def test_tokenize_drops_accents_case_and_stopwords():
+    assert tokenize("¿Qué es ÁFRICA para el Alvearium?") == ["africa", "alvearium"]
+
+
+def test_exact_term_ranks_its_documents_first(index):
+    assert ids(index.search("horario de apertura"))[0] == "horario"
+    assert set(ids(index.search("colmena", k=2))) == {"colmena", "entrada"}
+
+
+def test_accents_do_not_matter(index):
+    assert ids(index.search("africa"))[0] == "africa"
+
+
+def test_typos_match_with_lower_weight(index):
+    exact = index.search("emprendimiento")
+    typo = index.search("emprendimeinto")
+    assert ids(typo)[0] == "africa"
+    assert typo[0][1] < exact[0][1]
+
+
+def test_short_terms_are_not_fuzzy_matched(index):
+    # "mad" (3 letras) no se expande a ningún término del vocabulario
+    assert index.search("mad") == []
+
+
+def test_k_limits_the_results(index):
+    assert len(index.search("alvearium colmena", k=1)) == 1
+
+
+def test_unknown_query_returns_nothing(index):
+    assert index.search("zzzz qqqq") == []
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = LexicalIndex.load(str(tmp_path))
+    for query in ["horario", "emprendimeinto", "colmena madrid"]:
+        assert loaded.search(query) == index.search(query)
+
+
+def document(text):
+    return Document(page_content=text)
+
+
+def test_rrf_rewards_documents_found_by_both_rankings():
+    a, b, c, d = (document(text) for text in "abcd")
+    fused = reciprocal_rank_fusion([[a, b, c], [c, d, a]], limit=4)
+    assert [doc.page_content for doc in fused[:2]] == ["a", "c"]
+    assert {doc.page_content for doc in fused} == {"a", "b", "c", "d"}
+
+
+def test_rrf_identifies_documents_by_content_and_respects_limit():
+    fused = reciprocal_rank_fusion([[document("x"), document("y")], [document("x")]], limit=1)
+    assert [doc.page_content for doc in fused] == ["x"]
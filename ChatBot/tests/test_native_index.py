@@ -0,0 +1,109 @@
+"""Pruebas del formato nativo del índice: escritura, carga, búsqueda y versiones publicadas."""
+import os
+import sys
+
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import native_index
+from ann_index import build_ann_index, update_vectors, with_ids
+from native_index import ChunkStore, convert, current_version_directory, load_native_index, write_native_index
+
+DIMENSION = 16
+
+
+class FixedEmbeddings(Embeddings):
+    """No se usa para buscar (las pruebas buscan por vector); solo lo exige FAISS."""
+
+    def embed_documents(self, texts):
+        return [[0.0] * DIMENSION for _ in texts]
+
+    def embed_query(self, text):
+        return [0.0] * DIMENSION
+
+
+def make_vectorstore(count: int = 120, index_type: str = "flat", **params):
+    """Vectorstore de la ingesta (índice con etiquetas) y sus vectores."""
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((count, DIMENSION)).astype(np.float32)
+    ids = [f"id-{i:04d}" for i in range(count)]
+    documents = [
+        Document(page_content=f"fragmento {i} con tildes: áéíóú ñ", metadata={"source": f"f{i % 3}.txt", "chunk": i // 3})
+        for i in range(count)
+    ]
+    index = build_ann_index(vectors, index_type, **params)
+    vectorstore = FAISS(FixedEmbeddings(), index, InMemoryDocstore(dict(zip(ids, documents))), dict(enumerate(ids)))
+    return vectorstore, vectors
+
+
+def search(vectorstore: FAISS, vector, k: int = 5):
+    return [(doc.page_content, doc.metadata) for doc in vectorstore.similarity_search_by_vector(vector.tolist(), k=k)]
+
+
+@pytest.mark.parametrize("index_type, params", [("flat", {}), ("ivf", {"nlist": 2}), ("hnsw", {"hnsw_m": 8})])
+def test_round_trip_returns_the_same_results(tmp_path, index_type, params):
+    source, vectors = make_vectorstore(index_type=index_type, **params)
+    directory = write_native_index(source, str(tmp_path))
+    loaded, loaded_directory = load_native_index(str(tmp_path), FixedEmbeddings())
+    assert loaded_directory == directory
+    assert loaded.index.ntotal == source.index.ntotal
+    for vector in vectors[:10]:
+        assert search(loaded, vector) == search(source, vector)
+
+
+def test_round_trip_after_removing_vectors(tmp_path):
+    source, vectors = make_vectorstore()
+    # Etiquetas no contiguas, como tras una actualización incremental
+    removed = [3, 50, 51]
+    source.index = update_vectors(with_ids(source.index), removed, np.empty((0, DIMENSION), dtype=np.float32), [])
+    for label in removed:
+        source.docstore.delete([source.index_to_docstore_id.pop(label)])
+    write_native_index(source, str(tmp_path))
+    loaded, _ = load_native_index(str(tmp_path), FixedEmbeddings())
+    assert loaded.index.ntotal == len(source.index_to_docstore_id)
+    assert sorted(loaded.index_to_docstore_id.values()) == sorted(source.index_to_docstore_id.values())
+    for vector in vectors[:10]:
+        assert search(loaded, vector) == search(source, vector)
+
+
+def test_chunk_store_lookups(tmp_path):
+    source, vectors = make_vectorstore(count=10)
+    store = ChunkStore(write_native_index(source, str(tmp_path)))
+    assert store.count == 10
+    for position in range(10):
+        doc_id = store.doc_id(position)
+        assert store.position(doc_id) == position
+        assert store.search(doc_id) == source.docstore.search(doc_id)
+    assert store.position("no-existe") is None
+    assert store.search("no-existe") == "ID no-existe not found."
+
+
+def test_publishing_switches_current_and_keeps_the_previous_version(tmp_path, monkeypatch):
+    versions = iter(["20240101-000000", "20240101-000001", "20240101-000002"])
+    monkeypatch.setattr(native_index.time, "strftime", lambda _: next(versions))
+    directories = [write_native_index(make_vectorstore(count=5)[0], str(tmp_path)) for _ in range(3)]
+    assert current_version_directory(str(tmp_path)) == directories[-1]
+    remaining = sorted(name for name in os.listdir(tmp_path) if os.path.isdir(tmp_path / name))
+    assert len(remaining) == native_index.KEEP_VERSIONS
+    assert os.path.basename(directories[0]) not in remaining
+
+
+def test_missing_version_is_reported(tmp_path):
+    assert current_version_directory(str(tmp_path)) is None
+    with pytest.raises(FileNotFoundError):
+        load_native_index(str(tmp_path), FixedEmbeddings())
+
+
+def test_convert_from_langchain_save_local(tmp_path):
+    source, vectors = make_vectorstore(count=20)
+    source.save_local(str(tmp_path / "faiss_index"))
+    convert(str(tmp_path / "faiss_index"), str(tmp_path / "faiss_native"))
+    loaded, _ = load_native_index(str(tmp_path / "faiss_native"), FixedEmbeddings())
+    for vector in vectors[:5]:
+        assert search(loaded, vector) == search(source, vector)
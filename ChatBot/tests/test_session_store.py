@@ -0,0 +1,84 @@
+"""Pruebas de los almacenes de sesiones en memoria y en SQLite: historial, límite de turnos y caducidad."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import session_store
+from session_store import InMemorySessionStore, SQLiteSessionStore, create_session_store, format_turn
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, clock):
+    return create_session_store(request.param, max_turns=3, idle_seconds=60, path=str(tmp_path / "sessions.sqlite3"))
+
+
+def test_empty_session(store):
+    assert store.history("nadie") == []
+    assert store.formatted_history("nadie") == ""
+
+
+def test_append_keeps_history_and_formatted_text(store):
+    store.append("a", "Hola", "¡Hola!")
+    store.append("a", "¿Qué es Alvearium?", "Una colmena.")
+    assert store.history("a") == [("Hola", "¡Hola!"), ("¿Qué es Alvearium?", "Una colmena.")]
+    assert store.formatted_history("a") == format_turn("Hola", "¡Hola!") + format_turn("¿Qué es Alvearium?", "Una colmena.")
+
+
+def test_sessions_are_isolated(store):
+    store.append("a", "pregunta a", "respuesta a")
+    store.append("b", "pregunta b", "respuesta b")
+    assert store.history("a") == [("pregunta a", "respuesta a")]
+    assert store.history("b") == [("pregunta b", "respuesta b")]
+
+
+def test_only_the_last_max_turns_are_kept(store):
+    turns = [(f"pregunta {i}", f"respuesta {i}") for i in range(5)]
+    for human, ai in turns:
+        store.append("a", human, ai)
+    assert store.history("a") == turns[-3:]
+    # El texto formateado incremental coincide con el de los turnos que quedan
+    assert store.formatted_history("a") == "".join(format_turn(*turn) for turn in turns[-3:])
+
+
+def test_idle_sessions_are_evicted(store, clock):
+    store.append("vieja", "hola", "hola")
+    clock[0] += 50
+    store.append("nueva", "hola", "hola")
+    clock[0] += 20
+    assert store.evict_idle() == 1
+    assert store.history("vieja") == []
+    assert store.history("nueva") == [("hola", "hola")]
+
+
+def test_reading_history_keeps_a_session_alive(store, clock):
+    store.append("a", "hola", "hola")
+    clock[0] += 50
+    store.history("a")
+    clock[0] += 20
+    assert store.evict_idle() == 0
+
+
+def test_sqlite_sessions_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    first = SQLiteSessionStore(path, max_turns=3, idle_seconds=60)
+    second = SQLiteSessionStore(path, max_turns=3, idle_seconds=60)
+    first.append("a", "hola", "¡hola!")
+    second.append("a", "gracias", "¡de nada!")
+    assert first.history("a") == [("hola", "¡hola!"), ("gracias", "¡de nada!")]
+    assert first.formatted_history("a") == second.formatted_history("a")
+
+
+def test_unknown_backend():
+    assert isinstance(create_session_store("memory", 3, 60), InMemorySessionStore)
+    with pytest.raises(ValueError):
+        create_session_store("redis", 3, 60)
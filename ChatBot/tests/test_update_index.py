@@ -0,0 +1,187 @@
+"""Pruebas de la actualización incremental del índice (data_preprocessor.update_index)."""
+import hashlib
+import json
+import os
+import sys
+import types
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+try:
+    import extract_apis_keys  # noqa: F401
+except FileNotFoundError:
+    # Sin ChatBot/.env: update_index recibe el modelo de embeddings y no necesita las claves
+    sys.modules["extract_apis_keys"] = types.SimpleNamespace(load=lambda: ("", "", ""))
+
+from data_preprocessor import MANIFEST_FILENAME, TextPreprocessor, number_chunks
+from native_index import current_version_directory, load_native_index
+
+DIMENSION = 16
+
+
+class HashEmbeddings(Embeddings):
+    """Vector pseudoaleatorio fijo por texto; cuenta los textos que se le piden."""
+
+    model = "hash"
+
+    def __init__(self) -> None:
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed(text)
+
+    @staticmethod
+    def embed(text):
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32).tolist()
+
+
+def paragraph(name: str, i: int) -> str:
+    return f"{name} párrafo {i}: " + " ".join(f"{name}{i}palabra{j}" for j in range(20))
+
+
+def text(name: str, count: int, start: int = 0) -> str:
+    return "\n\n".join(paragraph(name, i) for i in range(start, start + count))
+
+
+class Ingest:
+    """Ejecuta update_index sobre un corpus en memoria con directorios temporales."""
+
+    def __init__(self, tmp_path) -> None:
+        self.embeddings = HashEmbeddings()
+        self.preprocessor = TextPreprocessor(self.embeddings)
+        self.index_directory = str(tmp_path / "faiss_index")
+        self.native_directory = str(tmp_path / "faiss_native")
+
+    def sources(self, corpus):
+        splitter = self.preprocessor.charactersplit
+        for name, content in corpus.items():
+            yield name, hashlib.sha256(content.encode("utf-8")).hexdigest(), (
+                lambda content=content, name=name: number_chunks(splitter.create_documents([content], metadatas=[{"source": name}]))
+            )
+
+    def run(self, corpus, **kwargs):
+        self.embeddings.texts.clear()
+        return self.preprocessor.update_index(
+            self.sources(corpus), index_directory=self.index_directory, native_directory=self.native_directory, **kwargs
+        )
+
+    def vectorstore(self) -> FAISS:
+        return FAISS.load_local(self.index_directory, self.embeddings, allow_dangerous_deserialization=True)
+
+    def documents(self):
+        vectorstore = self.vectorstore()
+        return [vectorstore.docstore.search(doc_id) for doc_id in vectorstore.index_to_docstore_id.values()]
+
+
+@pytest.fixture
+def ingest(tmp_path):
+    return Ingest(tmp_path)
+
+
+def assert_consistent(ingest: Ingest, corpus) -> None:
+    """Índice, docstore y posiciones coinciden con los fragmentos actuales del corpus."""
+    vectorstore = ingest.vectorstore()
+    assert vectorstore.index.ntotal == len(vectorstore.index_to_docstore_id)
+    expected = sorted(doc.page_content for _, _, load in ingest.sources(corpus) for doc in load())
+    assert sorted(doc.page_content for doc in ingest.documents()) == expected
+    positions = {}
+    for doc in ingest.documents():
+        positions.setdefault(doc.metadata["source"], []).append(doc.metadata["chunk"])
+    for source, chunks in positions.items():
+        assert sorted(chunks) == list(range(len(chunks))), source
+    # Cada fragmento se encuentra buscando por su propio embedding
+    for doc in ingest.documents()[:5]:
+        found = vectorstore.similarity_search_by_vector(HashEmbeddings.embed(doc.page_content), k=1)[0]
+        assert found.page_content == doc.page_content
+
+
+def test_first_run_builds_and_publishes(ingest):
+    corpus = {"a.txt": text("a", 4), "b.txt": text("b", 3)}
+    report = ingest.run(corpus)
+    assert sorted(report["added_files"]) == ["a.txt", "b.txt"]
+    assert report["chunks_to_embed"] == 7 == len(ingest.embeddings.texts)
+    assert_consistent(ingest, corpus)
+    loaded, _ = load_native_index(ingest.native_directory, ingest.embeddings)
+    assert loaded.index.ntotal == 7
+    with open(os.path.join(ingest.index_directory, MANIFEST_FILENAME), encoding="utf-8") as f:
+        assert set(json.load(f)["files"]) == {"a.txt", "b.txt"}
+
+
+def test_unchanged_corpus_does_nothing(ingest):
+    corpus = {"a.txt": text("a", 4)}
+    ingest.run(corpus)
+    version = current_version_directory(ingest.native_directory)
+    report = ingest.run(corpus)
+    assert report["unchanged_files"] == 1 and report["chunks_to_embed"] == 0
+    assert ingest.embeddings.texts == []
+    assert current_version_directory(ingest.native_directory) == version
+
+
+def test_changes_embed_only_new_chunks(ingest):
+    ingest.run({"a.txt": text("a", 4), "b.txt": text("b", 3), "c.txt": text("c", 2)})
+    # a.txt gana un párrafo al principio, b.txt pierde uno y c.txt desaparece
+    corpus = {"a.txt": paragraph("a", 99) + "\n\n" + text("a", 4), "b.txt": text("b", 2)}
+    report = ingest.run(corpus)
+    assert sorted(report["changed_files"]) == ["a.txt", "b.txt"]
+    assert report["removed_files"] == ["c.txt"]
+    assert ingest.embeddings.texts == [paragraph("a", 99)]
+    assert report["chunks_to_delete"] == 1 + 2
+    assert_consistent(ingest, corpus)
+    loaded, _ = load_native_index(ingest.native_directory, ingest.embeddings)
+    assert loaded.index.ntotal == 5 + 2
+
+
+def test_dry_run_writes_nothing(ingest):
+    report = ingest.run({"a.txt": text("a", 3)}, dry_run=True)
+    assert report["chunks_to_embed"] == 3
+    assert ingest.embeddings.texts == []
+    assert not os.path.exists(ingest.index_directory) or not os.listdir(ingest.index_directory)
+    assert current_version_directory(ingest.native_directory) is None
+
+
+def test_ivf_is_updated_without_retraining(ingest):
+    corpus = {f"f{i}.txt": text(f"f{i}", 10) for i in range(8)}
+    ingest.run(corpus, index_type="ivf", index_params={"nlist": 2})
+    # El vectorstore tiene que seguir vivo mientras se usa el IVF extraído de su índice
+    before = ingest.vectorstore()
+    centroids = faiss.extract_index_ivf(before.index).quantizer.reconstruct_n(0, 2)
+    corpus["f0.txt"] = text("f0", 10, start=100)
+    report = ingest.run(corpus)
+    after = ingest.vectorstore()
+    assert np.array_equal(faiss.extract_index_ivf(after.index).quantizer.reconstruct_n(0, 2), centroids)
+    changed = [doc.page_content for name, _, load in ingest.sources(corpus) if name == "f0.txt" for doc in load()]
+    assert ingest.embeddings.texts == changed
+    assert report["chunks_to_delete"] == 10
+    assert_consistent(ingest, corpus)
+
+
+def test_config_change_rebuilds_from_all_chunks(ingest):
+    corpus = {f"f{i}.txt": text(f"f{i}", 10) for i in range(8)}
+    ingest.run(corpus)
+    ingest.run(corpus, index_type="hnsw", index_params={"hnsw_m": 8})
+    assert len(ingest.embeddings.texts) == 80
+    vectorstore = ingest.vectorstore()
+    assert isinstance(faiss.downcast_index(vectorstore.index.index), faiss.IndexHNSW)
+    assert_consistent(ingest, corpus)
+
+
+def test_full_rebuild_matches_incremental_result(ingest):
+    ingest.run({"a.txt": text("a", 4)})
+    corpus = {"a.txt": text("a", 2), "b.txt": text("b", 2)}
+    ingest.run(corpus)
+    incremental = sorted(doc.page_content for doc in ingest.documents())
+    ingest.run(corpus, full=True)
+    assert len(ingest.embeddings.texts) == 4
+    assert sorted(doc.page_content for doc in ingest.documents()) == incremental
+    assert_consistent(ingest, corpus)